@@ -0,0 +1,334 @@
+# Scaling benchmark for the dashboard. For each size a synthetic order file is
+# generated once (superstore_synthetic.py) and a fresh worker process times loading,
+# filtering, every section's aggregates, figure building and export against it, with
+# its own snapshot directory, and fresh dashboard processes time their startup. Results
+# go to a JSON file for tracking across versions.
+#   python superstore_benchmark.py --sizes 10k,1M,10M --output bench.json
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import statistics
+import subprocess
+from datetime import datetime
+
+DEFAULT_SIZES = "10k,1M"
+BENCH_DIR = ".superstore_bench"
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+# Widget labels of the dashboard sections and panels, as they appear in the script
+SECTIONS = {"📈 Trends": "trends", "📦 Products": "products", "👥 Customers": "customers", "🗺️ Geography": "geography"}
+PANELS = {
+    "🚚 Shipping Performance Analysis": "shipping",
+    "💰 Advanced Profitability Analysis": "profitability",
+    "🔍 Advanced Data Explorer": "explorer"
+}
+
+def summarize(seconds):
+    return {"seconds": seconds, "min": min(seconds), "median": statistics.median(seconds)}
+
+def section_aggregates(engine, selection):
+    # The aggregates each dashboard section computes, in the order it computes them
+    signature, rows, cube_view = selection["signature"], selection["rows"], selection["cube_view"]
+    daily = lambda: engine.daily_series(signature, cube_view)
+    return {
+        "kpis": lambda: engine.kpi_summary(selection),
+        "trends": lambda: [
+            engine.time_series_table(signature, daily(), granularity) for granularity in engine.TIME_GRANULARITIES
+        ] + [engine.weekday_summary(selection)],
+        "products": lambda: [
+            engine.cube_rollup_table(signature, cube_view, ("Category",)),
+            engine.cube_rollup_table(signature, cube_view, ("Category", "Sub-Category"))
+        ] + [
+            engine.table_ranking(signature, engine.product_table(signature, rows), "product", metric)
+            for metric in ["Sales", "Profit", "Quantity", "Order ID"]
+        ],
+        "customers": lambda: [
+            engine.segment_summary(selection),
+            engine.table_ranking(signature, engine.customer_table(signature, rows), "customer", "Sales")
+        ],
+        "geography": lambda: [
+            engine.geo_table(signature, rows),
+            engine.cube_rollup_table(signature, cube_view, ("Region",)),
+            engine.table_ranking(signature, engine.city_table(signature, rows), "city", "Sales")
+        ],
+        "shipping": lambda: [
+            engine.cube_rollup_table(signature, cube_view, ("Ship Mode",)),
+            engine.ship_performance_summary(selection)
+        ],
+        "profitability": lambda: [
+            engine.margin_distribution(selection),
+            engine.profitability_table(signature, rows)
+        ],
+        "explorer": lambda: [
+            engine.explorer_positions(signature, rows, None, False, "Customer Name", ""),
+            engine.explorer_positions(signature, rows, "Sales", True, "Customer Name", ""),
+            engine.describe_summary(selection),
+            engine.correlation_summary(selection)
+        ],
+        "distinct.exact": lambda: [
+            engine.kpi_summary(selection, exact=True),
+            engine.weekday_summary(selection, exact=True),
+            engine.segment_summary(selection, exact=True),
+            engine.ship_performance_summary(selection, exact=True)
+        ],
+        "statistics.exact": lambda: [
+            engine.describe_summary(selection, exact=True),
+            engine.correlation_summary(selection, exact=True)
+        ]
+    }
+
+def run_worker(size, repeat, render):
+    # Runs inside a fresh process whose environment points the engine at this size's
+    # data file and snapshot directory
+    import superstore_engine as engine
+
+    stages = {}
+
+    def timed(stage, func, setup=None, times=repeat):
+        seconds = []
+        result = None
+        for _ in range(times):
+            if setup is not None:
+                setup()
+            started = time.perf_counter()
+            result = func()
+            seconds.append(time.perf_counter() - started)
+        stages[stage] = summarize(seconds)
+        return result
+
+    def drop_snapshots():
+        shutil.rmtree(engine.SNAPSHOT_DIR, ignore_errors=True)
+
+    if engine.INGEST_MODE == "stream":
+        timed("load_stream_store.cold", engine.load_stream_store, setup=drop_snapshots)
+        timed("load_stream_store.warm", engine.load_stream_store)
+    else:
+        timed("load_data.cold", engine.load_data, setup=drop_snapshots)
+        timed("load_data.warm", engine.load_data)
+        timed("load_store.warm", engine.load_store)
+    view = timed("load.warm", engine.load)
+
+    # The default view, and a typical narrowed one: two regions over the middle half of the dates
+    first, last = view["cube"]["Order Date"].min(), view["cube"]["Order Date"].max()
+    filters = {
+        "default": {},
+        "filtered": {
+            "start_date": (first + (last - first) / 4).normalize(),
+            "end_date": (first + (last - first) * 3 / 4).normalize(),
+            "regions": ["West", "East"]
+        }
+    }
+    for name, options in filters.items():
+        selection = timed(f"filter.{name}", lambda: engine.select(view, **options))
+        stages[f"filter.{name}"]["rows"] = int(selection["rows"].count())
+        for section, func in section_aggregates(engine, selection).items():
+            timed(f"aggregates.{section}.{name}", func, setup=engine.clear_aggregate_caches)
+
+    selection = engine.select(view)
+    for export_format in engine.EXPORT_FORMATS:
+        payload = timed(
+            f"export.{export_format}",
+            lambda: engine.export_file(selection["signature"], selection["rows"], export_format),
+            setup=engine.clear_aggregate_caches
+        )
+        stages[f"export.{export_format}"]["bytes"] = len(payload)
+
+    if render:
+        run_startup(stages, repeat)
+        run_renders(timed)
+
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        peak_bytes = peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        peak_bytes = None
+    return {"stages": stages, "peak_rss_bytes": peak_bytes}
+
+STARTUP_SCRIPT = """
+import sys
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(sys.argv[1], default_timeout=3600)
+app.run()
+sys.exit(1 if app.exception else 0)
+"""
+
+def run_startup(stages, repeat):
+    # Cold starts: each run is a fresh process whose first script run writes the
+    # dashboard's startup report (imports, data load, first paint, first render) to
+    # its own timing log
+    import superstore_engine as engine
+
+    script = os.path.join(REPO_DIR, "superstore_dashboard.py")
+    log_path = os.path.join(engine.SNAPSHOT_DIR, "startup_timings.jsonl")
+    phases = {}
+    for _ in range(repeat):
+        if os.path.exists(log_path):
+            os.remove(log_path)
+        subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT, script], cwd=REPO_DIR, check=True, capture_output=True,
+            env={**os.environ, "SUPERSTORE_TIMING_LOG": log_path}
+        )
+        with open(log_path) as fh:
+            report = next(record for record in map(json.loads, fh) if record.get("section") == "Startup")
+        for phase in ["import", "load", "first_paint", "render"]:
+            phases.setdefault(phase, []).append(report[f"{phase}_ms"] / 1000)
+    for phase, seconds in phases.items():
+        stages[f"startup.{phase}"] = summarize(seconds)
+
+def run_renders(timed):
+    # Full script runs through Streamlit's test harness: the first run includes loading,
+    # a cold-cache run of every section prices aggregates plus figures, and warm reruns
+    # of one section at a time price figure building and serialization alone, then
+    # with the figures served from the figure cache (panel timings also include the
+    # last section, which stays selected)
+    from streamlit.testing.v1 import AppTest
+    import superstore_engine as engine
+
+    script = os.path.join(REPO_DIR, "superstore_dashboard.py")
+    app = AppTest.from_file(script, default_timeout=3600)
+
+    def run(app):
+        app.run()
+        if app.exception:
+            raise RuntimeError(f"dashboard raised: {[error.value for error in app.exception]}")
+        return app
+
+    timed("dashboard.first_run", lambda: run(app), times=1)
+    timed("dashboard.rerun", lambda: run(app))
+
+    app.toggle(key="lazy_sections").set_value(False)
+    def clear_caches():
+        engine.clear_aggregate_caches()
+        engine.clear_figure_cache()
+
+    timed("dashboard.all_sections.cold", lambda: run(app), setup=clear_caches)
+    timed("dashboard.all_sections.warm", lambda: run(app))
+
+    app.toggle(key="lazy_sections").set_value(True)
+    run(app)
+    for label, name in SECTIONS.items():
+        app.radio(key="selected_section").set_value(label)
+        run(app)
+        timed(f"figures.{name}", lambda: run(app), setup=engine.clear_figure_cache)
+        timed(f"figures.{name}.cached", lambda: run(app))
+    for label, name in PANELS.items():
+        app.toggle(key=f"panel_{label}").set_value(True)
+        run(app)
+        timed(f"figures.{name}", lambda: run(app), setup=engine.clear_figure_cache)
+        timed(f"figures.{name}.cached", lambda: run(app))
+        app.toggle(key=f"panel_{label}").set_value(False)
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def package_versions():
+    versions = {}
+    for package in ["numpy", "pandas", "pyarrow", "plotly", "streamlit"]:
+        try:
+            versions[package] = __import__(package).__version__
+        except ImportError:
+            versions[package] = None
+    return versions
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the Superstore dashboard at several data sizes.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated row counts, e.g. 10k,1M,10M,100M (default: %(default)s)")
+    parser.add_argument("--mode", choices=["memory", "stream"], default=os.environ.get("SUPERSTORE_INGEST", "memory"),
+                        help="Ingestion mode (default: %(default)s)")
+    parser.add_argument("--backend", choices=["pandas", "duckdb"], default=os.environ.get("SUPERSTORE_BACKEND", "pandas"),
+                        help="Query backend (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed repetitions per stage (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the generated data (default: %(default)s)")
+    parser.add_argument("--bench-dir", default=BENCH_DIR, help="Where generated data and snapshots go (default: %(default)s)")
+    parser.add_argument("--no-render", action="store_true", help="Skip the Streamlit runs (figures and full reruns)")
+    parser.add_argument("--output", default="superstore_benchmark.json", help="Results file (default: %(default)s)")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        # Results go to a file; the dashboard run may write to stdout
+        with open(args.output, "w") as fh:
+            json.dump(run_worker(args.worker, args.repeat, not args.no_render), fh)
+        return 0
+
+    from superstore_synthetic import generate, parse_size
+
+    bench_dir = os.path.abspath(args.bench_dir)
+    os.makedirs(bench_dir, exist_ok=True)
+    results = []
+    for size in [size.strip() for size in args.sizes.split(",") if size.strip()]:
+        rows = parse_size(size)
+        data_path = os.path.join(bench_dir, f"superstore_{rows}_{args.seed}.csv")
+        generated = None
+        if not os.path.exists(data_path):
+            print(f"Generating {rows:,} rows ...", file=sys.stderr)
+            started = time.perf_counter()
+            generated = generate(data_path, rows, seed=args.seed)
+            generated["seconds"] = time.perf_counter() - started
+
+        print(f"Benchmarking {rows:,} rows ({args.mode}, {args.backend}) ...", file=sys.stderr)
+        cache_dir = os.path.join(bench_dir, f"cache_{rows}_{args.seed}_{args.mode}")
+        env = {
+            **os.environ,
+            "SUPERSTORE_DATA": data_path,
+            "SUPERSTORE_CACHE_DIR": cache_dir,
+            "SUPERSTORE_INGEST": args.mode,
+            "SUPERSTORE_BACKEND": args.backend,
+            "SUPERSTORE_INCOMING_DIR": os.path.join(cache_dir, "incoming")
+        }
+        worker_output = os.path.join(bench_dir, f"worker_{rows}_{args.seed}_{args.mode}_{args.backend}.json")
+        command = [
+            sys.executable, os.path.abspath(__file__), "--worker", size, "--repeat", str(args.repeat),
+            "--output", worker_output
+        ]
+        if args.no_render:
+            command.append("--no-render")
+        completed = subprocess.run(command, cwd=REPO_DIR, env=env, capture_output=True, text=True)
+        if completed.returncode != 0:
+            sys.stderr.write(completed.stderr)
+            results.append({"size": size, "rows": rows, "error": completed.stderr.strip().splitlines()[-1:]})
+            continue
+        with open(worker_output) as fh:
+            worker = json.load(fh)
+        results.append({
+            "size": size,
+            "rows": rows,
+            "data_bytes": os.path.getsize(data_path),
+            "generated": generated,
+            "peak_rss_bytes": worker["peak_rss_bytes"],
+            "stages": worker["stages"]
+        })
+        for stage, timing in worker["stages"].items():
+            print(f"  {stage:<45} {timing['median'] * 1000:>12,.1f} ms", file=sys.stderr)
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "mode": args.mode,
+        "backend": args.backend,
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "packages": package_versions(),
+        "results": results
+    }
+    with open(args.output, "w") as fh:
+        json.dump(report, fh, indent=2)
+    print(f"Wrote {args.output}", file=sys.stderr)
+    return 0 if all("error" not in result for result in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,43 @@
+import time
+# Taken before anything heavy is imported, for the startup report
+SCRIPT_STARTED = time.perf_counter()
+import numpy as np
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 import streamlit as st
-import io
+import os
+import json
+import logging
+import importlib
+import tracemalloc
+import threading
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime
-import calendar
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from superstore_engine import (
+    INCOMING_DIR, INGEST_MODE, TIME_GRANULARITIES, EXPORT_FORMATS, EXPLORER_PAGE_SIZES, RANK_DEPTH, RANK_METRICS,
+    WEBGL_POINT_THRESHOLD, format_bytes, aggregate_cache_stats, memory_view, stream_view, select,
+    kpi_summary, daily_series, time_series_table, weekday_summary, cube_rollup_table, product_table,
+    segment_summary, customer_table, geo_table, city_table, ship_performance_summary, profitability_table,
+    table_ranking, margin_distribution, statistics_sketched, describe_summary, correlation_summary, export_file,
+    explorer_positions, downsample_series, thin_points, content_digest, cached_figure, figure_cache_stats
+)
+import superstore_engine
+
+# Plotly is imported when the first chart is drawn rather than with the script, so a
+# cold start has the header, sidebar and KPI cards on screen before paying for it
+class LazyModule:
+    def __init__(self, name):
+        self.name = name
+        self.module = None
+
+    def __getattr__(self, attr):
+        if self.module is None:
+            self.module = importlib.import_module(self.name)
+        return getattr(self.module, attr)
+
+px = LazyModule("plotly.express")
+go = LazyModule("plotly.graph_objects")
 
 # Page setup
 st.set_page_config(
@@ -13,6 +46,26 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Startup report. The first script run in a process is the one that pays for imports
+# and the data load; it records those, the time until the header, sidebar and KPI
+# cards have all been sent (first paint) and until the whole page has (first render).
+# The report goes to the timing log, and a first paint over
+# SUPERSTORE_STARTUP_BUDGET_MS is logged as a warning.
+STARTUP_BUDGET_MS = float(os.environ.get("SUPERSTORE_STARTUP_BUDGET_MS", 0)) or None
+
+@st.cache_resource
+def startup_report():
+    return {}
+
+startup = startup_report()
+startup_run = not startup
+
+def mark_startup(phase, started=SCRIPT_STARTED):
+    if startup_run:
+        startup[f"{phase}_ms"] = (time.perf_counter() - started) * 1000
+
+mark_startup("import")
+
 # CSS Styling
 st.markdown("""
     <style>
@@ -124,30 +177,189 @@ st.markdown("""
 
 st.markdown("<p style='text-align:center; color:gray; margin-top:10px;'>Advanced insights with interactive visualizations and predictive analytics</p>", unsafe_allow_html=True)
 st.markdown("---")
-# Load and process data
-@st.cache_data
-def load_data():
-    df = pd.read_csv("Sample - Superstore.csv", encoding="latin-1")
-    df['Order Date'] = pd.to_datetime(df['Order Date'])
-    df['Ship Date'] = pd.to_datetime(df['Ship Date'])
-    df['Order Month'] = df['Order Date'].dt.month
-    df['Order Year'] = df['Order Date'].dt.year
-    df['Order Day of Week'] = df['Order Date'].dt.dayofweek
-    df['Order Quarter'] = df['Order Date'].dt.quarter
-    df['Processing Time'] = (df['Ship Date'] - df['Order Date']).dt.days
-    df['Profit Margin'] = (df['Profit'] / df['Sales']) * 100
-    return df
-
-data = load_data()
+
+# Section instrumentation. With "Section timings" switched on in the sidebar, each
+# part of the page (data load, sidebar filters, KPI cards, every tab and panel)
+# records its wall time, split into data prep (time inside engine aggregates), chart
+# serialization and the rest (figure building and other page logic), along with its
+# peak Python allocation and the bytes it sends to the browser. Records are appended
+# to a JSON-lines log and kept in a rolling window per section for the session.
+# tracemalloc is process-wide, so it runs while any session that has run in the last
+# TRACING_IDLE_SECONDS has timings switched on, and peak allocations are only
+# meaningful while a single session is being profiled.
+TIMING_LOG_PATH = os.environ.get(
+    "SUPERSTORE_TIMING_LOG", os.path.join(superstore_engine.SNAPSHOT_DIR, "timings.jsonl")
+)
+TIMING_WINDOW = 50
+TRACING_IDLE_SECONDS = 600
+
+@st.cache_resource
+def tracing_sessions():
+    # When each session with timings on last ran. Switching them off drops the
+    # session's entry; a session that closes or times out just stops refreshing it,
+    # so the entry lapses instead of keeping tracing on for good
+    return {"lock": threading.Lock(), "seen": {}}
+
+instrumented = st.session_state.get("debug_timings", False)
+run_ctx = get_script_run_ctx()
+tracing = tracing_sessions()
+with tracing["lock"]:
+    now = time.monotonic()
+    seen = tracing["seen"]
+    session_id = None if run_ctx is None else run_ctx.session_id
+    if instrumented:
+        seen[session_id] = now
+    else:
+        seen.pop(session_id, None)
+    for lapsed in [session for session, last_run in seen.items() if now - last_run > TRACING_IDLE_SECONDS]:
+        del seen[lapsed]
+    if seen and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not seen and tracemalloc.is_tracing():
+        tracemalloc.stop()
+measuring = []
+
+@st.cache_resource
+def timing_logger():
+    logger = logging.getLogger("superstore.timings")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    try:
+        os.makedirs(os.path.dirname(TIMING_LOG_PATH) or ".", exist_ok=True)
+        handler = logging.FileHandler(TIMING_LOG_PATH)
+    except OSError:
+        handler = logging.NullHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    return logger
+
+@contextmanager
+def measure_section(name):
+    if not instrumented:
+        yield
+        return
+    record = {"section": name, "serialize_s": 0.0, "payload_bytes": 0, "figures": 0, "figure_cache_hits": 0}
+    aggregates = []
+    # Every message the section sends passes through the script context's enqueue
+    ctx = get_script_run_ctx()
+    if ctx is not None:
+        enqueue = ctx.enqueue
+
+        def counting_enqueue(msg):
+            record["payload_bytes"] += msg.ByteSize()
+            enqueue(msg)
+        ctx.enqueue = counting_enqueue
+    superstore_engine.AGGREGATE_TIMING.sink = aggregates
+    measuring.append(record)
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        measuring.pop()
+        superstore_engine.AGGREGATE_TIMING.sink = None
+        if ctx is not None:
+            del ctx.enqueue
+        prep = sum(seconds for _, seconds, _ in aggregates)
+        serialize = record.pop("serialize_s")
+        record.update(
+            wall_ms=wall * 1000,
+            prep_ms=prep * 1000,
+            build_ms=max(wall - prep - serialize, 0) * 1000,
+            serialize_ms=serialize * 1000,
+            peak_alloc_bytes=peak,
+            aggregates=len(aggregates),
+            aggregate_cache_hits=sum(hit for _, _, hit in aggregates)
+        )
+        st.session_state.setdefault("section_timings", {}).setdefault(
+            name, deque(maxlen=TIMING_WINDOW)
+        ).append(record)
+        timing_logger().info(json.dumps({
+            "time": datetime.now().isoformat(timespec="milliseconds"),
+            "session": ctx.session_id if ctx is not None else None,
+            "run": st.session_state.get("timing_run", 0),
+            **record
+        }))
+
+def show_chart(build, *inputs, **options):
+    # Draws build(*inputs, **options), a plotly.express function or a local builder,
+    # through the engine's figure cache. The key is the builder's code plus a digest of
+    # its arguments, so builders take everything the figure depends on as arguments
+    # instead of reading the enclosing function's variables.
+    code = build.__code__
+    if code.co_freevars:
+        raise ValueError(f"Chart builder {code.co_qualname} must take {', '.join(code.co_freevars)} as arguments")
+    consts = [const for const in code.co_consts if not hasattr(const, "co_code")]
+    key = content_digest(code.co_qualname, code.co_code, consts, *inputs, *sorted(options.items()))
+    spec, hit = cached_figure(key, lambda: build(*inputs, **options).to_json())
+    # The spec was validated when it was built, so it is loaded without validating again
+    fig = go.Figure(json.loads(spec), _validate=False)
+    # The time st.plotly_chart takes to serialize the figure is charged to the section
+    # being measured
+    started = time.perf_counter()
+    st.plotly_chart(fig, use_container_width=True)
+    if measuring:
+        measuring[-1]["serialize_s"] += time.perf_counter() - started
+        measuring[-1]["figures"] += 1
+        measuring[-1]["figure_cache_hits"] += hit
+
+def section_timing_table():
+    rows = []
+    for name, records in st.session_state.get("section_timings", {}).items():
+        wall = np.array([record["wall_ms"] for record in records])
+        last = records[-1]
+        rows.append({
+            "Section": name,
+            "Runs": len(records),
+            "Last (ms)": last["wall_ms"],
+            "p50 (ms)": np.percentile(wall, 50),
+            "p95 (ms)": np.percentile(wall, 95),
+            "Prep (ms)": last["prep_ms"],
+            "Build (ms)": last["build_ms"],
+            "Serialize (ms)": last["serialize_ms"],
+            "Cached figures": f"{last['figure_cache_hits']}/{last['figures']}",
+            "Peak alloc": format_bytes(last["peak_alloc_bytes"]),
+            "Payload": format_bytes(last["payload_bytes"])
+        })
+    return pd.DataFrame(rows).round(1)
+
+if instrumented:
+    st.session_state["timing_run"] = st.session_state.get("timing_run", 0) + 1
+
+# Load and process data. The engine does the work; these wrappers only keep its
+# results alive across reruns and sessions. Both are resources rather than cached
+# data, so every session reads the same objects instead of unpickling its own copy.
+@st.cache_resource
+def load_store():
+    return superstore_engine.load_store()
+
+@st.cache_resource
+def load_stream_store():
+    return superstore_engine.load_stream_store()
+
+load_started = time.perf_counter()
+with measure_section("Data load"):
+    if INGEST_MODE == "stream":
+        store = None
+        view = stream_view(load_stream_store())
+    else:
+        store = load_store()
+        superstore_engine.refresh_batches(store)
+        view = memory_view(store)
+    cube = view["cube"]
+mark_startup("load", load_started)
 
 # Sidebar with enhanced filters
-with st.sidebar:
+with st.sidebar, measure_section("Sidebar filters"):
     st.image("market-analysis.png", width=100)
     st.title("🔍 Data Filters")
     
     # Date range filter
-    min_date = data['Order Date'].min().date()
-    max_date = data['Order Date'].max().date()
+    min_date = cube['Order Date'].min().date()
+    max_date = cube['Order Date'].max().date()
     date_range = st.date_input(
         "Select Date Range",
         [min_date, max_date],
@@ -159,143 +371,189 @@ with st.sidebar:
     if len(date_range) == 2:
         start_date = pd.to_datetime(date_range[0])
         end_date = pd.to_datetime(date_range[1])
-        filtered_data = data[(data['Order Date'] >= start_date) & (data['Order Date'] <= end_date)]
     else:
-        filtered_data = data
+        start_date = end_date = None
     
     # Multi-select filters
     regions = st.multiselect(
         "Select Regions",
-        options=data['Region'].unique(),
-        default=data['Region'].unique()
+        options=cube['Region'].unique(),
+        default=cube['Region'].unique()
     )
     
     categories = st.multiselect(
         "Select Categories",
-        options=data['Category'].unique(),
-        default=data['Category'].unique()
+        options=cube['Category'].unique(),
+        default=cube['Category'].unique()
     )
     
     segments = st.multiselect(
         "Select Customer Segments",
-        options=data['Segment'].unique(),
-        default=data['Segment'].unique()
+        options=cube['Segment'].unique(),
+        default=cube['Segment'].unique()
     )
     
     # Apply filters
-    filtered_data = filtered_data[
-        (filtered_data['Region'].isin(regions)) &
-        (filtered_data['Category'].isin(categories)) &
-        (filtered_data['Segment'].isin(segments))
-    ]
+    selection = select(view, start_date, end_date, regions, categories, segments)
+    rows, cube_view, signature = selection["rows"], selection["cube_view"], selection["signature"]
     
     # Add download button
     st.markdown("---")
     st.markdown("### 📤 Export Data")
-    csv = filtered_data.to_csv(index=False).encode('utf-8')
+    export_format = st.selectbox("Export format", list(EXPORT_FORMATS), key="export_format")
+    extension, mime = EXPORT_FORMATS[export_format]
     st.download_button(
         label="Download Filtered Data",
-        data=csv,
-        file_name=f"superstore_data_{datetime.now().strftime('%Y%m%d')}.csv",
-        mime='text/csv'
+        data=lambda: export_file(signature, rows, export_format),
+        file_name=f"superstore_data_{datetime.now().strftime('%Y%m%d')}.{extension}",
+        mime=mime,
+        on_click="ignore"
     )
 
-# Enhanced KPI cards
-st.markdown("<div class='section-header'>📊 Performance Overview</div>", unsafe_allow_html=True)
-kpi1, kpi2, kpi3, kpi4 = st.columns(4)
-# Add CSS styling at the beginning of your script
-st.markdown("""
-<style>
-.hover-card {
-    width: 220px;          /* Fixed width */
-    height: 140px;         /* Fixed height */
-    padding: 20px;
-    border-radius: 12px;
-    box-shadow: 0 4px 8px rgba(0,0,0,0.1);
-    transition: all 0.3s ease;
-    background: linear-gradient(135deg, #f5f7fa 0%, #e4e8eb 100%);
-    display: flex;
-    flex-direction: column;
-    justify-content: center;
-    align-items: center;
-    margin: 10px;
-    border: 1px solid #e0e0e0;
-}
-.hover-card:hover {
-    background: linear-gradient(135deg, #e3f2fd 0%, #bbdefb 100%);
-    transform: translateY(-3px);
-    box-shadow: 0 6px 12px rgba(0,0,0,0.15);
-}
-.metric-label {
-    font-size: 16px;
-    color: #555;
-    margin-bottom: 8px;
-    text-align: center;
-    font-weight: 500;
-}
-.metric {
-    font-size: 28px;
-    font-weight: 700;
-    color: #2c3e50;
-    text-align: center;
-    margin: 0;
-}
-.metric-positive {
-    color: #27ae60;
-}
-.metric-negative {
-    color: #e74c3c;
-}
-</style>
-""", unsafe_allow_html=True)
+    memory = store["memory"] if store is not None else {}
+    if memory.get("before"):
+        st.caption(
+            f"Dataset in memory: {format_bytes(memory['after'])} "
+            f"(down from {format_bytes(memory['before'])}, "
+            f"{memory['before'] / memory['after']:.1f}x smaller with the compact schema)"
+        )
+    if store is not None and store["batches"]:
+        st.caption(
+            f"{len(store['batches'])} order batches appended from `{INCOMING_DIR}` "
+            f"({sum(entry['rows'] for entry in store['batches']):,} new rows)"
+        )
+    if view["backend"] == "duckdb":
+        st.caption("Filters and grouped tables run as SQL in DuckDB")
 
-# KPI 1 - Total Sales (Blue-themed)
-with kpi1:
+    st.markdown("---")
+    lazy_sections = st.toggle(
+        "⚡ Lazy section rendering",
+        value=True,
+        key="lazy_sections",
+        help="Only prepare and draw the section you are viewing and the panels you have switched on."
+    )
+    exact_distinct = st.toggle(
+        "🔢 Exact distinct counts",
+        value=False,
+        key="exact_distinct",
+        help="Count orders and customers from the rows instead of merging sketches, which are within about 5% on large data."
+    )
+
+    with st.expander("⚙️ Aggregate Cache"):
+        cache_stats_placeholder = st.empty()
+        figure_cache_placeholder = st.empty()
+
+    st.toggle(
+        "🩺 Section timings",
+        key="debug_timings",
+        help="Time every section of the page (data prep, figures, serialization), with memory and payload size."
+    )
+    if instrumented:
+        with st.expander("🩺 Section Timings", expanded=True):
+            timings_placeholder = st.empty()
+            startup_placeholder = st.empty()
+            st.caption(f"Last run split by stage; p50/p95 over the last {TIMING_WINDOW} runs. Log: `{TIMING_LOG_PATH}`")
+
+# Enhanced KPI cards
+with measure_section("KPI cards"):
+    st.markdown("<div class='section-header'>📊 Performance Overview</div>", unsafe_allow_html=True)
+    kpi1, kpi2, kpi3, kpi4 = st.columns(4)
+    kpis = kpi_summary(selection, exact_distinct)
+    # Add CSS styling at the beginning of your script
     st.markdown("""
-    <div class="hover-card" style="background: linear-gradient(135deg, #e3f2fd 0%, #bbdefb 100%);">
-        <p class="metric-label">Total Sales</p>
-        <p class="metric">${:,.0f}</p>
-    </div>
-    """.format(filtered_data["Sales"].sum()), unsafe_allow_html=True)
-
-# KPI 2 - Total Profit (Green/Red based on value)
-with kpi2:
-    profit = filtered_data["Profit"].sum()
-    profit_class = "metric-positive" if profit >= 0 else "metric-negative"
-    card_color = "background: linear-gradient(135deg, #e8f5e9 0%, #c8e6c9 100%);" if profit >=0 else "background: linear-gradient(135deg, #ffebee 0%, #ffcdd2 100%);"
-    
-    st.markdown(f"""
-    <div class="hover-card" style="{card_color}">
-        <p class="metric-label">Total Profit</p>
-        <p class="metric {profit_class}">${profit:,.0f}</p>
-    </div>
+    <style>
+    .hover-card {
+        width: 220px;          /* Fixed width */
+        height: 140px;         /* Fixed height */
+        padding: 20px;
+        border-radius: 12px;
+        box-shadow: 0 4px 8px rgba(0,0,0,0.1);
+        transition: all 0.3s ease;
+        background: linear-gradient(135deg, #f5f7fa 0%, #e4e8eb 100%);
+        display: flex;
+        flex-direction: column;
+        justify-content: center;
+        align-items: center;
+        margin: 10px;
+        border: 1px solid #e0e0e0;
+    }
+    .hover-card:hover {
+        background: linear-gradient(135deg, #e3f2fd 0%, #bbdefb 100%);
+        transform: translateY(-3px);
+        box-shadow: 0 6px 12px rgba(0,0,0,0.15);
+    }
+    .metric-label {
+        font-size: 16px;
+        color: #555;
+        margin-bottom: 8px;
+        text-align: center;
+        font-weight: 500;
+    }
+    .metric {
+        font-size: 28px;
+        font-weight: 700;
+        color: #2c3e50;
+        text-align: center;
+        margin: 0;
+    }
+    .metric-positive {
+        color: #27ae60;
+    }
+    .metric-negative {
+        color: #e74c3c;
+    }
+    </style>
     """, unsafe_allow_html=True)
 
-# KPI 3 - Total Orders (Purple-themed)
-with kpi3:
-    st.markdown("""
-    <div class="hover-card" style="background: linear-gradient(135deg, #f3e5f5 0%, #e1bee7 100%);">
-        <p class="metric-label">Total Orders</p>
-        <p class="metric">{:,}</p>
-    </div>
-    """.format(filtered_data["Order ID"].nunique()), unsafe_allow_html=True)
+    # KPI 1 - Total Sales (Blue-themed)
+    with kpi1:
+        st.markdown("""
+        <div class="hover-card" style="background: linear-gradient(135deg, #e3f2fd 0%, #bbdefb 100%);">
+            <p class="metric-label">Total Sales</p>
+            <p class="metric">${:,.0f}</p>
+        </div>
+        """.format(kpis["Total Sales"]), unsafe_allow_html=True)
 
-# KPI 4 - Avg. Profit Margin (Teal-themed)
-with kpi4:
-    avg_profit_margin = filtered_data["Profit Margin"].mean()
-    margin_class = "metric-positive" if avg_profit_margin >= 0 else "metric-negative"
-    
-    st.markdown(f"""
-    <div class="hover-card" style="background: linear-gradient(135deg, #e0f7fa 0%, #b2ebf2 100%);">
-        <p class="metric-label">Avg. Profit Margin</p>
-        <p class="metric {margin_class}">{avg_profit_margin:.1f}%</p>
-    </div>
-    """, unsafe_allow_html=True)
+    # KPI 2 - Total Profit (Green/Red based on value)
+    with kpi2:
+        profit = kpis["Total Profit"]
+        profit_class = "metric-positive" if profit >= 0 else "metric-negative"
+        card_color = "background: linear-gradient(135deg, #e8f5e9 0%, #c8e6c9 100%);" if profit >=0 else "background: linear-gradient(135deg, #ffebee 0%, #ffcdd2 100%);"
+    
+        st.markdown(f"""
+        <div class="hover-card" style="{card_color}">
+            <p class="metric-label">Total Profit</p>
+            <p class="metric {profit_class}">${profit:,.0f}</p>
+        </div>
+        """, unsafe_allow_html=True)
 
-# Tabs for different sections
-tab1, tab2, tab3, tab4 = st.tabs(["📈 Trends", "📦 Products", "👥 Customers", "🗺️ Geography"])
+    # KPI 3 - Total Orders (Purple-themed)
+    with kpi3:
+        st.markdown("""
+        <div class="hover-card" style="background: linear-gradient(135deg, #f3e5f5 0%, #e1bee7 100%);">
+            <p class="metric-label">Total Orders</p>
+            <p class="metric">{:,}</p>
+        </div>
+        """.format(kpis["Total Orders"]), unsafe_allow_html=True)
 
-with tab1:
+    # KPI 4 - Avg. Profit Margin (Teal-themed)
+    with kpi4:
+        avg_profit_margin = kpis["Avg. Profit Margin"]
+        margin_class = "metric-positive" if avg_profit_margin >= 0 else "metric-negative"
+    
+        st.markdown(f"""
+        <div class="hover-card" style="background: linear-gradient(135deg, #e0f7fa 0%, #b2ebf2 100%);">
+            <p class="metric-label">Avg. Profit Margin</p>
+            <p class="metric {margin_class}">{avg_profit_margin:.1f}%</p>
+        </div>
+        """, unsafe_allow_html=True)
+mark_startup("first_paint")
+
+# Each section renders from a function of the selection and the sidebar toggles, so
+# that in lazy mode only the section being viewed prepares its data and builds its
+# figures
+def render_trends(selection, exact_distinct):
+    cube_view, signature = selection["cube_view"], selection["signature"]
     st.markdown('<div class="tab-content">', unsafe_allow_html=True)
     
     # Time series analysis
@@ -304,98 +562,91 @@ with tab1:
     # Granularity selector
     time_granularity = st.radio(
         "Select Time Granularity",
-        ["Daily", "Weekly", "Monthly", "Quarterly"],
+        list(TIME_GRANULARITIES),
         horizontal=True
     )
     
     # Prepare time series data based on granularity
-    if time_granularity == "Daily":
-        ts_data = filtered_data.groupby("Order Date").agg({"Sales": "sum", "Profit": "sum"}).reset_index()
-        x_col = "Order Date"
-    elif time_granularity == "Weekly":
-        ts_data = filtered_data.copy()
-        ts_data["Week"] = ts_data["Order Date"].dt.to_period("W").dt.start_time
-        ts_data = ts_data.groupby("Week").agg({"Sales": "sum", "Profit": "sum"}).reset_index()
-        x_col = "Week"
-    elif time_granularity == "Monthly":
-        ts_data = filtered_data.copy()
-        ts_data["Month"] = ts_data["Order Date"].dt.to_period("M").dt.start_time
-        ts_data = ts_data.groupby("Month").agg({"Sales": "sum", "Profit": "sum"}).reset_index()
-        x_col = "Month"
-    else:  # Quarterly
-        ts_data = filtered_data.copy()
-        ts_data["Quarter"] = ts_data["Order Date"].dt.to_period("Q").dt.start_time
-        ts_data = ts_data.groupby("Quarter").agg({"Sales": "sum", "Profit": "sum"}).reset_index()
-        x_col = "Quarter"
+    ts_data = time_series_table(signature, daily_series(signature, cube_view), time_granularity)
+    x_col = TIME_GRANULARITIES[time_granularity][1]
     
-    # Create dual-axis chart
-    fig = go.Figure()
+    # Long series are downsampled per trace and drawn with WebGL
+    sales_points = downsample_series(ts_data, x_col, "Sales")
+    profit_points = downsample_series(ts_data, x_col, "Profit")
     
-    # Add Sales trace
-    fig.add_trace(
-        go.Scatter(
-            x=ts_data[x_col],
-            y=ts_data["Sales"],
-            name="Sales",
-            line=dict(color="#4e73df", width=2),
-            yaxis="y1"
+    # Create dual-axis chart
+    def trend_chart(sales_points, profit_points, x_col, time_granularity, webgl):
+        trace_type = go.Scattergl if webgl else go.Scatter
+        fig = go.Figure()
+        
+        # Add Sales trace
+        fig.add_trace(
+            trace_type(
+                x=sales_points[x_col],
+                y=sales_points["Sales"],
+                name="Sales",
+                line=dict(color="#4e73df", width=2),
+                yaxis="y1"
+            )
         )
-    )
-    
-    # Add Profit trace
-    fig.add_trace(
-        go.Scatter(
-            x=ts_data[x_col],
-            y=ts_data["Profit"],
-            name="Profit",
-            line=dict(color="#1cc88a", width=2),
-            yaxis="y2"
+        
+        # Add Profit trace
+        fig.add_trace(
+            trace_type(
+                x=profit_points[x_col],
+                y=profit_points["Profit"],
+                name="Profit",
+                line=dict(color="#1cc88a", width=2),
+                yaxis="y2"
+            )
         )
-    )
-    
-    # Update layout for dual y-axes
-    fig.update_layout(
-        title=f"Sales & Profit Trend ({time_granularity})",
-        xaxis_title="Date",
-        yaxis=dict(
-            title="Sales ($)",
-            title_font=dict(color="#4e73df"),
-            tickfont=dict(color="#4e73df")
-        ),
-        yaxis2=dict(
-            title="Profit ($)",
-            title_font=dict(color="#1cc88a"),
-            tickfont=dict(color="#1cc88a"),
-            anchor="x",
-            overlaying="y",
-            side="right"
-        ),
-        hovermode="x unified",
-        legend=dict(
-            orientation="h",
-            yanchor="bottom",
-            y=1.02,
-            xanchor="right",
-            x=1
-        ),
-        height=400
-    )
+        
+        # Update layout for dual y-axes
+        fig.update_layout(
+            title=f"Sales & Profit Trend ({time_granularity})",
+            xaxis_title="Date",
+            yaxis=dict(
+                title="Sales ($)",
+                title_font=dict(color="#4e73df"),
+                tickfont=dict(color="#4e73df")
+            ),
+            yaxis2=dict(
+                title="Profit ($)",
+                title_font=dict(color="#1cc88a"),
+                tickfont=dict(color="#1cc88a"),
+                anchor="x",
+                overlaying="y",
+                side="right"
+            ),
+            hovermode="x unified",
+            legend=dict(
+                orientation="h",
+                yanchor="bottom",
+                y=1.02,
+                xanchor="right",
+                x=1
+            ),
+            height=400
+        )
+        return fig
     
-    st.plotly_chart(fig, use_container_width=True)
+    show_chart(trend_chart, sales_points, profit_points, x_col, time_granularity, len(ts_data) > WEBGL_POINT_THRESHOLD)
+    if len(sales_points) < len(ts_data):
+        st.caption(
+            f"Showing {len(sales_points):,} of {len(ts_data):,} points per series "
+            "(downsampled, peaks and troughs preserved)"
+        )
     
     # Weekday analysis
     st.markdown("<div class='section-header'>📅 Day of Week Analysis</div>", unsafe_allow_html=True)
     
-    weekday_data = filtered_data.copy()
-    weekday_data["Day of Week"] = weekday_data["Order Date"].dt.day_name()
-    weekday_order = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-    weekday_data["Day of Week"] = pd.Categorical(weekday_data["Day of Week"], categories=weekday_order, ordered=True)
-    weekday_data = weekday_data.groupby("Day of Week").agg({"Sales": "sum", "Profit": "sum", "Order ID": "nunique"}).reset_index()
+    weekday_data = weekday_summary(selection, exact_distinct)
     
     col1, col2 = st.columns(2)
     
     with col1:
-        fig = px.bar(
+        show_chart(
+            px.bar,
             weekday_data,
             x="Day of Week",
             y="Sales",
@@ -403,10 +654,10 @@ with tab1:
             color="Sales",
             color_continuous_scale="Blues"
         )
-        st.plotly_chart(fig, use_container_width=True)
     
     with col2:
-        fig = px.bar(
+        show_chart(
+            px.bar,
             weekday_data,
             x="Day of Week",
             y="Profit",
@@ -414,11 +665,11 @@ with tab1:
             color="Profit",
             color_continuous_scale="Greens"
         )
-        st.plotly_chart(fig, use_container_width=True)
     
     st.markdown('</div>', unsafe_allow_html=True)
 
-with tab2:
+def render_products(selection, exact_distinct):
+    rows, cube_view, signature = selection["rows"], selection["cube_view"], selection["signature"]
     st.markdown('<div class="tab-content">', unsafe_allow_html=True)
     
     # Product category analysis
@@ -427,39 +678,43 @@ with tab2:
     col1, col2 = st.columns(2)
     
     with col1:
-        sales_cat = filtered_data.groupby("Category")["Sales"].sum().reset_index()
-        fig = px.pie(
-            sales_cat,
-            names="Category",
-            values="Sales",
-            title="Sales Distribution by Category",
-            hole=0.4,
-            color_discrete_sequence=px.colors.qualitative.Pastel
-        )
-        fig.update_traces(textposition='inside', textinfo='percent+label')
-        st.plotly_chart(fig, use_container_width=True)
+        sales_cat = cube_rollup_table(signature, cube_view, ("Category",))
+        
+        def sales_pie(sales_cat):
+            fig = px.pie(
+                sales_cat,
+                names="Category",
+                values="Sales",
+                title="Sales Distribution by Category",
+                hole=0.4,
+                color_discrete_sequence=px.colors.qualitative.Pastel
+            )
+            fig.update_traces(textposition='inside', textinfo='percent+label')
+            return fig
+        
+        show_chart(sales_pie, sales_cat)
     
     with col2:
-        profit_cat = filtered_data.groupby("Category")["Profit"].sum().reset_index()
-        fig = px.pie(
-            profit_cat,
-            names="Category",
-            values="Profit",
-            title="Profit Distribution by Category",
-            hole=0.4,
-            color_discrete_sequence=px.colors.qualitative.Pastel
-        )
-        fig.update_traces(textposition='inside', textinfo='percent+label')
-        st.plotly_chart(fig, use_container_width=True)
+        profit_cat = cube_rollup_table(signature, cube_view, ("Category",))
+        
+        def profit_pie(profit_cat):
+            fig = px.pie(
+                profit_cat,
+                names="Category",
+                values="Profit",
+                title="Profit Distribution by Category",
+                hole=0.4,
+                color_discrete_sequence=px.colors.qualitative.Pastel
+            )
+            fig.update_traces(textposition='inside', textinfo='percent+label')
+            return fig
+        
+        show_chart(profit_pie, profit_cat)
     
     # Sub-category analysis with treemap
     st.markdown("<div class='section-header'>📚 Sub-Category Performance</div>", unsafe_allow_html=True)
     
-    treemap_data = filtered_data.groupby(["Category", "Sub-Category"]).agg({
-        "Sales": "sum",
-        "Profit": "sum",
-        "Profit Margin": "mean"
-    }).reset_index()
+    treemap_data = cube_rollup_table(signature, cube_view, ("Category", "Sub-Category"))
     
     view_option = st.radio(
         "View Sub-Categories by:",
@@ -468,7 +723,8 @@ with tab2:
     )
     
     if view_option == "Sales":
-        fig = px.treemap(
+        show_chart(
+            px.treemap,
             treemap_data,
             path=["Category", "Sub-Category"],
             values="Sales",
@@ -477,7 +733,8 @@ with tab2:
             title="Sub-Category Sales (Size: Sales, Color: Sales)"
         )
     elif view_option == "Profit":
-        fig = px.treemap(
+        show_chart(
+            px.treemap,
             treemap_data,
             path=["Category", "Sub-Category"],
             values="Sales",
@@ -486,7 +743,8 @@ with tab2:
             title="Sub-Category Performance (Size: Sales, Color: Profit)"
         )
     else:
-        fig = px.treemap(
+        show_chart(
+            px.treemap,
             treemap_data,
             path=["Category", "Sub-Category"],
             values="Sales",
@@ -495,71 +753,67 @@ with tab2:
             title="Sub-Category Performance (Size: Sales, Color: Profit Margin)"
         )
     
-    st.plotly_chart(fig, use_container_width=True)
-    
     # Top/Bottom products
     st.markdown("<div class='section-header'>🏆 Top/Bottom Performing Products</div>", unsafe_allow_html=True)
     
-    product_data = filtered_data.groupby("Product Name").agg({
-        "Sales": "sum",
-        "Profit": "sum",
-        "Quantity": "sum",
-        "Order ID": "nunique"
-    }).reset_index()
+    product_data = product_table(signature, rows)
     
     top_bottom_col1, top_bottom_col2 = st.columns(2)
     
     with top_bottom_col1:
-        num_products = st.slider("Number of products to show:", 5, 20, 10)
-        sort_by = st.selectbox("Sort products by:", ["Sales", "Profit", "Quantity", "Order ID"])
+        num_products = st.slider("Number of products to show:", 5, RANK_DEPTH, 10)
+        sort_by = st.selectbox("Sort products by:", RANK_METRICS["product"])
         
-        top_products = product_data.sort_values(by=sort_by, ascending=False).head(num_products)
-        fig = px.bar(
-            top_products,
-            x="Product Name",
-            y=sort_by,
-            title=f"Top {num_products} Products by {sort_by}",
-            color=sort_by,
-            color_continuous_scale="Teal"
-        )
-        fig.update_layout(xaxis_title="Product", yaxis_title=sort_by, xaxis_tickangle=-45)
-        st.plotly_chart(fig, use_container_width=True)
+        top_rows, bottom_rows = table_ranking(signature, product_data, "product", sort_by)
+        top_products = product_data.iloc[top_rows[:num_products]]
+        
+        def top_products_chart(top_products, sort_by, num_products):
+            fig = px.bar(
+                top_products,
+                x="Product Name",
+                y=sort_by,
+                title=f"Top {num_products} Products by {sort_by}",
+                color=sort_by,
+                color_continuous_scale="Teal"
+            )
+            fig.update_layout(xaxis_title="Product", yaxis_title=sort_by, xaxis_tickangle=-45)
+            return fig
+        
+        show_chart(top_products_chart, top_products, sort_by, num_products)
     
     with top_bottom_col2:
-        bottom_products = product_data.sort_values(by=sort_by, ascending=True).head(num_products)
-        fig = px.bar(
-            bottom_products,
-            x="Product Name",
-            y=sort_by,
-            title=f"Bottom {num_products} Products by {sort_by}",
-            color=sort_by,
-            color_continuous_scale="Peach"
-        )
-        fig.update_layout(xaxis_title="Product", yaxis_title=sort_by, xaxis_tickangle=-45)
-        st.plotly_chart(fig, use_container_width=True)
+        bottom_products = product_data.iloc[bottom_rows[:num_products]]
+        
+        def bottom_products_chart(bottom_products, sort_by, num_products):
+            fig = px.bar(
+                bottom_products,
+                x="Product Name",
+                y=sort_by,
+                title=f"Bottom {num_products} Products by {sort_by}",
+                color=sort_by,
+                color_continuous_scale="Peach"
+            )
+            fig.update_layout(xaxis_title="Product", yaxis_title=sort_by, xaxis_tickangle=-45)
+            return fig
+        
+        show_chart(bottom_products_chart, bottom_products, sort_by, num_products)
     
     st.markdown('</div>', unsafe_allow_html=True)
 
-with tab3:
+def render_customers(selection, exact_distinct):
+    rows, signature = selection["rows"], selection["signature"]
     st.markdown('<div class="tab-content">', unsafe_allow_html=True)
     
     # Customer segment analysis
     st.markdown("<div class='section-header'>👥 Customer Segment Analysis</div>", unsafe_allow_html=True)
     
-    seg_data = filtered_data.groupby("Segment").agg({
-        "Sales": "sum",
-        "Profit": "sum",
-        "Customer ID": "nunique",
-        "Order ID": "nunique"
-    }).reset_index()
-    
-    seg_data["Avg. Order Value"] = seg_data["Sales"] / seg_data["Order ID"]
-    seg_data["Profit per Customer"] = seg_data["Profit"] / seg_data["Customer ID"]
+    seg_data = segment_summary(selection, exact_distinct)
     
     col1, col2 = st.columns(2)
     
     with col1:
-        fig = px.bar(
+        show_chart(
+            px.bar,
             seg_data,
             x="Segment",
             y=["Sales", "Profit"],
@@ -567,10 +821,10 @@ with tab3:
             title="Sales & Profit by Segment",
             color_discrete_sequence=["#4e73df", "#1cc88a"]
         )
-        st.plotly_chart(fig, use_container_width=True)
     
     with col2:
-        fig = px.bar(
+        show_chart(
+            px.bar,
             seg_data,
             x="Segment",
             y="Avg. Order Value",
@@ -578,57 +832,50 @@ with tab3:
             color="Avg. Order Value",
             color_continuous_scale="Purples"
         )
-        st.plotly_chart(fig, use_container_width=True)
     
     # Customer ranking
     st.markdown("<div class='section-header'>🏅 Top Customers</div>", unsafe_allow_html=True)
     
-    customer_data = filtered_data.groupby(["Customer ID", "Customer Name"]).agg({
-        "Sales": "sum",
-        "Profit": "sum",
-        "Order ID": "nunique",
-        "Profit Margin": "mean"
-    }).reset_index()
-    
-    customer_data["Avg. Order Value"] = customer_data["Sales"] / customer_data["Order ID"]
+    customer_data = customer_table(signature, rows)
     
-    num_customers = st.slider("Number of customers to show:", 5, 20, 10, key="customer_slider")
-    sort_customers_by = st.selectbox("Sort customers by:", ["Sales", "Profit", "Order ID", "Avg. Order Value"])
+    num_customers = st.slider("Number of customers to show:", 5, RANK_DEPTH, 10, key="customer_slider")
+    sort_customers_by = st.selectbox("Sort customers by:", RANK_METRICS["customer"])
     
-    top_customers = customer_data.sort_values(by=sort_customers_by, ascending=False).head(num_customers)
+    top_rows, _ = table_ranking(signature, customer_data, "customer", sort_customers_by)
+    top_customers = customer_data.iloc[top_rows[:num_customers]]
     
-    fig = go.Figure(data=[
-        go.Bar(name='Sales', x=top_customers['Customer Name'], y=top_customers['Sales'], marker_color='#4e73df'),
-        go.Bar(name='Profit', x=top_customers['Customer Name'], y=top_customers['Profit'], marker_color='#1cc88a')
-    ])
-    
-    fig.update_layout(
-        barmode='group',
-        title=f'Top {num_customers} Customers by {sort_customers_by}',
-        xaxis_tickangle=-45,
-        height=500
-    )
+    def top_customers_chart(top_customers, num_customers, sort_customers_by):
+        fig = go.Figure(data=[
+            go.Bar(name='Sales', x=top_customers['Customer Name'], y=top_customers['Sales'], marker_color='#4e73df'),
+            go.Bar(name='Profit', x=top_customers['Customer Name'], y=top_customers['Profit'], marker_color='#1cc88a')
+        ])
+        
+        fig.update_layout(
+            barmode='group',
+            title=f'Top {num_customers} Customers by {sort_customers_by}',
+            xaxis_tickangle=-45,
+            height=500
+        )
+        return fig
     
-    st.plotly_chart(fig, use_container_width=True)
+    show_chart(top_customers_chart, top_customers, num_customers, sort_customers_by)
     
     st.markdown('</div>', unsafe_allow_html=True)
 
-with tab4:
+def render_geography(selection, exact_distinct):
+    rows, cube_view, signature = selection["rows"], selection["cube_view"], selection["signature"]
     st.markdown('<div class="tab-content">', unsafe_allow_html=True)
     
     # Geographic analysis
     st.markdown("<div class='section-header'>🗺️ Geographic Performance</div>", unsafe_allow_html=True)
     
-    geo_data = filtered_data.groupby(["Region", "State"]).agg({
-        "Sales": "sum",
-        "Profit": "sum",
-        "Order ID": "nunique"
-    }).reset_index()
+    geo_data = geo_table(signature, rows)
     
     # Choropleth map
     st.markdown("#### 🌎 Sales by State")
     
-    fig = px.choropleth(
+    show_chart(
+        px.choropleth,
         geo_data,
         locations="State",
         locationmode="USA-states",
@@ -640,248 +887,303 @@ with tab4:
         title="Sales Distribution by State"
     )
     
-    st.plotly_chart(fig, use_container_width=True)
-    
     # Region analysis
     st.markdown("<div class='section-header'>📍 Regional Performance</div>", unsafe_allow_html=True)
     
+    region_data = cube_rollup_table(signature, cube_view, ("Region",))
+    
     col1, col2 = st.columns(2)
     
     with col1:
-        fig = px.bar(
-            geo_data.groupby("Region")["Sales"].sum().reset_index(),
+        show_chart(
+            px.bar,
+            region_data,
             x="Region",
             y="Sales",
             title="Total Sales by Region",
             color="Sales",
             color_continuous_scale="Purples"
         )
-        st.plotly_chart(fig, use_container_width=True)
     
     with col2:
-        fig = px.bar(
-            geo_data.groupby("Region")["Profit"].sum().reset_index(),
+        show_chart(
+            px.bar,
+            region_data,
             x="Region",
             y="Profit",
             title="Total Profit by Region",
             color="Profit",
             color_continuous_scale="RdYlGn"
         )
-        st.plotly_chart(fig, use_container_width=True)
     
     # City-level analysis
     st.markdown("<div class='section-header'>🏙️ City Performance</div>", unsafe_allow_html=True)
     
-    city_data = filtered_data.groupby(["Region", "State", "City"]).agg({
-        "Sales": "sum",
-        "Profit": "sum",
-        "Order ID": "nunique"
-    }).reset_index()
+    city_data = city_table(signature, rows)
     
-    num_cities = st.slider("Number of cities to show:", 5, 20, 10, key="city_slider")
-    sort_cities_by = st.selectbox("Sort cities by:", ["Sales", "Profit", "Order ID"])
+    num_cities = st.slider("Number of cities to show:", 5, RANK_DEPTH, 10, key="city_slider")
+    sort_cities_by = st.selectbox("Sort cities by:", RANK_METRICS["city"])
     
-    top_cities = city_data.sort_values(by=sort_cities_by, ascending=False).head(num_cities)
+    top_rows, _ = table_ranking(signature, city_data, "city", sort_cities_by)
+    top_cities = city_data.iloc[top_rows[:num_cities]]
     
-    fig = px.bar(
-        top_cities,
-        x="City",
-        y=sort_cities_by,
-        color="Region",
-        title=f"Top {num_cities} Cities by {sort_cities_by}",
-        hover_data=["State", "Sales", "Profit"]
-    )
+    def top_cities_chart(top_cities, num_cities, sort_cities_by):
+        fig = px.bar(
+            top_cities,
+            x="City",
+            y=sort_cities_by,
+            color="Region",
+            title=f"Top {num_cities} Cities by {sort_cities_by}",
+            hover_data=["State", "Sales", "Profit"]
+        )
+        
+        fig.update_layout(xaxis_tickangle=-45)
+        return fig
     
-    fig.update_layout(xaxis_tickangle=-45)
-    st.plotly_chart(fig, use_container_width=True)
+    show_chart(top_cities_chart, top_cities, num_cities, sort_cities_by)
     
     st.markdown('</div>', unsafe_allow_html=True)
 
 # Shipping analysis in an expander
-with st.expander("🚚 Shipping Performance Analysis", expanded=False):
+def render_shipping(selection, exact_distinct):
+    cube_view, signature = selection["cube_view"], selection["signature"]
     st.markdown('<div class="tab-content">', unsafe_allow_html=True)
     
-    ship_data = filtered_data.copy()
+    ship_mode_data = cube_rollup_table(signature, cube_view, ("Ship Mode",))
     
     col1, col2 = st.columns(2)
     
     with col1:
         # Shipping mode distribution
-        ship_mode_dist = ship_data["Ship Mode"].value_counts().reset_index()
-        fig = px.pie(
-            ship_mode_dist,
+        show_chart(
+            px.pie,
+            ship_mode_data,
             names="Ship Mode",
-            values="count",
+            values="Rows",
             title="Shipping Mode Distribution",
             hole=0.3,
             color_discrete_sequence=px.colors.qualitative.Pastel
         )
-        st.plotly_chart(fig, use_container_width=True)
     
     with col2:
         # Processing time by ship mode
-        processing_time = ship_data.groupby("Ship Mode")["Processing Time"].mean().reset_index()
-        fig = px.bar(
-            processing_time,
+        show_chart(
+            px.bar,
+            ship_mode_data,
             x="Ship Mode",
             y="Processing Time",
             title="Average Processing Time by Shipping Mode (Days)",
             color="Processing Time",
             color_continuous_scale="Viridis"
         )
-        st.plotly_chart(fig, use_container_width=True)
     
     # Shipping mode performance
-    ship_perf = ship_data.groupby("Ship Mode").agg({
-        "Sales": "sum",
-        "Profit": "sum",
-        "Order ID": "nunique",
-        "Profit Margin": "mean"
-    }).reset_index()
-    
-    fig = go.Figure()
-    
-    fig.add_trace(go.Bar(
-        x=ship_perf["Ship Mode"],
-        y=ship_perf["Sales"],
-        name="Sales",
-        marker_color="#4e73df"
-    ))
-    
-    fig.add_trace(go.Bar(
-        x=ship_perf["Ship Mode"],
-        y=ship_perf["Profit"],
-        name="Profit",
-        marker_color="#1cc88a"
-    ))
-    
-    fig.update_layout(
-        barmode="group",
-        title="Sales & Profit by Shipping Mode",
-        xaxis_title="Shipping Mode",
-        yaxis_title="Amount ($)"
-    )
+    ship_perf = ship_performance_summary(selection, exact_distinct)
     
-    st.plotly_chart(fig, use_container_width=True)
+    def ship_performance_chart(ship_perf):
+        fig = go.Figure()
+        
+        fig.add_trace(go.Bar(
+            x=ship_perf["Ship Mode"],
+            y=ship_perf["Sales"],
+            name="Sales",
+            marker_color="#4e73df"
+        ))
+        
+        fig.add_trace(go.Bar(
+            x=ship_perf["Ship Mode"],
+            y=ship_perf["Profit"],
+            name="Profit",
+            marker_color="#1cc88a"
+        ))
+        
+        fig.update_layout(
+            barmode="group",
+            title="Sales & Profit by Shipping Mode",
+            xaxis_title="Shipping Mode",
+            yaxis_title="Amount ($)"
+        )
+        return fig
+    
+    show_chart(ship_performance_chart, ship_perf)
     
     st.markdown('</div>', unsafe_allow_html=True)
 
 # Profitability analysis in an expander
-with st.expander("💰 Advanced Profitability Analysis", expanded=False):
+def render_profitability(selection, exact_distinct):
+    rows, signature = selection["rows"], selection["signature"]
     st.markdown('<div class="tab-content">', unsafe_allow_html=True)
     
     # Profit margin distribution
     st.markdown("#### 📊 Profit Margin Distribution")
     
-    fig = px.histogram(
-        filtered_data,
-        x="Profit Margin",
-        nbins=50,
-        title="Distribution of Profit Margins",
-        color_discrete_sequence=["#1cc88a"]
-    )
-    
-    fig.add_vline(
-        x=0,
-        line_dash="dash",
-        line_color="red",
-        annotation_text="Break-even",
-        annotation_position="top right"
-    )
+    counts, edges = margin_distribution(selection)
+    
+    def margin_chart(counts, edges):
+        fig = go.Figure(
+            go.Bar(
+                x=(edges[:-1] + edges[1:]) / 2,
+                y=counts,
+                width=np.diff(edges),
+                marker_color="#1cc88a",
+                hovertemplate="Profit Margin=%{x:.1f}<br>count=%{y}<extra></extra>"
+            )
+        )
+        fig.update_layout(
+            title="Distribution of Profit Margins",
+            xaxis_title="Profit Margin",
+            yaxis_title="count",
+            bargap=0
+        )
+        
+        fig.add_vline(
+            x=0,
+            line_dash="dash",
+            line_color="red",
+            annotation_text="Break-even",
+            annotation_position="top right"
+        )
+        return fig
     
-    st.plotly_chart(fig, use_container_width=True)
+    show_chart(margin_chart, counts, edges)
     
     # Profitability by product
     st.markdown("#### 📦 Product Profitability Analysis")
     
-    profitability_data = filtered_data.groupby("Product Name").agg({
-        "Sales": "sum",
-        "Profit": "sum",
-        "Profit Margin": "mean",
-        "Quantity": "sum"
-    }).reset_index()
-    
-    profitability_data["Profit per Unit"] = profitability_data["Profit"] / profitability_data["Quantity"]
+    profitability_data = profitability_table(signature, rows)
     
     col1, col2 = st.columns(2)
     
     with col1:
-        fig = px.scatter(
-            profitability_data,
-            x="Sales",
-            y="Profit",
-            color="Profit Margin",
-            size="Quantity",
-            hover_name="Product Name",
-            title="Sales vs. Profit Bubble Chart",
-            color_continuous_scale="RdYlGn",
-            labels={
-                "Sales": "Total Sales ($)",
-                "Profit": "Total Profit ($)",
-                "Profit Margin": "Avg. Profit Margin (%)",
-                "Quantity": "Units Sold"
-            }
-        )
+        bubble_data, dropped = thin_points(profitability_data, "Sales", "Profit", "Quantity")
         
-        # Add reference lines
-        fig.add_hline(y=0, line_dash="dash", line_color="red")
-        fig.add_vline(x=0, line_dash="dash", line_color="red")
+        def sales_profit_bubbles(bubble_data):
+            fig = px.scatter(
+                bubble_data,
+                x="Sales",
+                y="Profit",
+                color="Profit Margin",
+                size="Quantity",
+                hover_name="Product Name",
+                title="Sales vs. Profit Bubble Chart",
+                color_continuous_scale="RdYlGn",
+                render_mode="webgl" if len(bubble_data) > WEBGL_POINT_THRESHOLD else "auto",
+                labels={
+                    "Sales": "Total Sales ($)",
+                    "Profit": "Total Profit ($)",
+                    "Profit Margin": "Avg. Profit Margin (%)",
+                    "Quantity": "Units Sold"
+                }
+            )
+            
+            # Add reference lines
+            fig.add_hline(y=0, line_dash="dash", line_color="red")
+            fig.add_vline(x=0, line_dash="dash", line_color="red")
+            return fig
         
-        st.plotly_chart(fig, use_container_width=True)
+        show_chart(sales_profit_bubbles, bubble_data)
+        if dropped:
+            st.caption(f"Showing {len(bubble_data):,} of {len(profitability_data):,} products; {dropped:,} smaller bubbles in crowded areas left out")
     
     with col2:
-        fig = px.scatter(
-            profitability_data,
-            x="Quantity",
-            y="Profit per Unit",
-            color="Profit Margin",
-            size="Sales",
-            hover_name="Product Name",
-            title="Volume vs. Unit Profit",
-            color_continuous_scale="RdYlGn",
-            labels={
-                "Quantity": "Units Sold",
-                "Profit per Unit": "Profit per Unit ($)",
-                "Profit Margin": "Avg. Profit Margin (%)",
-                "Sales": "Total Sales ($)"
-            }
-        )
+        bubble_data, dropped = thin_points(profitability_data, "Quantity", "Profit per Unit", "Sales")
         
-        # Add reference line
-        fig.add_hline(y=0, line_dash="dash", line_color="red")
+        def unit_profit_bubbles(bubble_data):
+            fig = px.scatter(
+                bubble_data,
+                x="Quantity",
+                y="Profit per Unit",
+                color="Profit Margin",
+                size="Sales",
+                hover_name="Product Name",
+                title="Volume vs. Unit Profit",
+                color_continuous_scale="RdYlGn",
+                render_mode="webgl" if len(bubble_data) > WEBGL_POINT_THRESHOLD else "auto",
+                labels={
+                    "Quantity": "Units Sold",
+                    "Profit per Unit": "Profit per Unit ($)",
+                    "Profit Margin": "Avg. Profit Margin (%)",
+                    "Sales": "Total Sales ($)"
+                }
+            )
+            
+            # Add reference line
+            fig.add_hline(y=0, line_dash="dash", line_color="red")
+            return fig
         
-        st.plotly_chart(fig, use_container_width=True)
+        show_chart(unit_profit_bubbles, bubble_data)
+        if dropped:
+            st.caption(f"Showing {len(bubble_data):,} of {len(profitability_data):,} products; {dropped:,} smaller bubbles in crowded areas left out")
     
     st.markdown('</div>', unsafe_allow_html=True)
 
 # Raw data explorer with enhanced features
-with st.expander("🔍 Advanced Data Explorer", expanded=False):
+def render_explorer(selection, exact_distinct):
+    rows, signature = selection["rows"], selection["signature"]
     st.markdown('<div class="tab-content">', unsafe_allow_html=True)
     
     # Data preview with filters
     st.markdown("#### 🗃️ Filtered Data Preview")
     
     # Let users select columns to display
-    all_columns = filtered_data.columns.tolist()
+    all_columns = rows.columns()
     default_cols = ["Order Date", "Customer Name", "Category", "Sub-Category", "Sales", "Profit", "Quantity"]
     selected_cols = st.multiselect("Select columns to display:", all_columns, default=default_cols)
     
     if selected_cols:
-        st.dataframe(filtered_data[selected_cols], use_container_width=True)
+        # Sorting, searching and paging happen here; only the visible page is sent
+        sort_col1, sort_col2, sort_col3 = st.columns(3)
+        with sort_col1:
+            sort_col = st.selectbox("Sort by", ["(none)"] + all_columns)
+            descending = st.toggle("Descending", value=False)
+        with sort_col2:
+            search_col = st.selectbox("Search in column", all_columns, index=all_columns.index("Customer Name") if "Customer Name" in all_columns else 0)
+            query = st.text_input("Contains", value="").strip()
+        positions = explorer_positions(
+            signature, rows, None if sort_col == "(none)" else sort_col, descending, search_col, query
+        )
+        total_rows = len(positions)
+        with sort_col3:
+            page_size = st.selectbox("Rows per page", EXPLORER_PAGE_SIZES, index=1)
+            page_count = max((total_rows + page_size - 1) // page_size, 1)
+            # No key, so the page resets to 1 whenever the number of pages changes
+            page = st.number_input("Jump to page", min_value=1, max_value=page_count, value=1, step=1)
+        
+        first_row = (page - 1) * page_size
+        page_data = rows.take(positions[first_row:first_row + page_size], selected_cols)
+        st.dataframe(page_data, use_container_width=True, hide_index=True)
+        if total_rows:
+            st.caption(
+                f"Rows {first_row + 1:,}–{first_row + len(page_data):,} of {total_rows:,} matching rows "
+                f"· page {page:,} of {page_count:,}"
+            )
+        else:
+            st.caption("No rows match the current filters and search.")
     else:
         st.warning("Please select at least one column to display.")
     
     # Data statistics
     st.markdown("#### 📈 Descriptive Statistics")
-    st.dataframe(filtered_data.describe(), use_container_width=True)
+    exact_statistics = st.toggle(
+        "Exact statistics",
+        value=False,
+        key="exact_statistics",
+        help="Scan the filtered rows instead of combining pre-aggregated statistics."
+    )
+    st.dataframe(describe_summary(selection, exact_statistics), use_container_width=True)
+    if statistics_sketched(selection, exact_statistics):
+        st.caption(
+            "Count, mean, std, min, max and correlations are exact; quartiles are estimated "
+            "from per-month histograms."
+        )
     
     # Correlation matrix
     st.markdown("#### 🔗 Correlation Matrix")
     
-    numeric_cols = filtered_data.select_dtypes(include=['float64', 'int64']).columns
-    if len(numeric_cols) > 1:
-        corr_matrix = filtered_data[numeric_cols].corr()
-        fig = px.imshow(
+    corr_matrix = correlation_summary(selection, exact_statistics)
+    if corr_matrix is not None:
+        show_chart(
+            px.imshow,
             corr_matrix,
             text_auto=True,
             color_continuous_scale="RdYlGn",
@@ -889,12 +1191,57 @@ with st.expander("🔍 Advanced Data Explorer", expanded=False):
             zmax=1,
             title="Correlation Between Numeric Variables"
         )
-        st.plotly_chart(fig, use_container_width=True)
     else:
         st.warning("Not enough numeric columns to calculate correlations.")
     
     st.markdown('</div>', unsafe_allow_html=True)
 
+SECTIONS = {
+    "📈 Trends": render_trends,
+    "📦 Products": render_products,
+    "👥 Customers": render_customers,
+    "🗺️ Geography": render_geography
+}
+PANELS = {
+    "🚚 Shipping Performance Analysis": render_shipping,
+    "💰 Advanced Profitability Analysis": render_profitability,
+    "🔍 Advanced Data Explorer": render_explorer
+}
+
+# st.tabs and st.expander only hide their output, so in lazy mode the tabs become a
+# section selector and the expanders become toggles that skip collapsed panels entirely
+if lazy_sections:
+    selected_section = st.radio(
+        "Section",
+        list(SECTIONS),
+        horizontal=True,
+        label_visibility="collapsed",
+        key="selected_section"
+    )
+    with measure_section(selected_section):
+        SECTIONS[selected_section](selection, exact_distinct)
+    for label, render in PANELS.items():
+        if st.toggle(label, key=f"panel_{label}"):
+            with st.container(border=True), measure_section(label):
+                render(selection, exact_distinct)
+else:
+    for tab, (label, render) in zip(st.tabs(list(SECTIONS)), SECTIONS.items()):
+        with tab, measure_section(label):
+            render(selection, exact_distinct)
+    for label, render in PANELS.items():
+        with st.expander(label, expanded=False), measure_section(label):
+            render(selection, exact_distinct)
+
+# Filled in last so the counters include this rerun
+cache_stats_placeholder.dataframe(aggregate_cache_stats(), hide_index=True, use_container_width=True)
+figure_stats = figure_cache_stats()
+figure_cache_placeholder.caption(
+    f"Figure cache: {figure_stats['entries']:,} figures, {format_bytes(figure_stats['bytes'])} of "
+    f"{format_bytes(figure_stats['budget'])} · {figure_stats['hits']:,} hits, {figure_stats['misses']:,} misses"
+)
+if instrumented:
+    timings_placeholder.dataframe(section_timing_table(), hide_index=True, use_container_width=True)
+
 # Footer with more information
 st.markdown("---")
 st.markdown("""
@@ -903,4 +1250,22 @@ st.markdown("""
         <p>Built with Streamlit, Plotly, and Pandas | © 2025 Retail Analytics Inc.</p>
         <p style='font-size:12px;'>Last updated: {}</p>
     </div>
-""".format(datetime.now().strftime("%Y-%m-%d %H:%M:%S")), unsafe_allow_html=True)
\ No newline at end of file
+""".format(datetime.now().strftime("%Y-%m-%d %H:%M:%S")), unsafe_allow_html=True)
+
+mark_startup("render")
+if startup_run:
+    timing_logger().info(json.dumps({
+        "time": datetime.now().isoformat(timespec="milliseconds"),
+        "section": "Startup",
+        **startup,
+        "budget_ms": STARTUP_BUDGET_MS
+    }))
+    if STARTUP_BUDGET_MS is not None and startup["first_paint_ms"] > STARTUP_BUDGET_MS:
+        logging.getLogger("superstore.startup").warning(
+            "First paint took %.0f ms, over the %.0f ms startup budget", startup["first_paint_ms"], STARTUP_BUDGET_MS
+        )
+if instrumented and startup:
+    phases = [("import_ms", "imports"), ("load_ms", "data load"), ("first_paint_ms", "first paint"), ("render_ms", "first render")]
+    startup_placeholder.caption("Process startup: " + " · ".join(
+        f"{label} {startup[key]:,.0f} ms" for key, label in phases if key in startup
+    ) + (f" (budget {STARTUP_BUDGET_MS:,.0f} ms)" if STARTUP_BUDGET_MS is not None else ""))
\ No newline at end of file
@@ -0,0 +1,2434 @@
+# Headless analytics engine behind superstore_dashboard.py: loading, filtering and
+# every aggregate the dashboard draws, with no Streamlit dependency. Run it as a
+# script to compute aggregates for a filter from the command line, e.g.
+#   python superstore_engine.py kpis monthly_trend --region West --start 2016-01-01
+import numpy as np
+import pandas as pd
+import io
+import gzip
+import os
+import sys
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import itertools
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+DATA_PATH = os.environ.get("SUPERSTORE_DATA", "Sample - Superstore.csv")
+SNAPSHOT_DIR = os.environ.get("SUPERSTORE_CACHE_DIR", ".superstore_cache")
+SNAPSHOT_PATH = os.path.join(SNAPSHOT_DIR, "superstore.arrow")
+KEYS_PATH = os.path.join(SNAPSHOT_DIR, "row_keys.npy")
+STATISTICS_LAYOUT_PATH = os.path.join(SNAPSHOT_DIR, "statistics.json")
+STATISTICS_CELLS_PATH = os.path.join(SNAPSHOT_DIR, "statistics_cells.parquet")
+STATISTICS_HISTOGRAM_PATH = os.path.join(SNAPSHOT_DIR, "statistics_histogram.parquet")
+SKETCH_CELLS_PATH = os.path.join(SNAPSHOT_DIR, "distinct_sketch_cells.parquet")
+SKETCH_REGISTERS_PATH = os.path.join(SNAPSHOT_DIR, "distinct_sketch_registers.npy")
+MANIFEST_PATH = os.path.join(SNAPSHOT_DIR, "manifest.json")
+REBUILD_LOCK_PATH = os.path.join(SNAPSHOT_DIR, "rebuild.lock")
+# Bump whenever build_frame() or the snapshot format changes so stale snapshots are rebuilt
+SNAPSHOT_VERSION = 9
+
+# Declared column schema: low-cardinality dimensions are stored as categories and
+# the calendar fields as the narrowest integer type that holds them
+CATEGORY_COLUMNS = [
+    "Ship Mode", "Customer ID", "Customer Name", "Segment", "Country", "City", "State",
+    "Region", "Product ID", "Category", "Sub-Category", "Product Name"
+]
+COLUMN_SCHEMA = {
+    **{col: "category" for col in CATEGORY_COLUMNS},
+    "Quantity": "int16",
+    "Order Month": "int8",
+    "Order Year": "int16",
+    "Order Day of Week": "int8",
+    "Order Quarter": "int8",
+    "Processing Time": "int16",
+}
+
+def frame_memory(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+def apply_schema(df):
+    return df.astype({col: dtype for col, dtype in COLUMN_SCHEMA.items() if col in df.columns})
+
+def derive_columns(df):
+    df['Order Date'] = pd.to_datetime(df['Order Date'])
+    df['Ship Date'] = pd.to_datetime(df['Ship Date'])
+    df['Order Month'] = df['Order Date'].dt.month
+    df['Order Year'] = df['Order Date'].dt.year
+    df['Order Day of Week'] = df['Order Date'].dt.dayofweek
+    df['Order Quarter'] = df['Order Date'].dt.quarter
+    df['Processing Time'] = (df['Ship Date'] - df['Order Date']).dt.days
+    df['Profit Margin'] = (df['Profit'] / df['Sales']) * 100
+    return df
+
+def build_frame(path):
+    df = derive_columns(pd.read_csv(path, encoding="latin-1"))
+    # Kept sorted by Order Date so date ranges resolve to positional slices
+    df = df.sort_values('Order Date', kind='stable', ignore_index=True)
+    memory_before = frame_memory(df)
+    df = apply_schema(df)
+    df.attrs["memory"] = {"before": memory_before, "after": frame_memory(df)}
+    return df
+
+def source_fingerprint(path, block_size=1 << 20):
+    stat = os.stat(path)
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(block_size), b""):
+            digest.update(block)
+    return {
+        "version": SNAPSHOT_VERSION,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "sha256": digest.hexdigest()
+    }
+
+def read_manifest(path=MANIFEST_PATH):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+# Every cache file is written to a temporary file of its own next to it and moved into
+# place, so processes rebuilding at the same time never write into each other's file
+# and a reader only ever sees a whole one
+@contextmanager
+def replacing(path):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".", suffix=".tmp")
+    os.close(fd)
+    # mkstemp makes the file private to its owner; cache files are readable like any other
+    os.chmod(tmp_path, 0o644)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+@contextmanager
+def rebuild_lock(path=REBUILD_LOCK_PATH):
+    # Held while a cache is rebuilt, so processes starting together build it once: the
+    # others wait, then find it current. The lock goes with its holder's file handle,
+    # so a crashed rebuild does not leave it held. Without fcntl (Windows) or a
+    # writable cache directory rebuilds just are not serialized.
+    try:
+        import fcntl
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        fh = open(path, "a")
+    except (ImportError, OSError):
+        yield
+        return
+    with fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        yield
+
+def write_manifest(manifest, path=MANIFEST_PATH):
+    with replacing(path) as tmp_path:
+        with open(tmp_path, "w") as fh:
+            json.dump(manifest, fh)
+
+def format_bytes(num_bytes):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if num_bytes < 1024 or unit == "GB":
+            return f"{num_bytes:,.1f} {unit}"
+        num_bytes /= 1024
+
+def snapshot_is_current(manifest, path, snapshot_path=SNAPSHOT_PATH):
+    # Size and mtime are checked first so an untouched source is never re-read;
+    # the content hash only runs when they differ (e.g. the file was copied or touched).
+    if not manifest or manifest.get("version") != SNAPSHOT_VERSION or not os.path.exists(snapshot_path):
+        return False, None
+    stat = os.stat(path)
+    if manifest["size"] == stat.st_size and manifest["mtime"] == stat.st_mtime_ns:
+        return True, manifest
+    fingerprint = source_fingerprint(path)
+    return fingerprint["sha256"] == manifest["sha256"], fingerprint
+
+# The snapshot is an uncompressed Arrow IPC file written as a single chunk, so
+# memory-mapping it gives a frame whose columns point straight into the page cache:
+# every session and every process on the host shares one copy of the base rows.
+# Category codes keep the integer width pandas uses, which avoids a conversion copy.
+# The mapped columns are read-only; anything derived from them is a new frame.
+def write_snapshot(df, path=SNAPSHOT_PATH):
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    table = pa.Table.from_pandas(df, preserve_index=False).combine_chunks()
+    # A process that still maps the old file keeps reading it after the replace
+    with replacing(path) as tmp_path:
+        with pa.OSFile(tmp_path, "wb") as sink, ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+def map_snapshot(path=SNAPSHOT_PATH):
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+
+    return ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+def open_snapshot(manifest, fingerprint):
+    # The mapped frame, or None if the snapshot cannot be read (e.g. one truncated by a
+    # full disk), which is then rebuilt like a stale one
+    import pyarrow as pa
+
+    try:
+        # split_blocks keeps one block per column, so pandas does not consolidate
+        # (and copy) the mapped columns
+        df = map_snapshot().to_pandas(split_blocks=True)
+    except (OSError, pa.ArrowInvalid):
+        return None
+    if fingerprint is not manifest:
+        try:
+            write_manifest({**fingerprint, "memory": manifest.get("memory")})
+        except OSError:
+            pass
+    df.attrs["memory"] = manifest.get("memory") or {"before": None, "after": frame_memory(df)}
+    df.attrs["source"] = manifest["sha256"]
+    return df
+
+def load_data(path=DATA_PATH):
+    # Cold starts map the typed, fully derived frame from the snapshot and only fall
+    # back to parsing the CSV when the source has changed.
+    manifest = read_manifest()
+    current, fingerprint = snapshot_is_current(manifest, path)
+    df = open_snapshot(manifest, fingerprint) if current else None
+    if df is not None:
+        return df
+
+    with rebuild_lock():
+        # Another process may have rebuilt the snapshot while this one waited
+        manifest = read_manifest()
+        current, fingerprint = snapshot_is_current(manifest, path)
+        df = open_snapshot(manifest, fingerprint) if current else None
+        if df is not None:
+            return df
+        df = build_frame(path)
+        fingerprint = fingerprint or source_fingerprint(path)
+        df.attrs["source"] = fingerprint["sha256"]
+        try:
+            os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+            for stale in (KEYS_PATH, STATISTICS_LAYOUT_PATH, SKETCH_CELLS_PATH):
+                if os.path.exists(stale):
+                    os.remove(stale)
+            write_snapshot(df)
+            write_manifest({**fingerprint, "memory": df.attrs["memory"]})
+            # Served from the mapping too, so the parsed copy is released
+            mapped = map_snapshot().to_pandas(split_blocks=True)
+            mapped.attrs.update(df.attrs)
+            df = mapped
+        except OSError:
+            # A read-only deployment still works, it just parses the CSV every cold start
+            pass
+    return df
+
+# Pre-aggregated cube at day x Region x Category x Sub-Category x Segment x Ship Mode
+# grain. It only holds additive measures, so any sidebar selection is answered by
+# summing a slice of the cube instead of rescanning the order lines.
+CUBE_DIMENSIONS = ["Order Date", "Region", "Category", "Sub-Category", "Segment", "Ship Mode"]
+
+def build_cube(df):
+    keys = [df["Order Date"].dt.normalize()] + [df[col] for col in CUBE_DIMENSIONS[1:]]
+    return df.groupby(keys, observed=True).agg(**{
+        "Sales": ("Sales", "sum"),
+        "Profit": ("Profit", "sum"),
+        "Quantity": ("Quantity", "sum"),
+        "Rows": ("Sales", "size"),
+        "Profit Margin Sum": ("Profit Margin", "sum"),
+        "Profit Margin Count": ("Profit Margin", "count"),
+        "Processing Time Sum": ("Processing Time", "sum")
+    }).reset_index()
+
+def cube_slice(cube, start_date, end_date, regions, categories, segments):
+    mask = (
+        cube["Region"].isin(regions) &
+        cube["Category"].isin(categories) &
+        cube["Segment"].isin(segments)
+    )
+    if start_date is not None:
+        mask &= (cube["Order Date"] >= start_date) & (cube["Order Date"] <= end_date)
+    return cube[mask]
+
+# Profit margin histogram. Bins are computed server-side so only edges and counts go
+# to the browser. With SUPERSTORE_MARGIN_BIN_CUBE=1 the store also keeps per-cube-cell
+# counts over fixed bin edges taken from the loaded data, and the histogram is then
+# summed from the selected cells without touching any rows. Appended values outside
+# those edges fall into the first or last bin.
+MARGIN_BINS = 50
+MARGIN_BIN_CUBE = os.environ.get("SUPERSTORE_MARGIN_BIN_CUBE") == "1"
+
+def finite_values(values):
+    values = np.asarray(values, dtype=float)
+    return values[np.isfinite(values)]
+
+def margin_bin_codes(values, edges):
+    return np.clip(np.searchsorted(edges, values, side="right") - 1, 0, len(edges) - 2)
+
+def build_margin_cube(df, edges):
+    df = df[np.isfinite(df["Profit Margin"].to_numpy(dtype=float))]
+    keys = [df["Order Date"].dt.normalize()] + [df[col] for col in CUBE_DIMENSIONS[1:]]
+    keys.append(pd.Series(margin_bin_codes(df["Profit Margin"].to_numpy(dtype=float), edges), index=df.index, name="Margin Bin"))
+    return df.groupby(keys, observed=True).size().rename("Rows").reset_index()
+
+def cube_rollup(cube_view, by):
+    rollup = cube_view.groupby(by, observed=True)[[
+        "Sales", "Profit", "Quantity", "Rows",
+        "Profit Margin Sum", "Profit Margin Count", "Processing Time Sum"
+    ]].sum()
+    rollup["Profit Margin"] = rollup["Profit Margin Sum"] / rollup["Profit Margin Count"]
+    rollup["Processing Time"] = rollup["Processing Time Sum"] / rollup["Rows"]
+    return rollup.reset_index()
+
+# Bitmap filter index: one packed bitset per distinct value of each filter dimension.
+# A selection is an OR of bitsets within a dimension and an AND across dimensions,
+# so the sidebar never compares strings row by row. Adding a dimension to
+# FILTER_DIMENSIONS is all a new sidebar filter needs.
+FILTER_DIMENSIONS = ["Region", "Category", "Segment"]
+
+def build_filter_index(df, dimensions=FILTER_DIMENSIONS):
+    index = {"rows": len(df), "bitmaps": {}}
+    for dim in dimensions:
+        codes, values = pd.factorize(df[dim])
+        index["bitmaps"][dim] = {
+            value: np.packbits(codes == code) for code, value in enumerate(values)
+        }
+    return index
+
+def filter_bits(index, selections, first_byte, last_byte):
+    bits = None
+    for dim, selected in selections.items():
+        bitmaps = index["bitmaps"][dim]
+        if set(bitmaps) <= set(selected):
+            continue  # Every value selected, the dimension does not filter anything
+        dim_bits = None
+        for value in selected:
+            if value not in bitmaps:
+                continue
+            value_bits = bitmaps[value][first_byte:last_byte]
+            if dim_bits is None:
+                dim_bits = value_bits.copy()
+            else:
+                np.bitwise_or(dim_bits, value_bits, out=dim_bits)
+        if dim_bits is None:
+            dim_bits = np.zeros(last_byte - first_byte, dtype=np.uint8)
+        if bits is None:
+            bits = dim_bits
+        else:
+            np.bitwise_and(bits, dim_bits, out=bits)
+    return bits
+
+def filter_mask(index, selections, start=0, stop=None):
+    # Boolean mask over rows [start, stop), or None when the selection keeps every row
+    stop = index["rows"] if stop is None else stop
+    first_byte = start // 8
+    bits = filter_bits(index, selections, first_byte, (stop + 7) // 8)
+    if bits is None:
+        return None
+    offset = first_byte * 8
+    return np.unpackbits(bits)[start - offset:stop - offset].view(bool)
+
+def date_bounds(df, start_date, end_date):
+    # Binary search over the sorted Order Date column
+    dates = df['Order Date']
+    return dates.searchsorted(start_date, side='left'), dates.searchsorted(end_date, side='right')
+
+# Statistics cube for the Data Explorer. Per day x Region x Category x Segment cell
+# (the grain the sidebar filters at) it keeps, for every numeric and date column,
+# the count, sum, sum of squares, min and max, and for the numeric columns the sums
+# of pairwise products over rows where all of them are present. These merge by
+# addition (min/max by min/max), so the count, mean, std, min, max and correlation
+# of any selection come out exact up to rounding; values are shifted by the loaded
+# data's mean first so the sums of squares do not cancel. Quantiles come from
+# per-month histograms over STATISTICS_BINS equi-depth bins (one bin per value for
+# columns with fewer distinct values, which are exact), with months the date range
+# only partly covers weighted by the share of their rows it keeps; interpolating
+# inside a bin puts an estimate within that bin's range, about 1/STATISTICS_BINS of
+# the rows. Selections under STATISTICS_MIN_ROWS rows, where a partial month's
+# histogram says little and a scan is cheap, are computed from the rows, as is
+# everything with SUPERSTORE_EXACT_STATS=1, which skips the cube.
+STATISTICS_CUBE = os.environ.get("SUPERSTORE_EXACT_STATS") != "1"
+STATISTICS_BINS = 128
+STATISTICS_MIN_ROWS = 2000
+STATISTICS_DIMENSIONS = ["Order Date"] + FILTER_DIMENSIONS
+STATISTICS_QUANTILES = [0.25, 0.5, 0.75]
+# Columns of the correlation matrix: the order lines' own measures. The calendar fields
+# derived from Order Date are numeric too, but were never part of it.
+CORRELATION_COLUMNS = ["Row ID", "Postal Code", "Sales", "Quantity", "Discount", "Profit", "Processing Time", "Profit Margin"]
+
+def statistic_values(series, shift=0.0):
+    # Dates are measured in nanoseconds; missing values become NaN
+    if pd.api.types.is_datetime64_any_dtype(series):
+        values = series.to_numpy(dtype="datetime64[ns]").view("int64").astype(float)
+        values[series.isna().to_numpy()] = np.nan
+    else:
+        values = series.to_numpy(dtype=float, na_value=np.nan)
+    return values - shift
+
+def statistics_layout(df):
+    describe_columns = df.select_dtypes(include=["number", "datetime"]).columns.tolist()
+    layout = {
+        "describe": describe_columns,
+        "corr": [col for col in CORRELATION_COLUMNS if col in df.columns],
+        "dates": [col for col in describe_columns if pd.api.types.is_datetime64_any_dtype(df[col])],
+        "shift": {},
+        "bins": {}
+    }
+    for col in describe_columns:
+        values = statistic_values(df[col])
+        values = values[~np.isnan(values)]
+        layout["shift"][col] = float(values.mean()) if len(values) else 0.0
+        distinct = np.unique(values)
+        if len(distinct) <= STATISTICS_BINS:
+            layout["bins"][col] = {"points": True, "edges": distinct}
+        else:
+            edges = np.unique(np.quantile(values, np.linspace(0, 1, STATISTICS_BINS + 1)))
+            layout["bins"][col] = {"points": False, "edges": edges}
+    return layout
+
+def statistic_bins(values, bins):
+    edges = bins["edges"]
+    if bins["points"]:
+        return np.clip(np.searchsorted(edges, values), 0, len(edges) - 1)
+    return np.clip(np.searchsorted(edges, values, side="right") - 1, 0, len(edges) - 2)
+
+def statistics_merge_spec(layout):
+    spec = {"Rows": "sum", "Complete Rows": "sum"}
+    for col in layout["describe"]:
+        spec.update({f"{col} Count": "sum", f"{col} Sum": "sum", f"{col} Sum Sq": "sum", f"{col} Min": "min", f"{col} Max": "max"})
+    for i, col in enumerate(layout["corr"]):
+        spec[f"{col} Complete Sum"] = "sum"
+        for other in layout["corr"][i:]:
+            spec[f"{col} x {other}"] = "sum"
+    return spec
+
+def build_statistics(df, layout):
+    keys = [df["Order Date"].dt.normalize()] + [df[dim] for dim in FILTER_DIMENSIONS]
+    groups = df.groupby(keys, observed=True)
+    codes = groups.ngroup().to_numpy()
+    cells = groups.size().rename("Rows").reset_index()
+    n = len(cells)
+    values = {col: statistic_values(df[col], layout["shift"][col]) for col in layout["describe"]}
+    columns = {}
+    for col in layout["describe"]:
+        present = ~np.isnan(values[col])
+        filled = np.where(present, values[col], 0.0)
+        extremes = pd.Series(values[col]).groupby(codes)
+        columns[f"{col} Count"] = np.bincount(codes, weights=present, minlength=n)
+        columns[f"{col} Sum"] = np.bincount(codes, weights=filled, minlength=n)
+        columns[f"{col} Sum Sq"] = np.bincount(codes, weights=filled * filled, minlength=n)
+        columns[f"{col} Min"] = extremes.min().reindex(range(n)).to_numpy()
+        columns[f"{col} Max"] = extremes.max().reindex(range(n)).to_numpy()
+    complete = np.ones(len(df), dtype=bool)
+    for col in layout["corr"]:
+        complete &= ~np.isnan(values[col])
+    columns["Complete Rows"] = np.bincount(codes, weights=complete, minlength=n)
+    filled = {col: np.where(complete, values[col], 0.0) for col in layout["corr"]}
+    for i, col in enumerate(layout["corr"]):
+        columns[f"{col} Complete Sum"] = np.bincount(codes, weights=filled[col], minlength=n)
+        for other in layout["corr"][i:]:
+            columns[f"{col} x {other}"] = np.bincount(codes, weights=filled[col] * filled[other], minlength=n)
+    cells = pd.concat([cells, pd.DataFrame(columns)], axis=1)
+
+    months = df["Order Date"].dt.to_period("M").dt.start_time.rename("Month")
+    month_groups = df.groupby([months] + [df[dim] for dim in FILTER_DIMENSIONS], observed=True)
+    month_codes = month_groups.ngroup().to_numpy()
+    month_cells = month_groups.size().index.to_frame(index=False)
+    parts = []
+    for col in layout["describe"]:
+        present = ~np.isnan(values[col])
+        bins = layout["bins"][col]
+        bin_count = len(bins["edges"]) - (0 if bins["points"] else 1)
+        counts = np.bincount(
+            month_codes[present] * bin_count + statistic_bins(values[col][present] + layout["shift"][col], bins),
+            minlength=len(month_cells) * bin_count
+        )
+        occupied = np.flatnonzero(counts)
+        part = month_cells.iloc[occupied // bin_count].reset_index(drop=True)
+        part["Column"] = col
+        part["Bin"] = occupied % bin_count
+        part["Rows"] = counts[occupied]
+        parts.append(part)
+    # Sorted by month like the cells are by date, so an append regroups only its months
+    histogram = pd.concat(parts).sort_values("Month", kind="stable", ignore_index=True)
+    histogram["Column"] = pd.Categorical(histogram["Column"], categories=layout["describe"])
+    return {"layout": layout, "cells": cells, "histogram": histogram}
+
+def merge_statistics(total, part):
+    layout = total["layout"]
+    spec = statistics_merge_spec(layout)
+    cells = pd.concat([total["cells"], part["cells"]], ignore_index=True).groupby(STATISTICS_DIMENSIONS, observed=True)
+    # One reduction per kind over all its columns, put back in the spec's column order
+    # as a single block; agg() would insert them one at a time
+    cells = pd.concat([
+        getattr(cells[[col for col, how in spec.items() if how == kind]], kind)() for kind in ("sum", "min", "max")
+    ], axis=1)[list(spec)].copy().reset_index()
+    histogram = pd.concat([total["histogram"], part["histogram"]], ignore_index=True)
+    return {
+        "layout": layout,
+        "cells": cells,
+        "histogram": histogram.groupby(
+            ["Month"] + FILTER_DIMENSIONS + ["Column", "Bin"], observed=True
+        )["Rows"].sum().reset_index()
+    }
+
+# Distinct-count sketches. Order ID and Customer ID are not additive, so per month x
+# Region x Category x Segment x Ship Mode cell the store keeps a HyperLogLog sketch of
+# each instead: 2**DISTINCT_PRECISION registers, each holding the largest rank (leading
+# zeros + 1) among the hashed IDs routed to it. Sketches merge by taking the register
+# maximum, so the sketch of any selection, or of any group of it, is the union of its
+# cells' sketches, and the estimate carries the same error as a single sketch: a
+# relative standard error of 1.04 / sqrt(2**12), about 1.6%, so within 5% of the exact
+# count 99.7% of the time (smaller counts do better). The registers are kept dense, one
+# row of len(DISTINCT_COLUMNS) x 2**DISTINCT_PRECISION bytes per cell, so the store is
+# bounded by the number of cells (56 MB for four years) however many rows they hold,
+# and a selection reduces at most that many bytes; months the date range only partly
+# covers are sketched from their rows in the range. On small data the registers
+# outweigh the rows they summarize and a scan is cheap, so data under
+# DISTINCT_MIN_ROWS rows is not sketched and counts from the rows, as everything
+# does with SUPERSTORE_EXACT_DISTINCT=1.
+DISTINCT_SKETCH = os.environ.get("SUPERSTORE_EXACT_DISTINCT") != "1"
+DISTINCT_MIN_ROWS = int(os.environ.get("SUPERSTORE_SKETCH_ROWS", 500_000))
+DISTINCT_PRECISION = 12
+DISTINCT_COLUMNS = ["Order ID", "Customer ID"]
+DISTINCT_DIMENSIONS = ["Month"] + FILTER_DIMENSIONS + ["Ship Mode"]
+
+def leading_zeros(words):
+    # Leading zero bits of each uint64, by binary search over halves
+    words = words.copy()
+    zeros = np.zeros(len(words), dtype=np.uint8)
+    for width in (32, 16, 8, 4, 2, 1):
+        empty = (words >> np.uint64(64 - width)) == 0
+        zeros[empty] += width
+        words[empty] <<= np.uint64(width)
+    zeros += (words >> np.uint64(63)) == 0
+    return zeros
+
+def register_ranks(values):
+    hashes = pd.util.hash_pandas_object(values, index=False).to_numpy()
+    registers = (hashes >> np.uint64(64 - DISTINCT_PRECISION)).astype(np.int64)
+    ranks = np.minimum(leading_zeros(hashes << np.uint64(DISTINCT_PRECISION)) + 1, 64 - DISTINCT_PRECISION + 1)
+    return registers, ranks.astype(np.uint8)
+
+def sketch_registers(df, keys):
+    # One row of registers per group of keys (the whole frame when there are none),
+    # as a (groups, len(DISTINCT_COLUMNS), 2**DISTINCT_PRECISION) array, in key order
+    if len(keys):
+        groups = df.groupby(keys, observed=True)
+        codes = groups.ngroup().to_numpy().astype(np.int64)
+        table = groups.size().index.to_frame(index=False)
+    else:
+        codes = np.zeros(len(df), dtype=np.int64)
+        table = pd.DataFrame(index=range(1))
+    registers = np.zeros((len(table), len(DISTINCT_COLUMNS), 1 << DISTINCT_PRECISION), dtype=np.uint8)
+    flat = registers.reshape(-1)
+    for i, col in enumerate(DISTINCT_COLUMNS):
+        present = df[col].notna().to_numpy()
+        slots, ranks = register_ranks(df[col][present])
+        slots += (codes[present] * len(DISTINCT_COLUMNS) + i) << DISTINCT_PRECISION
+        np.maximum.at(flat, slots, ranks)
+    return table, registers
+
+def build_sketches(df):
+    months = df["Order Date"].dt.to_period("M").dt.start_time.rename("Month")
+    cells, registers = sketch_registers(df, [months] + [df[dim] for dim in DISTINCT_DIMENSIONS[1:]])
+    return {"cells": cells, "registers": registers}
+
+def merge_registers(keys, registers):
+    # Register maximum per distinct row of keys. One reduction per group, which suits
+    # the handful of groups a table is split into (segments, ship modes)
+    if keys.columns.empty:
+        return pd.DataFrame(index=range(1)), registers.max(axis=0, initial=0)[np.newaxis]
+    groups = keys.groupby(list(keys.columns), observed=True, sort=False)
+    codes = groups.ngroup().to_numpy()
+    table = groups.size().index.to_frame(index=False)
+    merged = np.zeros((len(table),) + registers.shape[1:], dtype=np.uint8)
+    for group in range(len(table)):
+        registers[codes == group].max(axis=0, out=merged[group])
+    return table, merged
+
+def merge_sketches(parts):
+    # Empty parts carry no registers, so they are dropped rather than merged
+    parts = [part for part in parts if part is not None and len(part["cells"])]
+    if len(parts) <= 1:
+        return parts[0] if parts else None
+    groups = pd.concat([part["cells"] for part in parts], ignore_index=True).groupby(DISTINCT_DIMENSIONS, observed=True)
+    codes = groups.ngroup().to_numpy()
+    registers = np.zeros((groups.ngroups,) + parts[0]["registers"].shape[1:], dtype=np.uint8)
+    offset = 0
+    for part in parts:
+        # A part holds each cell once, so its rows go to distinct merged rows
+        part_codes = codes[offset:offset + len(part["cells"])]
+        registers[part_codes] = np.maximum(registers[part_codes], part["registers"])
+        offset += len(part["cells"])
+    cells = groups.size().index.to_frame(index=False).astype({dim: "category" for dim in DISTINCT_DIMENSIONS[1:]})
+    return {"cells": cells, "registers": registers}
+
+def sketch_slice(sketches, cube, start_date, end_date, selections):
+    # The selected cells of the months the date range covers whole, and the date range
+    # of each month it covers only in part (one with order dates on both sides of a
+    # bound), whose registers are built from its rows in the range instead
+    cells = sketches["cells"]
+    mask = np.ones(len(cells), dtype=bool)
+    for dim, values in selections.items():
+        mask &= cells[dim].isin(values).to_numpy()
+    edges = []
+    if start_date is not None:
+        start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        first_month, last_month = (date.to_period("M").start_time for date in (start_date, end_date))
+        mask &= ((cells["Month"] >= first_month) & (cells["Month"] <= last_month)).to_numpy()
+        dates = cube["Order Date"]
+        for month in sorted({first_month, last_month}):
+            next_month = month + pd.offsets.MonthBegin()
+            in_month = dates[(dates >= month) & (dates < next_month)]
+            if ((in_month < start_date) | (in_month > end_date)).any():
+                mask &= (cells["Month"] != month).to_numpy()
+                edges.append((max(start_date, month), min(end_date, next_month - pd.Timedelta(days=1))))
+    return cells[mask], edges
+
+def hyperloglog_estimate(registers):
+    # Ertl's improved estimator ("New cardinality estimation algorithms for
+    # HyperLogLog sketches", 2017): unbiased from empty to large cardinalities without
+    # empirical bias tables or a switch to linear counting
+    m = len(registers)
+    q = 64 - DISTINCT_PRECISION
+    counts = np.bincount(registers, minlength=q + 2).astype(float)
+
+    def sigma(x):
+        if x == 1:
+            return np.inf
+        y, z = 1.0, x
+        while True:
+            x *= x
+            previous, z = z, z + x * y
+            y += y
+            if z == previous:
+                return z
+
+    def tau(x):
+        if x == 0 or x == 1:
+            return 0.0
+        y, z = 1.0, 1 - x
+        while True:
+            x = np.sqrt(x)
+            previous, y = z, y * 0.5
+            z -= (1 - x) ** 2 * y
+            if z == previous:
+                return z / 3
+
+    z = m * tau(1 - counts[q + 1] / m)
+    for k in range(q, 0, -1):
+        z = 0.5 * (z + counts[k])
+    z += m * sigma(counts[0] / m)
+    return m * m / (2 * np.log(2) * z)
+
+# Aggregations are memoized on a canonical filter signature (source version, date
+# range and the sorted selections) rather than on the DataFrame, so reruns caused by
+# presentation-only widgets reuse them. The caches are module state, so they survive
+# script reruns and are shared between sessions.
+AGGREGATE_CACHE_SIZE = 32
+
+def filter_signature(source, start_date, end_date, regions, categories, segments):
+    return (
+        source,
+        None if start_date is None else start_date.isoformat(),
+        None if end_date is None else end_date.isoformat(),
+        tuple(sorted(regions)),
+        tuple(sorted(categories)),
+        tuple(sorted(segments))
+    )
+
+AGGREGATE_CACHES = {"lock": threading.Lock(), "caches": {}}
+
+def aggregate_caches():
+    return AGGREGATE_CACHES
+
+def clear_aggregate_caches():
+    with AGGREGATE_CACHES["lock"]:
+        AGGREGATE_CACHES["caches"].clear()
+
+# A profiler can collect the time spent in memoized aggregates on its thread by
+# setting AGGREGATE_TIMING.sink to a list: every outermost call appends
+# (name, seconds, cache_hit), and aggregates called from inside another one are
+# counted in the outer call
+AGGREGATE_TIMING = threading.local()
+
+def memoize_by_signature(func=None, *, maxsize=AGGREGATE_CACHE_SIZE):
+    # Wraps func(frame, *options) as wrapper(signature, frame, *options); the frame
+    # itself is never hashed, the signature stands in for it
+    if func is None:
+        return lambda func: memoize_by_signature(func, maxsize=maxsize)
+    store = aggregate_caches()
+
+    def cached(signature, frame, options):
+        key = (signature, options)
+        with store["lock"]:
+            cache = store["caches"].setdefault(
+                func.__name__, {"entries": OrderedDict(), "hits": 0, "misses": 0}
+            )
+            if key in cache["entries"]:
+                cache["hits"] += 1
+                cache["entries"].move_to_end(key)
+                return cache["entries"][key], True
+            cache["misses"] += 1
+        result = func(frame, *options)
+        with store["lock"]:
+            cache["entries"][key] = result
+            while len(cache["entries"]) > maxsize:
+                cache["entries"].popitem(last=False)
+        return result, False
+
+    def wrapper(signature, frame, *options):
+        sink = getattr(AGGREGATE_TIMING, "sink", None)
+        if sink is None:
+            return cached(signature, frame, options)[0]
+        AGGREGATE_TIMING.sink = None
+        started = time.perf_counter()
+        try:
+            result, hit = cached(signature, frame, options)
+        finally:
+            AGGREGATE_TIMING.sink = sink
+        sink.append((func.__name__, time.perf_counter() - started, hit))
+        return result
+    wrapper.__name__ = func.__name__
+    return wrapper
+
+# Figure cache. The dashboard keys each chart on a digest of the tables and options it
+# is drawn from and keeps the serialized figure, so an identical chart is neither
+# rebuilt nor validated again, whichever filter or session produced its table. Entries
+# are evicted least recently used first once they hold more than FIGURE_CACHE_BYTES.
+FIGURE_CACHE_BYTES = int(float(os.environ.get("SUPERSTORE_FIGURE_CACHE_MB", 64)) * 2**20)
+FIGURE_CACHE = {"lock": threading.Lock(), "entries": OrderedDict(), "bytes": 0, "hits": 0, "misses": 0}
+
+def content_digest(*values):
+    digest = hashlib.sha1()
+    for value in values:
+        if isinstance(value, pd.DataFrame):
+            digest.update(repr((value.shape, list(value.columns), list(value.dtypes), value.index.names)).encode())
+            digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+        elif isinstance(value, pd.Series):
+            digest.update(repr((value.shape, value.name, value.dtype, value.index.names)).encode())
+            digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+        elif isinstance(value, np.ndarray):
+            digest.update(repr((value.shape, value.dtype.str)).encode())
+            digest.update(np.ascontiguousarray(value).tobytes())
+        else:
+            digest.update(repr(value).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def cached_figure(key, build):
+    # build() returns the serialized figure; returns (spec, cache_hit)
+    with FIGURE_CACHE["lock"]:
+        entries = FIGURE_CACHE["entries"]
+        if key in entries:
+            FIGURE_CACHE["hits"] += 1
+            entries.move_to_end(key)
+            return entries[key], True
+        FIGURE_CACHE["misses"] += 1
+    spec = build()
+    size = sys.getsizeof(spec)
+    with FIGURE_CACHE["lock"]:
+        if key not in entries and size <= FIGURE_CACHE_BYTES:
+            entries[key] = spec
+            FIGURE_CACHE["bytes"] += size
+            while FIGURE_CACHE["bytes"] > FIGURE_CACHE_BYTES:
+                FIGURE_CACHE["bytes"] -= sys.getsizeof(entries.popitem(last=False)[1])
+    return spec, False
+
+def clear_figure_cache():
+    with FIGURE_CACHE["lock"]:
+        FIGURE_CACHE["entries"].clear()
+        FIGURE_CACHE["bytes"] = 0
+
+def figure_cache_stats():
+    with FIGURE_CACHE["lock"]:
+        return {
+            "entries": len(FIGURE_CACHE["entries"]),
+            "bytes": FIGURE_CACHE["bytes"],
+            "budget": FIGURE_CACHE_BYTES,
+            "hits": FIGURE_CACHE["hits"],
+            "misses": FIGURE_CACHE["misses"]
+        }
+
+def aggregate_cache_stats():
+    store = aggregate_caches()
+    with store["lock"]:
+        return pd.DataFrame(
+            [
+                {"Aggregate": name, "Hits": cache["hits"], "Misses": cache["misses"], "Entries": len(cache["entries"])}
+                for name, cache in sorted(store["caches"].items())
+            ],
+            columns=["Aggregate", "Hits", "Misses", "Entries"]
+        )
+
+# Trends are rolled up from one daily series per filter state, which is itself read off
+# the cube, so switching granularity never goes back to the order lines
+TIME_GRANULARITIES = {
+    "Daily": (None, "Order Date"),
+    "Weekly": ("W", "Week"),
+    "Monthly": ("M", "Month"),
+    "Quarterly": ("Q", "Quarter")
+}
+
+@memoize_by_signature
+def daily_series(cube_view):
+    return cube_view.groupby("Order Date")[["Sales", "Profit"]].sum()
+
+@memoize_by_signature
+def time_series_table(daily, granularity):
+    period, x_col = TIME_GRANULARITIES[granularity]
+    if period is None:
+        return daily.reset_index()
+    buckets = daily.index.to_period(period).start_time.rename(x_col)
+    return daily.groupby(buckets).sum().reset_index()
+
+WEEKDAY_ORDER = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+@memoize_by_signature
+def order_count(rows):
+    folded = rows.folded("weekday")
+    if folded is not None:
+        # Every order has a single order date, so per-weekday distinct counts add up
+        return int(folded["Order ID"].sum())
+    return rows.nunique("Order ID")
+
+@memoize_by_signature
+def weekday_table(rows):
+    folded = rows.folded("weekday")
+    if folded is None and rows.pushdown:
+        # Grouped on the stored weekday number, then labelled like the folded table
+        folded = rows.aggregate(["Order Day of Week"], {"Sales": "sum", "Profit": "sum", "Order ID": "nunique"})
+    if folded is not None:
+        weekday_data = folded[["Order Day of Week", "Sales", "Profit", "Order ID"]].copy()
+        weekday_data["Day of Week"] = pd.Categorical(
+            [WEEKDAY_ORDER[day] for day in weekday_data["Order Day of Week"]], categories=WEEKDAY_ORDER, ordered=True
+        )
+        weekday_data = weekday_data.drop(columns="Order Day of Week")
+    else:
+        weekday_data = rows(["Order Date", "Sales", "Profit", "Order ID"]).copy()
+        weekday_data["Day of Week"] = pd.Categorical(
+            weekday_data["Order Date"].dt.day_name(), categories=WEEKDAY_ORDER, ordered=True
+        )
+    return weekday_data.groupby("Day of Week", observed=False).agg({
+        "Sales": "sum",
+        "Profit": "sum",
+        "Order ID": "nunique" if folded is None else "sum"
+    }).reset_index()
+
+@memoize_by_signature
+def cube_rollup_table(cube_view, by):
+    return cube_rollup(cube_view, list(by))
+
+@memoize_by_signature
+def product_table(rows):
+    folded = rows.folded("product")
+    if folded is not None:
+        return folded[["Product Name", "Sales", "Profit", "Quantity", "Order ID"]]
+    return rows.aggregate(["Product Name"], {
+        "Sales": "sum",
+        "Profit": "sum",
+        "Quantity": "sum",
+        "Order ID": "nunique"
+    })
+
+@memoize_by_signature
+def segment_table(frames):
+    rows, cube_view = frames
+    # Distinct counts are not additive, so only they still come from the order lines
+    if rows.folded("segment") is not None:
+        counts = rows.folded("segment")[["Segment", "Order ID"]].merge(
+            rows.folded("segment_customers").groupby("Segment", observed=True).size().rename("Customer ID").reset_index(),
+            on="Segment"
+        )
+    else:
+        counts = rows.aggregate(["Segment"], {
+            "Customer ID": "nunique",
+            "Order ID": "nunique"
+        })
+    return segment_frame(cube_view, counts)
+
+def segment_frame(cube_view, counts):
+    seg_data = cube_rollup(cube_view, "Segment")[["Segment", "Sales", "Profit"]].merge(
+        counts[["Segment", "Customer ID", "Order ID"]], on="Segment"
+    )
+    seg_data["Avg. Order Value"] = seg_data["Sales"] / seg_data["Order ID"]
+    seg_data["Profit per Customer"] = seg_data["Profit"] / seg_data["Customer ID"]
+    return seg_data
+
+@memoize_by_signature
+def customer_table(rows):
+    folded = rows.folded("customer")
+    if folded is not None:
+        customer_data = folded[["Customer ID", "Customer Name", "Sales", "Profit", "Order ID"]].copy()
+        customer_data["Profit Margin"] = folded["Profit Margin Sum"] / folded["Profit Margin Count"]
+    else:
+        customer_data = rows.aggregate(["Customer ID", "Customer Name"], {
+            "Sales": "sum",
+            "Profit": "sum",
+            "Order ID": "nunique",
+            "Profit Margin": "mean"
+        })
+    customer_data["Avg. Order Value"] = customer_data["Sales"] / customer_data["Order ID"]
+    return customer_data
+
+@memoize_by_signature
+def geo_table(rows):
+    folded = rows.folded("geo")
+    if folded is not None:
+        return folded[["Region", "State", "Sales", "Profit", "Order ID"]]
+    return rows.aggregate(["Region", "State"], {
+        "Sales": "sum",
+        "Profit": "sum",
+        "Order ID": "nunique"
+    })
+
+@memoize_by_signature
+def city_table(rows):
+    folded = rows.folded("city")
+    if folded is not None:
+        return folded[["Region", "State", "City", "Sales", "Profit", "Order ID"]]
+    return rows.aggregate(["Region", "State", "City"], {
+        "Sales": "sum",
+        "Profit": "sum",
+        "Order ID": "nunique"
+    })
+
+@memoize_by_signature
+def ship_performance_table(rows):
+    folded = rows.folded("ship_mode")
+    if folded is not None:
+        ship_perf = folded[["Ship Mode", "Sales", "Profit", "Order ID"]].copy()
+        ship_perf["Profit Margin"] = folded["Profit Margin Sum"] / folded["Profit Margin Count"]
+        return ship_perf
+    return rows.aggregate(["Ship Mode"], {
+        "Sales": "sum",
+        "Profit": "sum",
+        "Order ID": "nunique",
+        "Profit Margin": "mean"
+    })
+
+@memoize_by_signature
+def profitability_table(rows):
+    folded = rows.folded("product")
+    if folded is not None:
+        profitability_data = folded[["Product Name", "Sales", "Profit", "Quantity"]].copy()
+        profitability_data.insert(3, "Profit Margin", folded["Profit Margin Sum"] / folded["Profit Margin Count"])
+    else:
+        profitability_data = rows.aggregate(["Product Name"], {
+            "Sales": "sum",
+            "Profit": "sum",
+            "Profit Margin": "mean",
+            "Quantity": "sum"
+        })
+    profitability_data["Profit per Unit"] = profitability_data["Profit"] / profitability_data["Quantity"]
+    return profitability_data
+
+# Sketched distinct counts. The tables whose groups are cell dimensions (the KPI total,
+# segments and ship modes) can be served from the cube and the distinct sketches
+# without reading more than the partly covered months' rows; weekday, product,
+# customer and geographic tables group by keys the cells do not carry and keep
+# counting exactly.
+@memoize_by_signature
+def distinct_table(sources, by):
+    # Estimated distinct Order ID and Customer ID per group of `by` (cell dimensions),
+    # from the union of the selected cells' sketches and the partly covered months'
+    sketches, sketch_view, edges = sources
+    by = list(by)
+    keys = [sketch_view[by].reset_index(drop=True)]
+    registers = [sketches["registers"][sketch_view.index.to_numpy()]]
+    for rows in edges:
+        table, edge_registers = sketch_registers(rows(by + DISTINCT_COLUMNS), by)
+        keys.append(table)
+        registers.append(edge_registers)
+    table, registers = merge_registers(pd.concat(keys, ignore_index=True), np.concatenate(registers))
+    for i, col in enumerate(DISTINCT_COLUMNS):
+        table[col] = np.array([round(hyperloglog_estimate(group)) for group in registers[:, i]], dtype="int64")
+    return table
+
+def distinct_sketched(selection, exact):
+    # Folded tables (an unfiltered streamed view) already count exactly without a scan
+    return not exact and selection["sketch_view"] is not None and selection["rows"].folded("weekday") is None
+
+def distinct_sources(selection):
+    return selection["sketches"], selection["sketch_view"], selection["sketch_edges"]
+
+def order_total(selection, exact=False):
+    if not distinct_sketched(selection, exact):
+        return order_count(selection["signature"], selection["rows"])
+    return int(distinct_table(selection["signature"], distinct_sources(selection), ())["Order ID"].iloc[0])
+
+def weekday_summary(selection, exact=False):
+    return weekday_table(selection["signature"], selection["rows"])
+
+def segment_summary(selection, exact=False):
+    signature, cube_view = selection["signature"], selection["cube_view"]
+    if not distinct_sketched(selection, exact):
+        return segment_table(signature, (selection["rows"], cube_view))
+    counts = distinct_table(signature, distinct_sources(selection), ("Segment",))
+    return segment_frame(cube_view, counts[["Segment", "Customer ID", "Order ID"]])
+
+def ship_performance_summary(selection, exact=False):
+    signature = selection["signature"]
+    if not distinct_sketched(selection, exact):
+        return ship_performance_table(signature, selection["rows"])
+    rollup = cube_rollup_table(signature, selection["cube_view"], ("Ship Mode",))
+    counts = distinct_table(signature, distinct_sources(selection), ("Ship Mode",))
+    ship_perf = rollup[["Ship Mode", "Sales", "Profit", "Profit Margin"]].merge(counts[["Ship Mode", "Order ID"]], on="Ship Mode")
+    return ship_perf[["Ship Mode", "Sales", "Profit", "Order ID", "Profit Margin"]]
+
+# Top/Bottom rankings. One partial selection per table and metric yields both ends
+# at the largest depth the sliders allow; the result is memoized with the aggregates,
+# so moving a slider only slices it and switching metrics ranks at most once each.
+RANK_DEPTH = 20
+# Columns each ranked table can be sorted by
+RANK_METRICS = {
+    "product": ["Sales", "Profit", "Quantity", "Order ID"],
+    "customer": ["Sales", "Profit", "Order ID", "Avg. Order Value"],
+    "city": ["Sales", "Profit", "Order ID"]
+}
+
+def rank_extremes(values, k):
+    # Positions of the k largest and k smallest values, each in rank order; ties keep
+    # table order and missing values are never ranked
+    valid = np.flatnonzero(~np.isnan(values))
+    values = values[valid]
+    n = len(values)
+    k = min(k, n)
+    if k == 0:
+        return valid[:0], valid[:0]
+    if 2 * k < n:
+        # Two single-pivot partitions find the k-th smallest and largest values;
+        # everything tied with them competes, so ties break by table order
+        low = np.flatnonzero(values <= np.partition(values, k - 1)[k - 1])
+        high = np.flatnonzero(values >= np.partition(values, n - k)[n - k])
+    else:
+        low = high = np.arange(n)
+    top = high[np.lexsort((high, -values[high]))][:k]
+    bottom = low[np.lexsort((low, values[low]))][:k]
+    return valid[top], valid[bottom]
+
+@memoize_by_signature
+def table_ranking(table, name, metric):
+    # name identifies the aggregate table in the cache key
+    return rank_extremes(table[metric].to_numpy(dtype=float), RANK_DEPTH)
+
+@memoize_by_signature
+def margin_histogram(rows):
+    counts, edges = np.histogram(finite_values(rows(["Profit Margin"])["Profit Margin"]), bins=MARGIN_BINS)
+    return counts, edges
+
+@memoize_by_signature
+def margin_cube_histogram(margin_view, edges):
+    counts = margin_view.groupby("Margin Bin")["Rows"].sum().reindex(range(len(edges) - 1), fill_value=0)
+    return counts.to_numpy(), np.asarray(edges)
+
+def histogram_quantiles(counts, bins, quantiles):
+    # Linear interpolation between order statistics, like pandas; an order statistic
+    # is placed inside its bin by its rank among the bin's rows
+    total = counts.sum()
+    if total <= 0:
+        return [np.nan] * len(quantiles)
+    edges = bins["edges"]
+    cumulative = np.cumsum(counts)
+
+    def order_statistic(rank):
+        b = min(int(np.searchsorted(cumulative, rank, side="right")), len(counts) - 1)
+        if bins["points"]:
+            return edges[b]
+        position = np.clip((rank - cumulative[b] + counts[b] + 0.5) / counts[b], 0, 1) if counts[b] else 0.5
+        return edges[b] + position * (edges[b + 1] - edges[b])
+
+    estimates = []
+    for quantile in quantiles:
+        rank = quantile * max(total - 1, 0)
+        low = np.floor(rank)
+        lower = order_statistic(low)
+        upper = order_statistic(min(low + 1, max(total - 1, 0)))
+        estimates.append(lower + (rank - low) * (upper - lower))
+    return estimates
+
+def statistics_histogram(statistics, stats_view, filters):
+    # Weighted per-bin row counts of the selection, one array per column indexed by bin
+    start_date, end_date, selections = filters
+    layout = statistics["layout"]
+    columns = layout["describe"]
+    histogram = statistics["histogram"]
+    selected = np.ones(len(histogram), dtype=bool)
+    for dim, values in selections.items():
+        selected &= histogram[dim].isin(values).to_numpy()
+    if start_date is not None:
+        first_month, last_month = (pd.Timestamp(date).to_period("M").start_time for date in (start_date, end_date))
+        selected &= ((histogram["Month"] >= first_month) & (histogram["Month"] <= last_month)).to_numpy()
+    histogram = histogram[selected]
+    rows = histogram["Rows"].to_numpy(dtype=float)
+    column_codes = pd.Categorical(histogram["Column"], categories=columns).codes.astype(np.int64)
+    if start_date is not None:
+        # Months the date range only partly covers count with the share of their rows
+        # it keeps. Both sides are keyed by one integer per (month, cell, column), built
+        # from month numbers and the histogram's category codes, and summed with bincount.
+        first = first_month.year * 12 + first_month.month
+        cells = (last_month.year * 12 + last_month.month) - first + 1
+        histogram_cell = (histogram["Month"].dt.year * 12 + histogram["Month"].dt.month).to_numpy() - first
+        view_cell = (stats_view["Order Date"].dt.year * 12 + stats_view["Order Date"].dt.month).to_numpy() - first
+        for dim in FILTER_DIMENSIONS:
+            categories = histogram[dim].astype("category").cat.categories
+            codes = pd.Categorical(stats_view[dim], categories=categories).codes
+            view_cell = np.where(codes >= 0, view_cell * len(categories) + codes, -1)
+            histogram_cell = histogram_cell * len(categories) + pd.Categorical(histogram[dim], categories=categories).codes
+            cells *= len(categories)
+        in_view = view_cell >= 0
+        kept = np.column_stack([
+            np.bincount(view_cell[in_view], weights=stats_view[f"{col} Count"].to_numpy()[in_view], minlength=cells)
+            for col in columns
+        ]).ravel()
+        slots = histogram_cell * len(columns) + column_codes
+        total = np.bincount(slots, weights=rows, minlength=cells * len(columns))
+        rows = rows * kept[slots] / total[slots]
+    width = max((len(layout["bins"][col]["edges"]) for col in columns), default=1)
+    counts = np.bincount(
+        column_codes * width + histogram["Bin"].to_numpy(), weights=rows, minlength=len(columns) * width
+    ).reshape(len(columns), width)
+    return {col: counts[i, :len(layout["bins"][col]["edges"])] for i, col in enumerate(columns)}
+
+def centered_square_sum(squares, total, count):
+    # Sum of squared deviations from the mean; cancellation below a relative 1e-12 is
+    # rounding noise of a constant column
+    with np.errstate(divide="ignore", invalid="ignore"):
+        centered = squares - total * total / count
+    return np.where(centered > squares * 1e-12, centered, 0.0)
+
+@memoize_by_signature
+def statistics_summary(sources):
+    # Describe table and correlation matrix of the selection from the statistics cube,
+    # shaped like DataFrame.describe() and DataFrame.corr() on its rows
+    statistics, stats_view, filters = sources
+    layout = statistics["layout"]
+    spec = statistics_merge_spec(layout)
+    totals = stats_view[list(spec)].agg(spec)
+    histogram = statistics_histogram(statistics, stats_view, filters)
+
+    describe = {}
+    for col in layout["describe"]:
+        shift = layout["shift"][col]
+        count, total, squares = totals[f"{col} Count"], totals[f"{col} Sum"], totals[f"{col} Sum Sq"]
+        low, high = totals[f"{col} Min"] + shift, totals[f"{col} Max"] + shift
+        mean = shift + total / count if count else np.nan
+        variance = centered_square_sum(squares, total, count) / (count - 1) if count > 1 else np.nan
+        bins = layout["bins"][col]
+        quantiles = np.clip(histogram_quantiles(histogram[col], bins, STATISTICS_QUANTILES), low, high)
+        describe[col] = [count, mean, np.sqrt(variance), low, *quantiles, high]
+    index = ["count", "mean", "std", "min"] + [f"{quantile:.0%}" for quantile in STATISTICS_QUANTILES] + ["max"]
+    table = pd.DataFrame(describe, index=index, columns=layout["describe"])
+    if layout["dates"]:
+        # describe() reports dates without a std, and after the other statistics
+        table = table.reindex(index[:2] + index[3:] + index[2:3])
+        for col in layout["dates"]:
+            table[col] = [
+                int(value) if label == "count" else (pd.NaT if np.isnan(value) else pd.Timestamp(round(value), unit="ns").round("us"))
+                if label != "std" else np.nan
+                for label, value in table[col].items()
+            ]
+
+    columns = layout["corr"]
+    corr = None
+    if len(columns) > 1:
+        rows = totals["Complete Rows"]
+        sums = np.array([totals[f"{col} Complete Sum"] for col in columns])
+        products = np.empty((len(columns), len(columns)))
+        for i, col in enumerate(columns):
+            for j in range(i, len(columns)):
+                products[i, j] = products[j, i] = totals[f"{col} x {columns[j]}"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            covariance = products - np.outer(sums, sums) / rows
+            spread = np.sqrt(centered_square_sum(np.diag(products), sums, rows))
+            matrix = np.clip(covariance / np.outer(spread, spread), -1, 1)
+        np.fill_diagonal(matrix, 1.0)
+        # Like DataFrame.corr(), constant columns and fewer than two rows give NaN
+        constant = ~(spread > 0) | (rows < 2)
+        matrix[constant, :] = np.nan
+        matrix[:, constant] = np.nan
+        corr = pd.DataFrame(matrix, index=columns, columns=columns)
+    return table, corr
+
+# Exports are only produced when the download button is clicked, written chunk by
+# chunk, and kept for the last few filter signatures so repeat downloads are instant
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "CSV (gzip)": ("csv.gz", "application/gzip"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet")
+}
+EXPORT_CHUNK_ROWS = 100_000
+EXPORT_CACHE_SIZE = 4
+
+@memoize_by_signature(maxsize=EXPORT_CACHE_SIZE)
+def export_file(rows, export_format):
+    buffer = io.BytesIO()
+    if export_format == "Parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        writer = None
+        for chunk in rows.iter_chunks(EXPORT_CHUNK_ROWS):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(buffer, table.schema)
+            writer.write_table(table.cast(writer.schema))
+        if writer is not None:
+            writer.close()
+        return buffer.getvalue()
+
+    sink = gzip.GzipFile(fileobj=buffer, mode="wb") if export_format == "CSV (gzip)" else buffer
+    for number, chunk in enumerate(rows.iter_chunks(EXPORT_CHUNK_ROWS)):
+        sink.write(chunk.to_csv(index=False, header=number == 0).encode('utf-8'))
+    if sink is not buffer:
+        sink.close()
+    return buffer.getvalue()
+
+# Data Explorer paging. Only the sort and search columns of the selection are read to
+# work out the row order; the page itself is materialized by position.
+EXPLORER_PAGE_SIZES = [25, 50, 100, 250, 1000]
+
+@memoize_by_signature
+def explorer_positions(rows, sort_col, descending, search_col, query):
+    key_cols = list(dict.fromkeys(col for col in (sort_col, search_col if query else None) if col))
+    if not key_cols:
+        return np.arange(rows.count())
+    keys = rows(key_cols).reset_index(drop=True)
+    if query:
+        column = keys[search_col]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            # Match the categories once instead of every row
+            hits = column.cat.categories.astype(str).str.contains(query, case=False, regex=False)
+            matches = column.cat.codes.isin(np.flatnonzero(hits))
+        else:
+            matches = column.astype(str).str.contains(query, case=False, regex=False)
+        keys = keys[matches.to_numpy()]
+    if sort_col:
+        keys = keys.sort_values(sort_col, ascending=not descending, kind="stable", na_position="last")
+    return keys.index.to_numpy()
+
+# Streaming ingestion for order files that do not fit in memory. The CSV is read in
+# bounded chunks; each chunk is appended to an on-disk Parquet row store and folded
+# into the cube and the per-entity tables the dashboard shows for the default view,
+# so peak memory is one chunk plus the aggregates. Select with SUPERSTORE_INGEST=stream.
+# The folded order counts are exact only when every order's lines are adjacent in the
+# file, as in the Superstore export; ingest checks this and, for a file where they are
+# not, drops the folded tables so the default view is counted from the row store too.
+INGEST_MODE = os.environ.get("SUPERSTORE_INGEST", "memory")
+CHUNK_ROWS = int(os.environ.get("SUPERSTORE_CHUNK_ROWS", 250_000))
+STREAM_DIR = os.path.join(SNAPSHOT_DIR, "stream")
+STREAM_MANIFEST_PATH = os.path.join(STREAM_DIR, "manifest.json")
+ROW_STORE_PATH = os.path.join(STREAM_DIR, "rows.parquet")
+STREAM_CUBE_PATH = os.path.join(STREAM_DIR, "cube.parquet")
+STREAM_SKETCH_CELLS_PATH = os.path.join(STREAM_DIR, "distinct_sketch_cells.parquet")
+STREAM_SKETCH_REGISTERS_PATH = os.path.join(STREAM_DIR, "distinct_sketch_registers.npy")
+
+# Folded tables: group keys per table. Order counts are folded as per-chunk distinct
+# counts, which add up exactly as long as no order has lines in two chunks.
+FOLDED_TABLES = {
+    "product": ["Product Name"],
+    "customer": ["Customer ID", "Customer Name"],
+    "geo": ["Region", "State"],
+    "city": ["Region", "State", "City"],
+    "ship_mode": ["Ship Mode"],
+    "segment": ["Segment"],
+    "weekday": ["Order Day of Week"],
+    "segment_customers": ["Segment", "Customer ID"]
+}
+
+def fold_chunk(df, keys):
+    return df.groupby(keys, observed=True).agg(**{
+        "Sales": ("Sales", "sum"),
+        "Profit": ("Profit", "sum"),
+        "Quantity": ("Quantity", "sum"),
+        "Profit Margin Sum": ("Profit Margin", "sum"),
+        "Profit Margin Count": ("Profit Margin", "count"),
+        "Order ID": ("Order ID", "nunique")
+    }).reset_index()
+
+def merge_folded(total, part, keys):
+    if total is None:
+        return part
+    merged = pd.concat([total, part], ignore_index=True)
+    return merged.groupby(keys, observed=True, sort=False).sum().reset_index()
+
+def split_trailing_order(chunk):
+    # Rows of the last order in the chunk may continue in the next one, so they are held
+    # back; this keeps an order in one chunk only if its lines are adjacent in the file
+    order_ids = chunk["Order ID"].to_numpy()
+    earlier = np.flatnonzero(order_ids != order_ids[-1])
+    split = earlier[-1] + 1 if len(earlier) else 0
+    return chunk.iloc[:split], chunk.iloc[split:]
+
+def seen_before(runs, values):
+    # Whether any of values was passed in an earlier call. The 64-bit hashes seen so far
+    # are kept as sorted runs, merged whenever a run is no longer than twice the next
+    # one, so there are O(log n) runs to binary-search and each hash is merged O(log n)
+    # times; that is 8 bytes per distinct value rather than the values themselves.
+    hashes = np.unique(pd.util.hash_pandas_object(values, index=False).to_numpy())
+    repeated = any(
+        (run[np.minimum(np.searchsorted(run, hashes), len(run) - 1)] == hashes).any() for run in runs
+    )
+    runs.append(hashes)
+    while len(runs) > 1 and len(runs[-2]) <= 2 * len(runs[-1]):
+        last = runs.pop()
+        runs[-1] = np.union1d(runs[-1], last)
+    return repeated
+
+def stream_ingest(path, chunk_rows=CHUNK_ROWS):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(STREAM_DIR, exist_ok=True)
+    cube = None
+    folded = dict.fromkeys(FOLDED_TABLES)
+    order_runs = []
+    sketches = None
+    rows = 0
+    writer = None
+    carry = None
+    reader = pd.read_csv(path, encoding="latin-1", chunksize=chunk_rows)
+    with replacing(ROW_STORE_PATH) as row_store_path:
+        try:
+            for chunk in itertools.chain(reader, [None]):
+                if chunk is None:
+                    batch, carry = carry, None
+                else:
+                    if carry is not None:
+                        chunk = pd.concat([carry, chunk], ignore_index=True)
+                    batch, carry = split_trailing_order(chunk)
+                if batch is None or batch.empty:
+                    continue
+                batch = apply_schema(derive_columns(batch.copy()))
+                rows += len(batch)
+                # Dimensions are stored as plain strings so every row group shares one schema
+                table = pa.Table.from_pandas(
+                    batch.astype({col: str for col in CATEGORY_COLUMNS if col in batch.columns}),
+                    preserve_index=False
+                )
+                if writer is None:
+                    writer = pq.ParquetWriter(row_store_path, table.schema)
+                writer.write_table(table.cast(writer.schema))
+                cube = merge_folded(cube, build_cube(batch), CUBE_DIMENSIONS)
+                if folded is not None and seen_before(order_runs, batch["Order ID"]):
+                    # An order continues in a later chunk, so summed chunk counts would
+                    # count it twice
+                    folded, order_runs = None, None
+                if folded is not None:
+                    for name, keys in FOLDED_TABLES.items():
+                        folded[name] = merge_folded(folded[name], fold_chunk(batch, keys), keys)
+                if DISTINCT_SKETCH:
+                    # Merged as the chunks arrive, so only one chunk's sketch is held besides
+                    # the running one
+                    sketches = merge_sketches([sketches, build_sketches(batch)])
+        finally:
+            if writer is not None:
+                writer.close()
+    cube = cube.sort_values("Order Date", ignore_index=True)
+    with replacing(STREAM_CUBE_PATH) as tmp_path:
+        cube.to_parquet(tmp_path, index=False)
+    for name in FOLDED_TABLES:
+        folded_path = os.path.join(STREAM_DIR, f"{name}.parquet")
+        if folded is not None:
+            with replacing(folded_path) as tmp_path:
+                folded[name].to_parquet(tmp_path, index=False)
+        elif os.path.exists(folded_path):
+            os.remove(folded_path)
+    # Chunks split on order boundaries, but a customer's orders span chunks, so the
+    # chunk sketches are merged by register maximum rather than summed. The total row
+    # count is only known now, so a file too small to sketch drops them here.
+    if sketches is not None and rows >= DISTINCT_MIN_ROWS:
+        write_sketches(sketches, STREAM_SKETCH_CELLS_PATH, STREAM_SKETCH_REGISTERS_PATH)
+        sketches = read_sketches(STREAM_SKETCH_CELLS_PATH, STREAM_SKETCH_REGISTERS_PATH)
+    else:
+        sketches = None
+        if os.path.exists(STREAM_SKETCH_CELLS_PATH):
+            os.remove(STREAM_SKETCH_CELLS_PATH)
+    return cube, folded, sketches
+
+def load_stream_store(path=DATA_PATH):
+    manifest = read_manifest(STREAM_MANIFEST_PATH)
+    current, fingerprint = snapshot_is_current(manifest, path, ROW_STORE_PATH)
+    if not current:
+        with rebuild_lock():
+            # Another process may have ingested the file while this one waited
+            manifest = read_manifest(STREAM_MANIFEST_PATH)
+            current, fingerprint = snapshot_is_current(manifest, path, ROW_STORE_PATH)
+            if not current:
+                fingerprint = fingerprint or source_fingerprint(path)
+                cube, folded, sketches = stream_ingest(path)
+                write_manifest({**fingerprint, "folded": folded is not None}, STREAM_MANIFEST_PATH)
+                return cube, folded, sketches, fingerprint["sha256"]
+    cube = pd.read_parquet(STREAM_CUBE_PATH)
+    folded = {
+        name: pd.read_parquet(os.path.join(STREAM_DIR, f"{name}.parquet")) for name in FOLDED_TABLES
+    } if manifest.get("folded", True) else None
+    sketches = read_sketches(STREAM_SKETCH_CELLS_PATH, STREAM_SKETCH_REGISTERS_PATH) if DISTINCT_SKETCH and os.path.exists(STREAM_SKETCH_CELLS_PATH) else None
+    if fingerprint is not manifest:
+        write_manifest({**fingerprint, "folded": folded is not None}, STREAM_MANIFEST_PATH)
+    return cube, folded, sketches, fingerprint["sha256"]
+
+def row_store_scanner(path, filters, columns=None, batch_size=None):
+    # Reads only the requested columns of the matching rows; the filter is evaluated
+    # row group by row group inside Arrow
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+
+    start_date, end_date, selections = filters
+    expression = None
+    for dim, selected in selections.items():
+        # An empty value set has no type to bind against, and matches nothing anyway
+        condition = ds.field(dim).isin([str(value) for value in selected]) if selected else pc.scalar(False)
+        expression = condition if expression is None else expression & condition
+    if start_date is not None:
+        expression &= (ds.field("Order Date") >= start_date) & (ds.field("Order Date") <= end_date)
+    options = {} if batch_size is None else {"batch_size": batch_size}
+    return ds.dataset(path, format="parquet").scanner(columns=columns, filter=expression, **options)
+
+def read_row_store(path, filters, columns=None):
+    return apply_schema(row_store_scanner(path, filters, columns).to_table().to_pandas())
+
+# Parallel aggregation. Grouped tables over at least PARALLEL_ROW_THRESHOLD rows are
+# split across a process pool: the key codes and value columns are copied once into
+# a shared memory block, each worker maps it, keeps the rows whose group key hashes
+# to its partition and aggregates them with the same pandas groupby, and the
+# partial tables are concatenated. Every group lives in exactly one partition with
+# its rows in their original order, so the result is the serial result. Smaller
+# selections, or SUPERSTORE_WORKERS=1, stay serial.
+def available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+PARALLEL_ROW_THRESHOLD = int(os.environ.get("SUPERSTORE_PARALLEL_ROWS", 2_000_000))
+PARALLEL_WORKERS = int(os.environ.get("SUPERSTORE_WORKERS", min(available_cpus(), 8)))
+PARALLEL_POOL = {"lock": threading.Lock(), "executor": None}
+# Multiplicative hashing spreads consecutive key codes over the partitions
+PARTITION_HASH = np.uint64(0x9E3779B97F4A7C15)
+
+def parallel_executor():
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+
+    with PARALLEL_POOL["lock"]:
+        if PARALLEL_POOL["executor"] is None:
+            # Spawned rather than forked: the dashboard process runs threads
+            PARALLEL_POOL["executor"] = ProcessPoolExecutor(
+                PARALLEL_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return PARALLEL_POOL["executor"]
+
+def shared_arrays(shm, layout):
+    return {
+        name: np.ndarray((length,), dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+        for name, (offset, dtype, length) in layout.items()
+    }
+
+def aggregate_partition(block, layout, keys, cardinalities, spec, partition, partitions):
+    from multiprocessing import shared_memory
+
+    shm = shared_memory.SharedMemory(name=block)
+    try:
+        arrays = shared_arrays(shm, layout)
+        group = np.zeros(len(arrays[keys[0]]), dtype=np.uint64)
+        valid = np.ones(len(group), dtype=bool)
+        for key, cardinality in zip(keys, cardinalities):
+            codes = arrays[key]
+            valid &= codes >= 0
+            group = group * np.uint64(cardinality) + codes.astype(np.uint64)
+        mask = valid & ((group * PARTITION_HASH) % np.uint64(partitions) == partition)
+        part = pd.DataFrame({name: arrays[name][mask] for name in layout})
+        del arrays, codes
+    finally:
+        shm.close()
+    if part.empty:
+        return None
+    return part.groupby(keys, sort=False).agg(spec).reset_index()
+
+def parallel_aggregate(frame, keys, spec):
+    # None when the grouping does not qualify; the caller then aggregates serially
+    from concurrent.futures.process import BrokenProcessPool
+    from multiprocessing import shared_memory
+
+    if not all(isinstance(frame[key].dtype, pd.CategoricalDtype) for key in keys):
+        return None
+    cardinalities = [max(len(frame[key].cat.categories), 1) for key in keys]
+    if np.prod(cardinalities, dtype=float) >= 2 ** 63:
+        return None
+    columns = {key: frame[key].cat.codes.to_numpy() for key in keys}
+    for column in spec:
+        values = frame[column]
+        if spec[column] == "nunique" or not pd.api.types.is_numeric_dtype(values.dtype):
+            # Distinct counts only need equal values to stay equal, so codes do;
+            # missing values become NaN, which nunique skips
+            codes = values.cat.codes.to_numpy() if isinstance(values.dtype, pd.CategoricalDtype) else pd.factorize(values)[0]
+            columns[column] = np.where(codes < 0, np.nan, codes)
+        else:
+            columns[column] = values.to_numpy()
+
+    layout, offset = {}, 0
+    for name, array in columns.items():
+        layout[name] = (offset, array.dtype.str, len(array))
+        offset += -(-array.nbytes // 8) * 8
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    try:
+        for name, target in shared_arrays(shm, layout).items():
+            target[:] = columns[name]
+        del target
+        executor = parallel_executor()
+        try:
+            parts = list(executor.map(
+                aggregate_partition,
+                *zip(*[
+                    (shm.name, layout, keys, cardinalities, spec, partition, PARALLEL_WORKERS)
+                    for partition in range(PARALLEL_WORKERS)
+                ])
+            ))
+        except BrokenProcessPool:
+            with PARALLEL_POOL["lock"]:
+                PARALLEL_POOL["executor"] = None
+            return None
+    finally:
+        shm.close()
+        shm.unlink()
+
+    parts = [part for part in parts if part is not None]
+    if not parts:
+        return None
+    # Groupby sorts groups by category code, so sorting the codes restores its order
+    table = pd.concat(parts, ignore_index=True).sort_values(keys, ignore_index=True)
+    for key in keys:
+        table[key] = pd.Categorical.from_codes(table[key], dtype=frame[key].dtype)
+    return table
+
+class FilteredRows:
+    # Row-level access to the current sidebar selection. Aggregations ask for just the
+    # columns they need: in memory mode that is a projection of the shared frame's
+    # date slice through the selection mask, followed by the appended rows' once order
+    # batches have come in, in stream mode a filtered read of the row store. A session
+    # only keeps the masks; filtered rows exist while an aggregate runs. The default,
+    # unfiltered view additionally exposes the tables folded during ingestion so no
+    # rows are read.
+    pushdown = False
+
+    def __init__(self, parts=None, store=None, filters=None, folded_tables=None):
+        # parts: (frame, mask) pairs, mask None when the selection keeps every row
+        self.parts = parts
+        self.store = store
+        self.filters = filters
+        self.folded_tables = folded_tables
+
+    def projections(self, columns):
+        for frame, mask in self.parts:
+            frame = frame if columns is None else frame[columns]
+            yield frame if mask is None else frame[mask]
+
+    def __call__(self, columns=None):
+        if self.parts is not None:
+            return concat_parts(list(self.projections(columns)))
+        return read_row_store(self.store, self.filters, columns)
+
+    def columns(self):
+        if self.parts is not None:
+            return self.parts[0][0].columns.tolist()
+        return row_store_scanner(self.store, self.filters).projected_schema.names
+
+    def count(self):
+        if self.parts is not None:
+            return sum(len(frame) if mask is None else int(np.count_nonzero(mask)) for frame, mask in self.parts)
+        return row_store_scanner(self.store, self.filters).count_rows()
+
+    def part_positions(self):
+        return [np.arange(len(frame)) if mask is None else np.flatnonzero(mask) for frame, mask in self.parts]
+
+    def take(self, positions, columns=None):
+        # Materializes only the given row positions of the selection, in that order
+        if self.parts is not None:
+            positions = np.asarray(positions, dtype=np.int64)
+            part_positions = self.part_positions()
+            bounds = np.cumsum([0] + [len(selected) for selected in part_positions])
+            part = np.searchsorted(bounds, positions, side="right") - 1
+            pieces, order = [], []
+            for i, ((frame, _), selected) in enumerate(zip(self.parts, part_positions)):
+                chosen = np.flatnonzero(part == i)
+                frame = frame if columns is None else frame[columns]
+                pieces.append(frame.iloc[selected[positions[chosen] - bounds[i]]])
+                order.append(chosen)
+            return concat_parts(pieces).iloc[np.argsort(np.concatenate(order), kind="stable")]
+        return apply_schema(row_store_scanner(self.store, self.filters, columns).take(positions).to_pandas())
+
+    def iter_chunks(self, chunk_rows):
+        # Always yields at least one (possibly empty) chunk so writers see the columns
+        if self.parts is not None:
+            dtypes = self.parts[-1][0].dtypes
+            empty = True
+            for (frame, _), positions in zip(self.parts, self.part_positions()):
+                for start in range(0, len(positions), chunk_rows):
+                    empty = False
+                    yield widen_categories(frame.iloc[positions[start:start + chunk_rows]], dtypes)
+            if empty:
+                yield self.parts[0][0].iloc[:0]
+            return
+        scanner = row_store_scanner(self.store, self.filters, batch_size=chunk_rows)
+        empty = True
+        for batch in scanner.to_batches():
+            if batch.num_rows or empty:
+                empty = False
+                yield apply_schema(batch.to_pandas())
+        if empty:
+            yield apply_schema(scanner.projected_schema.empty_table().to_pandas())
+
+    def aggregate(self, keys, spec):
+        # Grouped table of the selection; spec maps columns to "sum", "mean" or "nunique"
+        frame = self(keys + list(spec))
+        if len(frame) >= PARALLEL_ROW_THRESHOLD and PARALLEL_WORKERS > 1:
+            table = parallel_aggregate(frame, keys, spec)
+            if table is not None:
+                return table
+        return frame.groupby(keys, observed=True).agg(spec).reset_index()
+
+    def nunique(self, column):
+        return self([column])[column].nunique()
+
+    def folded(self, name):
+        return None if self.folded_tables is None else self.folded_tables[name]
+
+# Optional SQL backend. With SUPERSTORE_BACKEND=duckdb the sidebar filter becomes a
+# WHERE clause and the grouped tables run as SQL in DuckDB over the view's files (the
+# mapped Arrow snapshot in memory mode, the Parquet row store in stream mode), so only
+# result tables are converted to pandas. Once order batches have been appended the
+# snapshot is out of date and the in-memory frame is queried through Arrow instead. Results
+# are given the dtypes and row order the pandas path produces, and float sums use
+# compensated summation as pandas does.
+BACKEND = os.environ.get("SUPERSTORE_BACKEND", "pandas")
+SQL_AGGREGATES = {
+    "sum": 'fsum("{column}")',
+    "mean": 'fsum("{column}") FILTER (WHERE NOT isnan("{column}")) / count("{column}") FILTER (WHERE NOT isnan("{column}"))',
+    "nunique": 'count(DISTINCT "{column}")'
+}
+SQL_SOURCES = {"lock": threading.Lock(), "sources": OrderedDict()}
+SQL_SOURCE_CACHE_SIZE = 2
+
+def sql_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def sql_literal(text):
+    return "'" + text.replace("'", "''") + "'"
+
+def arrow_reader(result, batch_rows=1_000_000):
+    # Newer DuckDB releases renamed fetch_record_batch and deprecated the old name
+    if hasattr(result, "to_arrow_reader"):
+        return result.to_arrow_reader(batch_rows)
+    return result.fetch_record_batch(batch_rows)
+
+def sql_source(view):
+    # One DuckDB connection per loaded dataset version, reused across reruns and sessions
+    with SQL_SOURCES["lock"]:
+        sources = SQL_SOURCES["sources"]
+        if view["source"] in sources:
+            sources.move_to_end(view["source"])
+            return sources[view["source"]]
+    try:
+        import duckdb
+    except ImportError as error:
+        raise RuntimeError("SUPERSTORE_BACKEND=duckdb needs the duckdb package (pip install duckdb)") from error
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    data, delta, parquet = view["data"], view["delta"], view["parquet"]
+    if parquet is not None:
+        table = None
+    elif view["snapshot"] is not None:
+        table = map_snapshot(view["snapshot"])
+    else:
+        table = pa.Table.from_pandas(data, preserve_index=False)
+    # Appended rows are a table of their own next to the mapped base
+    appended = None if delta is None else pa.Table.from_pandas(delta, preserve_index=False)
+
+    def connect():
+        connection = duckdb.connect()
+        if appended is not None:
+            connection.register("base_orders", table)
+            connection.register("appended_orders", appended)
+            connection.execute("CREATE VIEW orders AS SELECT * FROM base_orders UNION ALL BY NAME SELECT * FROM appended_orders")
+        elif parquet is None:
+            connection.register("orders", table)
+        else:
+            connection.execute(f"CREATE VIEW orders AS SELECT * FROM read_parquet({sql_literal(parquet)})")
+        return connection
+
+    if data is not None:
+        # Keys keep the frame's categories, which also fixes their sort order; the
+        # appended rows' extend the base frame's
+        dtypes = (data if delta is None else delta).dtypes.to_dict()
+    else:
+        # Categories are inferred from the rows read, like the pandas stream path does
+        dtypes = {
+            col: dtype for col, dtype in pq.read_schema(parquet).empty_table().to_pandas().dtypes.items()
+            if col not in CATEGORY_COLUMNS
+        }
+    source = {"lock": threading.Lock(), "connection": connect(), "connect": connect, "dtypes": dtypes}
+    with SQL_SOURCES["lock"]:
+        sources = SQL_SOURCES["sources"]
+        source = sources.setdefault(view["source"], source)
+        while len(sources) > SQL_SOURCE_CACHE_SIZE:
+            sources.popitem(last=False)
+    return source
+
+class SqlRows(FilteredRows):
+    # The selection as a DuckDB query against sql_source(); see FilteredRows
+    pushdown = True
+
+    def __init__(self, source, filters, folded_tables=None):
+        super().__init__(filters=filters, folded_tables=folded_tables)
+        self.source = source
+
+    def where(self):
+        start_date, end_date, selections = self.filters
+        clauses, params = [], []
+        for dim, selected in selections.items():
+            if not selected:
+                clauses.append("FALSE")
+                continue
+            clauses.append(f"{sql_identifier(dim)} IN ?")
+            params.append([str(value) for value in selected])
+        if start_date is not None:
+            clauses.append('"Order Date" >= ? AND "Order Date" <= ?')
+            params += [start_date, end_date]
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def query(self, sql, params):
+        with self.source["lock"]:
+            # Through Arrow, so the conversion matches the pandas path's reads
+            return arrow_reader(self.source["connection"].execute(sql, params)).read_all().to_pandas()
+
+    def conform(self, df):
+        dtypes = self.source["dtypes"]
+        df = apply_schema(df)
+        for col in df.columns:
+            dtype = dtypes.get(col)
+            if isinstance(dtype, pd.CategoricalDtype):
+                # Dtypes with the same categories in another order compare equal, and
+                # the order decides how pandas sorts groups, so it is set explicitly
+                df[col] = pd.Categorical(df[col], dtype=dtype)
+            elif dtype is not None and df[col].dtype != dtype:
+                df[col] = df[col].astype(dtype)
+        return df
+
+    def select_sql(self, columns):
+        where, params = self.where()
+        projection = "*" if columns is None else ", ".join(sql_identifier(col) for col in columns)
+        return f"SELECT {projection} FROM orders{where}", params
+
+    def __call__(self, columns=None):
+        return self.conform(self.query(*self.select_sql(columns)))
+
+    def columns(self):
+        return self.query("SELECT * FROM orders LIMIT 0", []).columns.tolist()
+
+    def count(self):
+        where, params = self.where()
+        return int(self.query(f"SELECT count(*) AS n FROM orders{where}", params)["n"].iloc[0])
+
+    def take(self, positions, columns=None):
+        sql, params = self.select_sql(columns)
+        page = self.query(
+            f"SELECT * FROM (SELECT *, row_number() OVER () - 1 AS __position FROM ({sql})) "
+            "WHERE __position IN (SELECT unnest(?))",
+            params + [[int(position) for position in positions]]
+        )
+        page = page.set_index("__position").reindex(np.asarray(positions, dtype=np.int64))
+        return self.conform(page.reset_index(drop=True))
+
+    def iter_chunks(self, chunk_rows):
+        # A connection of its own, since the result is read while other queries run
+        connection = self.source["connect"]()
+        try:
+            reader = arrow_reader(connection.execute(*self.select_sql(None)), chunk_rows)
+            empty = True
+            for batch in reader:
+                if batch.num_rows or empty:
+                    empty = False
+                    yield self.conform(batch.to_pandas())
+            if empty:
+                yield self.conform(reader.schema.empty_table().to_pandas())
+        finally:
+            connection.close()
+
+    def aggregate(self, keys, spec):
+        where, params = self.where()
+        not_null = " AND ".join(f"{sql_identifier(key)} IS NOT NULL" for key in keys)
+        where = f"{where} AND {not_null}" if where else f" WHERE {not_null}"
+        key_sql = ", ".join(sql_identifier(key) for key in keys)
+        aggregates = ", ".join(
+            f"{SQL_AGGREGATES[func].format(column=column)} AS {sql_identifier(column)}" for column, func in spec.items()
+        )
+        table = self.query(f"SELECT {key_sql}, {aggregates} FROM orders{where} GROUP BY {key_sql}", params)
+        if table.empty:
+            # Nothing to transfer, and pandas has its own dtypes for empty groupings
+            return super().aggregate(keys, spec)
+        values = table[list(spec)].copy()
+        for column, func in spec.items():
+            dtype = self.source["dtypes"].get(column)
+            if func == "sum" and pd.api.types.is_integer_dtype(dtype):
+                # pandas hands integer sums back in the column's own type when they fit
+                limits = np.iinfo(dtype)
+                fits = values[column].between(limits.min, limits.max).all()
+                values[column] = values[column].astype(dtype if fits else "int64")
+            else:
+                values[column] = values[column].astype("int64" if func == "nunique" else "float64")
+        return pd.concat([self.conform(table[keys]), values], axis=1).sort_values(keys, ignore_index=True)
+
+    def nunique(self, column):
+        where, params = self.where()
+        return int(self.query(f"SELECT count(DISTINCT {sql_identifier(column)}) AS n FROM orders{where}", params)["n"].iloc[0])
+
+# Incremental order batches. New CSV drops in SUPERSTORE_INCOMING_DIR are parsed on
+# their own, de-duplicated against the loaded history and appended to the shared
+# store, with the cube and filter index updated by the delta instead of a reload.
+# Parsed batches are kept as Parquet next to the snapshot so a restart does not
+# parse them again.
+INCOMING_DIR = os.environ.get("SUPERSTORE_INCOMING_DIR", "incoming")
+BATCH_DIR = os.path.join(SNAPSHOT_DIR, "batches")
+BATCH_MANIFEST_PATH = os.path.join(BATCH_DIR, "manifest.json")
+DEDUP_KEYS = ["Row ID", "Order ID"]
+# Files modified more recently than this are assumed to still be being written
+BATCH_SETTLE_SECONDS = 2
+
+def row_keys(df):
+    return pd.util.hash_pandas_object(df[DEDUP_KEYS].astype(str), index=False).to_numpy()
+
+def snapshot_keys(data, snapshot):
+    # Sorted keys of the snapshot rows, saved next to it and mapped like it, so a
+    # process start neither re-hashes every row nor holds its own copy
+    if snapshot is not None:
+        try:
+            return np.load(KEYS_PATH, mmap_mode="r")
+        except (OSError, ValueError):
+            pass
+    keys = np.sort(row_keys(data))
+    if snapshot is not None:
+        try:
+            with replacing(KEYS_PATH) as tmp_path, open(tmp_path, "wb") as fh:
+                np.save(fh, keys)
+        except OSError:
+            pass
+    return keys
+
+def snapshot_statistics(data, snapshot):
+    # The statistics cube of the snapshot rows, saved next to it like the keys; the
+    # layout is written last, so a half-written cube is never read back
+    if snapshot is not None:
+        try:
+            with open(STATISTICS_LAYOUT_PATH) as fh:
+                layout = json.load(fh)
+            for bins in layout["bins"].values():
+                bins["edges"] = np.array(bins["edges"], dtype=float)
+            return {
+                "layout": layout,
+                "cells": pd.read_parquet(STATISTICS_CELLS_PATH),
+                "histogram": pd.read_parquet(STATISTICS_HISTOGRAM_PATH)
+            }
+        except (OSError, ValueError, KeyError):
+            pass
+    statistics = build_statistics(data, statistics_layout(data))
+    if snapshot is not None:
+        try:
+            with replacing(STATISTICS_CELLS_PATH) as tmp_path:
+                statistics["cells"].to_parquet(tmp_path, index=False)
+            with replacing(STATISTICS_HISTOGRAM_PATH) as tmp_path:
+                statistics["histogram"].to_parquet(tmp_path, index=False)
+            layout = statistics["layout"]
+            with replacing(STATISTICS_LAYOUT_PATH) as tmp_path, open(tmp_path, "w") as fh:
+                json.dump({
+                    **layout,
+                    "bins": {col: {**bins, "edges": bins["edges"].tolist()} for col, bins in layout["bins"].items()}
+                }, fh)
+        except OSError:
+            pass
+    return statistics
+
+def write_sketches(sketches, cells_path, registers_path):
+    # The registers are written first and the cells last, so a half-written pair is
+    # never read back; the registers are mapped like the keys
+    with replacing(registers_path) as tmp_path, open(tmp_path, "wb") as fh:
+        np.save(fh, sketches["registers"])
+    with replacing(cells_path) as tmp_path:
+        sketches["cells"].to_parquet(tmp_path, index=False)
+
+def read_sketches(cells_path, registers_path):
+    cells = pd.read_parquet(cells_path)
+    registers = np.load(registers_path, mmap_mode="r")
+    if registers.shape != (len(cells), len(DISTINCT_COLUMNS), 1 << DISTINCT_PRECISION):
+        raise ValueError(f"{registers_path} does not match {cells_path}")
+    return {"cells": cells, "registers": registers}
+
+def snapshot_sketches(data, snapshot):
+    # Distinct-count sketches of the snapshot rows, saved next to it like the keys
+    if snapshot is not None:
+        try:
+            return read_sketches(SKETCH_CELLS_PATH, SKETCH_REGISTERS_PATH)
+        except (OSError, ValueError):
+            pass
+    if len(data) < DISTINCT_MIN_ROWS:
+        return None
+    sketches = build_sketches(data)
+    if snapshot is not None:
+        try:
+            write_sketches(sketches, SKETCH_CELLS_PATH, SKETCH_REGISTERS_PATH)
+            sketches = read_sketches(SKETCH_CELLS_PATH, SKETCH_REGISTERS_PATH)
+        except (OSError, ValueError):
+            pass
+    return sketches
+
+def extend_categories(base, batch):
+    # Extend the categories of the large frame instead of re-coding it, so existing
+    # codes stay valid and concat keeps the categorical dtype
+    batch = batch.copy()
+    base_updates = {}
+    for col in CATEGORY_COLUMNS:
+        if col not in base.columns:
+            continue
+        categories = base[col].cat.categories
+        new_categories = batch[col].cat.categories.difference(categories)
+        if len(new_categories):
+            categories = categories.append(new_categories)
+            base_updates[col] = base[col].cat.add_categories(new_categories)
+        batch[col] = batch[col].cat.set_categories(categories)
+    if base_updates:
+        base = base.assign(**base_updates)
+    return base, batch
+
+def concat_frames(base, batch):
+    return pd.concat(extend_categories(base, batch), ignore_index=True)
+
+def widen_categories(frame, dtypes):
+    # The appended rows' categories extend the base frame's, so base rows are re-coded
+    # to them before the two are concatenated
+    widened = {
+        col: dtype for col, dtype in dtypes.items()
+        if col in frame.columns and isinstance(dtype, pd.CategoricalDtype) and frame[col].dtype != dtype
+    }
+    return frame.astype(widened) if widened else frame
+
+def concat_parts(frames):
+    if len(frames) == 1:
+        return frames[0]
+    dtypes = frames[-1].dtypes
+    return pd.concat([widen_categories(frame, dtypes) for frame in frames])
+
+def extend_filter_index(index, batch):
+    # Appends the batch's rows to every bitmap, re-packing only the last partial byte
+    rows = index["rows"]
+    full_bytes, tail_bits = divmod(rows, 8)
+    extended = {"rows": rows + len(batch), "bitmaps": {}}
+    for dim, bitmaps in index["bitmaps"].items():
+        column = batch[dim].to_numpy()
+        extended["bitmaps"][dim] = {}
+        for value in set(bitmaps) | set(batch[dim].unique()):
+            bits = bitmaps.get(value)
+            if bits is None:
+                bits = np.zeros((rows + 7) // 8, dtype=np.uint8)
+            tail = np.unpackbits(bits[full_bytes:], count=tail_bits)
+            extended["bitmaps"][dim][value] = np.concatenate([
+                bits[:full_bytes], np.packbits(np.concatenate([tail, column == value]))
+            ])
+    return extended
+
+def merge_dated(total, part, keys):
+    # total and part are sorted by their first key, a date or month. Only total's cells
+    # from part's first date on can meet part's, so just those are regrouped with it
+    # and the earlier ones are kept as they are
+    split = int(total[keys[0]].searchsorted(part[keys[0]].min()))
+    tail = pd.concat([total.iloc[split:], part], ignore_index=True)
+    return pd.concat([total.iloc[:split], tail.groupby(keys, observed=True).sum().reset_index()], ignore_index=True)
+
+def append_statistics(total, part):
+    layout = total["layout"]
+    split = int(total["cells"]["Order Date"].searchsorted(part["cells"]["Order Date"].min()))
+    month_split = int(total["histogram"]["Month"].searchsorted(part["histogram"]["Month"].min()))
+    tail = merge_statistics(
+        {"layout": layout, "cells": total["cells"].iloc[split:], "histogram": total["histogram"].iloc[month_split:]}, part
+    )
+    return {
+        "layout": layout,
+        "cells": pd.concat([total["cells"].iloc[:split], tail["cells"]], ignore_index=True),
+        "histogram": pd.concat([total["histogram"].iloc[:month_split], tail["histogram"]], ignore_index=True)
+    }
+
+def append_sketches(total, part):
+    split = int(total["cells"]["Month"].searchsorted(part["cells"]["Month"].min()))
+    tail = merge_sketches([{"cells": total["cells"].iloc[split:], "registers": total["registers"][split:]}, part])
+    cells = pd.concat([total["cells"].iloc[:split], tail["cells"]], ignore_index=True)
+    return {
+        "cells": cells.astype({dim: "category" for dim in DISTINCT_DIMENSIONS[1:]}),
+        "registers": np.concatenate([total["registers"][:split], tail["registers"]])
+    }
+
+def append_batch(store, batch):
+    # Returns the number of rows appended after de-duplication. The mapped base frame is
+    # left as it is: appended rows go to a delta frame of their own, and each table
+    # is re-aggregated only from the batch's first date on, so an append costs about
+    # the batch and the days it touches rather than the whole history
+    keys = row_keys(batch)
+    _, first = np.unique(keys, return_index=True)
+    keep = np.zeros(len(batch), dtype=bool)
+    keep[first] = True
+    for known in (store["keys"], store["delta_keys"]):
+        if len(known):
+            keep &= known[np.minimum(known.searchsorted(keys), len(known) - 1)] != keys
+    batch = batch[keep]
+    if batch.empty:
+        return 0
+    if not batch["Order Date"].is_monotonic_increasing:
+        batch = batch.sort_values("Order Date", kind="stable")
+    batch = batch.reset_index(drop=True)
+
+    data, delta = store["data"], store["delta"]
+    if delta is None:
+        _, delta = extend_categories(data, batch)
+        delta_index = build_filter_index(delta)
+    elif delta.empty or batch["Order Date"].iloc[0] >= delta["Order Date"].iloc[-1]:
+        delta = concat_frames(delta, batch)
+        delta_index = extend_filter_index(store["delta_index"], batch)
+    else:
+        # A back-dated batch breaks the date ordering, so the delta (never the base) is
+        # re-sorted and its filter index rebuilt
+        delta = concat_frames(delta, batch).sort_values("Order Date", kind="stable", ignore_index=True)
+        delta_index = build_filter_index(delta)
+    # Row labels continue the base frame's, as if the two were one frame
+    delta.index = pd.RangeIndex(len(data), len(data) + len(delta))
+    new_keys = np.sort(keys[keep])
+    delta_keys = np.insert(store["delta_keys"], store["delta_keys"].searchsorted(new_keys), new_keys)
+    store.update(
+        delta=delta,
+        delta_index=delta_index,
+        delta_keys=delta_keys,
+        cube=merge_dated(store["cube"], build_cube(batch), CUBE_DIMENSIONS),
+        margin_cube=None if store["margin_cube"] is None else merge_dated(
+            store["margin_cube"], build_margin_cube(batch, store["margin_edges"]), CUBE_DIMENSIONS + ["Margin Bin"]
+        ),
+        statistics=None if store["statistics"] is None else append_statistics(
+            store["statistics"], build_statistics(batch, store["statistics"]["layout"])
+        ),
+        sketches=None if store["sketches"] is None else append_sketches(store["sketches"], build_sketches(batch)),
+        version=store["version"] + 1
+    )
+    return len(batch)
+
+def pending_batches(store):
+    if not os.path.isdir(INCOMING_DIR):
+        return []
+    applied = {(entry["file"], entry["size"], entry["mtime"]) for entry in store["batches"]}
+    settled_before = (datetime.now().timestamp() - BATCH_SETTLE_SECONDS) * 1e9
+    pending = []
+    for entry in sorted(os.scandir(INCOMING_DIR), key=lambda entry: entry.name):
+        if not entry.name.lower().endswith(".csv") or not entry.is_file():
+            continue
+        stat = entry.stat()
+        if stat.st_mtime_ns > settled_before:
+            continue
+        if (entry.name, stat.st_size, stat.st_mtime_ns) not in applied:
+            pending.append({"file": entry.name, "size": stat.st_size, "mtime": stat.st_mtime_ns})
+    return pending
+
+def refresh_batches(store):
+    # Cheap when nothing changed: one directory listing per rerun
+    pending = pending_batches(store)
+    if not pending:
+        return 0
+    with store["lock"]:
+        pending = pending_batches(store)
+        appended = 0
+        for entry in pending:
+            batch = build_frame(os.path.join(INCOMING_DIR, entry["file"]))
+            entry["rows"] = append_batch(store, batch)
+            appended += entry["rows"]
+            store["batches"].append(entry)
+            try:
+                os.makedirs(BATCH_DIR, exist_ok=True)
+                with replacing(os.path.join(BATCH_DIR, entry["file"] + ".parquet")) as tmp_path:
+                    batch.to_parquet(tmp_path, index=False)
+                write_manifest({"source": store["source"], "batches": store["batches"]}, BATCH_MANIFEST_PATH)
+            except OSError:
+                pass
+        return appended
+
+def load_store(path=DATA_PATH):
+    data = load_data(path)
+    # The snapshot holds exactly the base rows; appended ones are kept apart from them
+    snapshot = SNAPSHOT_PATH if (read_manifest() or {}).get("sha256") == data.attrs["source"] else None
+    margin_edges = np.histogram_bin_edges(finite_values(data["Profit Margin"]), bins=MARGIN_BINS) if MARGIN_BIN_CUBE else None
+    store = {
+        "lock": threading.Lock(),
+        "data": data,
+        "cube": build_cube(data),
+        "index": build_filter_index(data),
+        "margin_edges": margin_edges,
+        "margin_cube": None if margin_edges is None else build_margin_cube(data, margin_edges),
+        "statistics": snapshot_statistics(data, snapshot) if STATISTICS_CUBE else None,
+        "sketches": snapshot_sketches(data, snapshot) if DISTINCT_SKETCH else None,
+        "keys": snapshot_keys(data, snapshot),
+        "delta": None,
+        "delta_index": None,
+        "delta_keys": np.empty(0, dtype=np.uint64),
+        "source": data.attrs["source"],
+        "memory": data.attrs["memory"],
+        "snapshot": snapshot,
+        "version": 0,
+        "batches": []
+    }
+    # Replay batches parsed by an earlier process, as long as they were applied on
+    # top of the same base file. They are appended as one, in their original order,
+    # so a restart re-aggregates the appended days once rather than once per batch
+    manifest = read_manifest(BATCH_MANIFEST_PATH)
+    if manifest and manifest.get("source") == store["source"]:
+        batches = []
+        for entry in manifest["batches"]:
+            try:
+                batches.append(pd.read_parquet(os.path.join(BATCH_DIR, entry["file"] + ".parquet")))
+            except OSError:
+                break
+            store["batches"].append(entry)
+        if batches:
+            append_batch(store, apply_schema(pd.concat(batches, ignore_index=True)))
+    return store
+
+# Dense charts. Above WEBGL_POINT_THRESHOLD points traces are drawn with WebGL, line
+# series longer than LINE_POINT_BUDGET are reduced with Largest-Triangle-Three-Buckets
+# (which keeps peaks and troughs) and bubble charts are thinned on a grid to at most
+# BUBBLE_POINT_BUDGET points before anything is serialized to the browser.
+WEBGL_POINT_THRESHOLD = 1000
+LINE_POINT_BUDGET = 2000
+BUBBLE_POINT_BUDGET = 2500
+
+def lttb_indices(x, y, budget):
+    n = len(x)
+    if budget >= n or budget < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # Interior points are split into budget - 2 buckets; the first and last points are always kept
+    edges = np.floor(np.linspace(1, n - 1, budget - 1)).astype(int)
+    selected = np.empty(budget, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    anchor = 0
+    for bucket in range(budget - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+        area = np.abs(
+            (x[anchor] - next_x) * (y[start:end] - y[anchor]) -
+            (x[anchor] - x[start:end]) * (next_y - y[anchor])
+        )
+        anchor = start + int(area.argmax())
+        selected[bucket + 1] = anchor
+    return selected
+
+def downsample_series(df, x_col, y_col, budget=LINE_POINT_BUDGET):
+    if len(df) <= budget:
+        return df
+    x = df[x_col]
+    if pd.api.types.is_datetime64_any_dtype(x):
+        x = x.astype("int64")
+    return df.iloc[lttb_indices(x.to_numpy(), df[y_col].to_numpy(), budget)]
+
+def thin_points(df, x_col, y_col, size_col, budget=BUBBLE_POINT_BUDGET):
+    # Keeps the largest bubble in each cell of a grid over the plot area, so outliers
+    # and the overall shape survive while crowded points are dropped, then fills the
+    # rest of the budget with the largest bubbles left. The axes are scaled by rank,
+    # so skewed data spreads over the whole grid instead of a few cells.
+    if len(df) <= budget:
+        return df, 0
+    order = np.argsort(-df[size_col].to_numpy(dtype=float), kind="stable")
+    cells_per_axis = max(int(np.sqrt(budget)), 1)
+    cell = np.zeros(len(df), dtype=np.int64)
+    for col in (x_col, y_col):
+        ranks = np.nan_to_num(df[col].rank(method="min", pct=True).to_numpy(dtype=float))
+        cell = cell * cells_per_axis + np.clip((ranks * cells_per_axis).astype(np.int64), 0, cells_per_axis - 1)
+    # First occurrence per cell in largest-first order is the cell's largest bubble
+    _, first = np.unique(cell[order], return_index=True)
+    chosen = np.zeros(len(df), dtype=bool)
+    chosen[np.sort(first)[:budget]] = True
+    chosen[np.flatnonzero(~chosen)[:budget - int(chosen.sum())]] = True
+    keep = np.sort(order[chosen])
+    return df.iloc[keep], len(df) - len(keep)
+
+# Engine API. A view is one consistent snapshot of the loaded dataset, and select()
+# turns a sidebar-style filter into the selection every aggregate above is computed
+# from: the row accessor, the cube slice and the cache signature.
+def memory_view(store, backend=BACKEND):
+    with store["lock"]:
+        return {
+            "backend": backend,
+            "data": store["data"],
+            "delta": store["delta"],
+            "snapshot": store["snapshot"],
+            "parquet": None,
+            "cube": store["cube"],
+            "index": store["index"],
+            "delta_index": store["delta_index"],
+            "folded": None,
+            "margin_cube": store["margin_cube"],
+            "margin_edges": store["margin_edges"],
+            "statistics": store["statistics"],
+            "sketches": store["sketches"],
+            "source": f"{store['source']}+{store['version']}"
+        }
+
+def stream_view(stream_store, backend=BACKEND):
+    cube, folded, sketches, source = stream_store
+    return {
+        "backend": backend,
+        "data": None,
+        "delta": None,
+        "snapshot": None,
+        "parquet": ROW_STORE_PATH,
+        "cube": cube,
+        "index": None,
+        "delta_index": None,
+        "folded": folded,
+        "margin_cube": None,
+        "margin_edges": None,
+        "statistics": None,
+        "sketches": sketches,
+        "source": source
+    }
+
+def load(path=DATA_PATH, mode=INGEST_MODE, backend=BACKEND):
+    if mode == "stream":
+        return stream_view(load_stream_store(path), backend)
+    store = load_store(path)
+    refresh_batches(store)
+    return memory_view(store, backend)
+
+def view_is_unfiltered(cube, start_date, end_date, selections):
+    return (
+        (start_date is None or (start_date <= cube["Order Date"].min() and end_date >= cube["Order Date"].max())) and
+        all(set(cube[dim].unique()) <= set(selected) for dim, selected in selections.items())
+    )
+
+def select_rows(view, start_date, end_date, selections):
+    cube, data = view["cube"], view["data"]
+    if view["backend"] == "duckdb":
+        return SqlRows(
+            sql_source(view),
+            (start_date, end_date, selections),
+            folded_tables=view["folded"] if data is None and view_is_unfiltered(cube, start_date, end_date, selections) else None
+        )
+    if data is not None:
+        parts = []
+        for frame, index in ((data, view["index"]), (view["delta"], view["delta_index"])):
+            if frame is None:
+                continue
+            if start_date is not None:
+                start_row, stop_row = date_bounds(frame, start_date, end_date)
+            else:
+                start_row, stop_row = 0, len(frame)
+            parts.append((frame.iloc[start_row:stop_row], filter_mask(index, selections, start_row, stop_row)))
+        return FilteredRows(parts=parts)
+    return FilteredRows(
+        store=ROW_STORE_PATH,
+        filters=(start_date, end_date, selections),
+        folded_tables=view["folded"] if view_is_unfiltered(cube, start_date, end_date, selections) else None
+    )
+
+def select(view, start_date=None, end_date=None, regions=None, categories=None, segments=None):
+    # Omitted selections keep every value; omitted dates keep the whole range
+    cube = view["cube"]
+    regions = cube["Region"].unique().tolist() if regions is None else regions
+    categories = cube["Category"].unique().tolist() if categories is None else categories
+    segments = cube["Segment"].unique().tolist() if segments is None else segments
+    selections = {"Region": regions, "Category": categories, "Segment": segments}
+    rows = select_rows(view, start_date, end_date, selections)
+    margin_cube, statistics, sketches = view["margin_cube"], view["statistics"], view["sketches"]
+    sketch_view, sketch_edges = (None, []) if sketches is None else sketch_slice(sketches, cube, start_date, end_date, selections)
+    if sketch_edges and view["data"] is None:
+        # Each partly covered month would be another read of the row store, dearer
+        # than counting the selection exactly in one
+        sketch_view, sketch_edges = None, []
+    return {
+        "rows": rows,
+        "cube_view": cube_slice(cube, start_date, end_date, regions, categories, segments),
+        "margin_view": None if margin_cube is None else cube_slice(margin_cube, start_date, end_date, regions, categories, segments),
+        "margin_edges": view["margin_edges"],
+        "statistics": statistics,
+        "stats_view": None if statistics is None else cube_slice(statistics["cells"], start_date, end_date, regions, categories, segments),
+        "filters": (start_date, end_date, selections),
+        "sketches": sketches,
+        "sketch_view": sketch_view,
+        "sketch_edges": [select_rows(view, edge_start, edge_end, selections) for edge_start, edge_end in sketch_edges],
+        "signature": filter_signature(view["source"], start_date, end_date, regions, categories, segments)
+    }
+
+def kpi_summary(selection, exact=False):
+    cube_view = selection["cube_view"]
+    return {
+        "Total Sales": cube_view["Sales"].sum(),
+        "Total Profit": cube_view["Profit"].sum(),
+        "Total Orders": order_total(selection, exact),
+        "Avg. Profit Margin": cube_view["Profit Margin Sum"].sum() / cube_view["Profit Margin Count"].sum()
+    }
+
+def margin_distribution(selection):
+    if selection["margin_view"] is not None:
+        return margin_cube_histogram(selection["signature"], selection["margin_view"], tuple(selection["margin_edges"]))
+    return margin_histogram(selection["signature"], selection["rows"])
+
+@memoize_by_signature
+def describe_table(rows):
+    return rows().describe()
+
+@memoize_by_signature
+def correlation_table(rows):
+    columns = [col for col in CORRELATION_COLUMNS if col in rows.columns()]
+    return rows(columns).corr() if len(columns) > 1 else None
+
+# The explorer's statistics come from the statistics cube unless exact ones are asked
+# for, the view has no cube (streamed data) or the selection is small
+def statistics_sketched(selection, exact):
+    return not exact and selection["statistics"] is not None and selection["stats_view"]["Rows"].sum() >= STATISTICS_MIN_ROWS
+
+def describe_summary(selection, exact=False):
+    if not statistics_sketched(selection, exact):
+        return describe_table(selection["signature"], selection["rows"])
+    return statistics_summary(selection["signature"], (selection["statistics"], selection["stats_view"], selection["filters"]))[0]
+
+def correlation_summary(selection, exact=False):
+    if not statistics_sketched(selection, exact):
+        return correlation_table(selection["signature"], selection["rows"])
+    return statistics_summary(selection["signature"], (selection["statistics"], selection["stats_view"], selection["filters"]))[1]
+
+# Named aggregates for the command line, as functions of (selection, options)
+def time_series_for(granularity):
+    return lambda selection, options: time_series_table(
+        selection["signature"], daily_series(selection["signature"], selection["cube_view"]), granularity
+    )
+
+def rollup_for(*by):
+    return lambda selection, options: cube_rollup_table(selection["signature"], selection["cube_view"], by)
+
+def rows_aggregate(func):
+    return lambda selection, options: func(selection["signature"], selection["rows"])
+
+def histogram_frame(selection, options):
+    counts, edges = margin_distribution(selection)
+    return pd.DataFrame({"Bin Start": edges[:-1], "Bin End": edges[1:], "Count": counts})
+
+def ranking_frame(table_func, name):
+    def ranking(selection, options):
+        table = table_func(selection["signature"], selection["rows"])
+        top, bottom = table_ranking(selection["signature"], table, name, options["metric"])
+        return pd.concat([
+            table.iloc[top[:options["top"]]].assign(Rank="Top"),
+            table.iloc[bottom[:options["top"]]].assign(Rank="Bottom")
+        ], ignore_index=True)
+    ranking.ranked = name
+    return ranking
+
+def correlation_frame(selection, options):
+    corr = correlation_summary(selection, options["exact"])
+    return pd.DataFrame() if corr is None else corr.rename_axis("Column").reset_index()
+
+AGGREGATES = {
+    "kpis": lambda selection, options: pd.DataFrame([kpi_summary(selection, options["exact"])]),
+    **{f"{granularity.lower()}_trend": time_series_for(granularity) for granularity in TIME_GRANULARITIES},
+    "weekday": lambda selection, options: weekday_summary(selection, options["exact"]),
+    "category": rollup_for("Category"),
+    "sub_category": rollup_for("Category", "Sub-Category"),
+    "region": rollup_for("Region"),
+    "ship_mode": rollup_for("Ship Mode"),
+    "segment": lambda selection, options: segment_summary(selection, options["exact"]),
+    "product": rows_aggregate(product_table),
+    "top_products": ranking_frame(product_table, "product"),
+    "customer": rows_aggregate(customer_table),
+    "top_customers": ranking_frame(customer_table, "customer"),
+    "geo": rows_aggregate(geo_table),
+    "city": rows_aggregate(city_table),
+    "top_cities": ranking_frame(city_table, "city"),
+    "shipping": lambda selection, options: ship_performance_summary(selection, options["exact"]),
+    "profitability": rows_aggregate(profitability_table),
+    "margin_histogram": histogram_frame,
+    "describe": lambda selection, options: describe_summary(selection, options["exact"]).rename_axis("Statistic").reset_index(),
+    "correlation": correlation_frame
+}
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Compute Superstore dashboard aggregates for a filter, without Streamlit."
+    )
+    parser.add_argument("aggregates", nargs="*", metavar="AGGREGATE",
+                        help=f"Aggregates to compute (default: all). One of: {', '.join(AGGREGATES)}")
+    parser.add_argument("--data", default=DATA_PATH, help="Order CSV (default: %(default)s)")
+    parser.add_argument("--mode", choices=["memory", "stream"], default=INGEST_MODE, help="Ingestion mode (default: %(default)s)")
+    parser.add_argument("--backend", choices=["pandas", "duckdb"], default=BACKEND, help="Query backend (default: %(default)s)")
+    parser.add_argument("--start", type=pd.Timestamp, help="First order date, YYYY-MM-DD")
+    parser.add_argument("--end", type=pd.Timestamp, help="Last order date, YYYY-MM-DD")
+    parser.add_argument("--region", action="append", help="Keep this region (repeatable)")
+    parser.add_argument("--category", action="append", help="Keep this category (repeatable)")
+    parser.add_argument("--segment", action="append", help="Keep this segment (repeatable)")
+    parser.add_argument("--metric", choices=list(dict.fromkeys(itertools.chain(*RANK_METRICS.values()))), default="Sales",
+                        help="Ranking metric for the top_* aggregates (default: %(default)s)")
+    parser.add_argument("--top", type=int, default=10, help="Rows per end for the top_* aggregates (default: %(default)s)")
+    parser.add_argument("--exact", action="store_true", help="Compute statistics and distinct counts from the rows instead of the statistics cube and sketches")
+    parser.add_argument("--output", help="Write one file per aggregate to this directory instead of printing")
+    parser.add_argument("--format", choices=["csv", "json", "parquet"], default="csv", help="Output file format (default: %(default)s)")
+    parser.add_argument("--max-rows", type=int, default=20, help="Rows printed per aggregate (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    names = args.aggregates or list(AGGREGATES)
+    unknown = [name for name in names if name not in AGGREGATES]
+    if unknown:
+        parser.error(f"unknown aggregate(s): {', '.join(unknown)}")
+    for name in names:
+        ranked = getattr(AGGREGATES[name], "ranked", None)
+        if ranked is not None and args.metric not in RANK_METRICS[ranked]:
+            parser.error(f"--metric {args.metric} cannot rank {name}; use one of: {', '.join(RANK_METRICS[ranked])}")
+    if not 1 <= args.top <= RANK_DEPTH:
+        parser.error(f"--top must be between 1 and {RANK_DEPTH}")
+
+    started = time.perf_counter()
+    view = load(args.data, args.mode, args.backend)
+    loaded = time.perf_counter()
+    start_date, end_date = args.start, args.end
+    if start_date is not None or end_date is not None:
+        start_date = view["cube"]["Order Date"].min() if start_date is None else start_date
+        end_date = view["cube"]["Order Date"].max() if end_date is None else end_date
+    selection = select(view, start_date, end_date, args.region, args.category, args.segment)
+    print(f"# loaded in {loaded - started:.3f}s, filtered in {time.perf_counter() - loaded:.3f}s", file=sys.stderr)
+
+    options = {"metric": args.metric, "top": args.top, "exact": args.exact}
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+    for name in names:
+        started = time.perf_counter()
+        table = AGGREGATES[name](selection, options)
+        elapsed = time.perf_counter() - started
+        print(f"# {name}: {len(table):,} rows in {elapsed * 1000:.1f} ms", file=sys.stderr)
+        if args.output:
+            path = os.path.join(args.output, f"{name}.{args.format}")
+            if args.format == "csv":
+                table.to_csv(path, index=False)
+            elif args.format == "json":
+                table.to_json(path, orient="records", date_format="iso", indent=2)
+            else:
+                # describe mixes counts and timestamps in its date columns, which Parquet
+                # cannot store in one column, so mixed columns are written as text
+                mixed = [col for col in table.columns if table[col].dtype == object]
+                table.astype({col: str for col in mixed}).to_parquet(path, index=False)
+        else:
+            print(f"== {name}")
+            print(table.to_string(index=False, max_rows=args.max_rows))
+            print()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
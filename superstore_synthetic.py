@@ -0,0 +1,252 @@
+# Synthetic Superstore orders with the sample file's columns, formats and value
+# mix, at any size. Orders keep their lines together and dates follow the sample's
+# yearly growth and Q4 peak, so ingestion, filtering and the aggregates see data shaped
+# like the real thing. Customer and product counts grow with the row count.
+#   python superstore_synthetic.py 1M "Superstore 1M.csv"
+import numpy as np
+import pandas as pd
+import os
+import sys
+import time
+
+COLUMNS = [
+    "Row ID", "Order ID", "Order Date", "Ship Date", "Ship Mode", "Customer ID", "Customer Name",
+    "Segment", "Country", "City", "State", "Postal Code", "Region", "Product ID", "Category",
+    "Sub-Category", "Product Name", "Sales", "Quantity", "Discount", "Profit"
+]
+
+# Shares and ranges below follow the published ~10k-row sample
+REGION_STATES = {
+    "West": ["California", "Washington", "Arizona", "Colorado", "Oregon", "Utah", "Nevada",
+             "New Mexico", "Idaho", "Montana", "Wyoming"],
+    "East": ["New York", "Pennsylvania", "Ohio", "Delaware", "Massachusetts", "New Jersey",
+             "Connecticut", "Maryland", "Rhode Island", "New Hampshire", "Vermont", "Maine",
+             "West Virginia", "District of Columbia"],
+    "Central": ["Texas", "Illinois", "Michigan", "Indiana", "Wisconsin", "Minnesota", "Missouri",
+                "Oklahoma", "Nebraska", "Iowa", "Kansas", "South Dakota", "North Dakota"],
+    "South": ["Florida", "North Carolina", "Virginia", "Tennessee", "Georgia", "Kentucky",
+              "Alabama", "South Carolina", "Louisiana", "Mississippi", "Arkansas"]
+}
+REGION_SHARES = {"West": 0.32, "East": 0.28, "Central": 0.23, "South": 0.17}
+CITY_PREFIXES = ["Spring", "Lake", "Oak", "River", "Green", "Fair", "Clear", "Mill", "Maple",
+                 "Cedar", "Pine", "Red", "West", "North", "Bright", "Rock", "Stone", "Glen"]
+CITY_SUFFIXES = ["field", "wood", "ville", "ton", "port", "dale", "burg", "view", "land", "ford",
+                 "haven", "brook"]
+CITIES_PER_STATE = 12
+
+SUB_CATEGORIES = {
+    "Furniture": {"Bookcases": 228, "Chairs": 617, "Furnishings": 957, "Tables": 319},
+    "Office Supplies": {"Appliances": 466, "Art": 796, "Binders": 1523, "Envelopes": 254,
+                        "Fasteners": 217, "Labels": 364, "Paper": 1370, "Storage": 846, "Supplies": 190},
+    "Technology": {"Accessories": 775, "Copiers": 68, "Machines": 115, "Phones": 889}
+}
+# Typical list price and margin per sub-category
+SUB_CATEGORY_PRICES = {
+    "Bookcases": (170, 0.03), "Chairs": (130, 0.08), "Furnishings": (30, 0.14), "Tables": (200, -0.02),
+    "Appliances": (65, 0.17), "Art": (8, 0.25), "Binders": (15, 0.15), "Envelopes": (17, 0.42),
+    "Fasteners": (4, 0.31), "Labels": (8, 0.44), "Paper": (15, 0.43), "Storage": (60, 0.10),
+    "Supplies": (25, 0.02), "Accessories": (55, 0.22), "Copiers": (700, 0.37), "Machines": (300, 0.02),
+    "Phones": (100, 0.13)
+}
+BRANDS = ["Avery", "Acme", "Eldon", "Fellowes", "Global", "Hon", "Logitech", "Newell", "Samsung",
+          "Staples", "Tenex", "Xerox", "Bretford", "Okidata", "Wilson Jones", "Cisco"]
+SEGMENT_SHARES = {"Consumer": 0.52, "Corporate": 0.30, "Home Office": 0.18}
+SHIP_MODES = {
+    # share, shipping delay range in days
+    "Standard Class": (0.60, (4, 7)),
+    "Second Class": (0.19, (2, 5)),
+    "First Class": (0.16, (1, 4)),
+    "Same Day": (0.05, (0, 0))
+}
+DISCOUNTS = np.array([0, 0.1, 0.15, 0.2, 0.3, 0.32, 0.4, 0.45, 0.5, 0.6, 0.7, 0.8])
+DISCOUNT_SHARES = np.array([0.48, 0.01, 0.005, 0.37, 0.02, 0.0025, 0.02, 0.0025, 0.007, 0.014, 0.04, 0.03])
+FIRST_NAMES = ["Aaron", "Alan", "Anna", "Brian", "Carl", "Claire", "Dan", "Emily", "Eric", "Grace",
+               "Harry", "Helen", "Ivan", "Jane", "Karl", "Laura", "Mark", "Nora", "Paul", "Ruth",
+               "Sam", "Tara", "Victor", "Zoe"]
+LAST_NAMES = ["Adams", "Baker", "Carter", "Dunn", "Ellis", "Fisher", "Gray", "Hart", "Irwin",
+              "Jones", "Knox", "Lee", "Moore", "Nash", "Owens", "Price", "Quinn", "Reed", "Stone",
+              "Turner", "Vance", "Walsh", "Young"]
+
+# Sample ratios: ~2 lines per order, ~12.6 lines per customer, ~1,860 products at 10k lines
+LINES_PER_ORDER = 2.0
+LINES_PER_CUSTOMER = 12.6
+SAMPLE_ROWS = 9994
+SAMPLE_PRODUCTS = 1862
+DEFAULT_START = "2014-01-03"
+DEFAULT_END = "2017-12-30"
+# Orders per month relative to the yearly mean, and yearly growth
+MONTH_WEIGHTS = np.array([0.45, 0.35, 0.9, 0.8, 0.85, 0.85, 0.85, 0.8, 1.6, 0.95, 1.7, 1.7])
+YEARLY_GROWTH = 0.2
+CHUNK_ROWS = 1_000_000
+
+def parse_size(text):
+    units = {"k": 1_000, "m": 1_000_000, "b": 1_000_000_000}
+    text = str(text).strip().lower().replace("_", "").replace(",", "")
+    if text[-1:] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+def build_dimensions(rows, rng):
+    # Geography: a fixed set of cities per state, with a few large cities per state
+    geo = []
+    for region, states in REGION_STATES.items():
+        for state in states:
+            names = rng.choice(len(CITY_PREFIXES) * len(CITY_SUFFIXES), CITIES_PER_STATE, replace=False)
+            for name in names:
+                city = CITY_PREFIXES[name // len(CITY_SUFFIXES)] + CITY_SUFFIXES[name % len(CITY_SUFFIXES)]
+                geo.append((region, state, city, int(rng.integers(1000, 99951))))
+    geo = pd.DataFrame(geo, columns=["Region", "State", "City", "Postal Code"])
+    city_size = pd.Series(rng.zipf(1.6, len(geo)).clip(max=200), dtype=float)
+    geo["Weight"] = geo["Region"].map(REGION_SHARES) * city_size / city_size.groupby(geo["Region"]).transform("sum")
+
+    customer_count = max(int(rows / LINES_PER_CUSTOMER), 50)
+    first = rng.integers(0, len(FIRST_NAMES), customer_count)
+    last = rng.integers(0, len(LAST_NAMES), customer_count)
+    customers = pd.DataFrame({
+        "Customer ID": [
+            f"{FIRST_NAMES[f][0]}{LAST_NAMES[l][0]}-{10000 + i}" for i, (f, l) in enumerate(zip(first, last))
+        ],
+        "Customer Name": [f"{FIRST_NAMES[f]} {LAST_NAMES[l]}" for f, l in zip(first, last)],
+        "Segment": rng.choice(list(SEGMENT_SHARES), customer_count, p=list(SEGMENT_SHARES.values()))
+    })
+
+    # The catalogue grows with the square root of the order volume
+    product_count = max(int(SAMPLE_PRODUCTS * np.sqrt(rows / SAMPLE_ROWS)), 50)
+    subs = [(category, sub, count) for category, counts in SUB_CATEGORIES.items() for sub, count in counts.items()]
+    sub_weights = np.array([count for _, _, count in subs], dtype=float)
+    picks = rng.choice(len(subs), product_count, p=sub_weights / sub_weights.sum())
+    brands = rng.integers(0, len(BRANDS), product_count)
+    products = pd.DataFrame({
+        "Category": [subs[pick][0] for pick in picks],
+        "Sub-Category": [subs[pick][1] for pick in picks],
+        "Product ID": [
+            f"{subs[pick][0][:3].upper()}-{subs[pick][1][:2].upper()}-{10000000 + i}" for i, pick in enumerate(picks)
+        ],
+        "Product Name": [
+            f"{BRANDS[brand]} {subs[pick][1]} {i + 100}" for i, (brand, pick) in enumerate(zip(brands, picks))
+        ],
+        "Price": np.array([SUB_CATEGORY_PRICES[subs[pick][1]][0] for pick in picks]) * rng.lognormal(0, 0.6, product_count),
+        "Margin": np.array([SUB_CATEGORY_PRICES[subs[pick][1]][1] for pick in picks]) + rng.normal(0, 0.05, product_count)
+    })
+    # A long tail: a few products sell far more often than most
+    product_weight = rng.pareto(1.5, product_count) + 1
+    products["Weight"] = product_weight / product_weight.sum()
+    return geo, customers, products
+
+def order_day_weights(days):
+    years = (days - days[0]).days.to_numpy() / 365.25
+    weights = MONTH_WEIGHTS[days.month.to_numpy() - 1] * (1 + YEARLY_GROWTH) ** years
+    return weights / weights.sum()
+
+def generate_chunk(rng, rows, first_row, first_order, days, day_weights, date_labels, geo, customers, products):
+    # Whole orders of 1-14 lines, trimmed at the end to exactly `rows` lines
+    lines = np.minimum(rng.geometric(1 / LINES_PER_ORDER, rows), 14)
+    orders = int(np.searchsorted(np.cumsum(lines), rows)) + 1
+    lines = lines[:orders]
+    lines[-1] -= lines.sum() - rows
+
+    day = rng.choice(len(days), orders, p=day_weights)
+    ship_mode = rng.choice(list(SHIP_MODES), orders, p=[share for share, _ in SHIP_MODES.values()])
+    low = np.array([SHIP_MODES[mode][1][0] for mode in ship_mode])
+    high = np.array([SHIP_MODES[mode][1][1] for mode in ship_mode])
+    ship_day = np.minimum(day + rng.integers(low, high + 1), len(date_labels) - 1)
+    customer = rng.integers(0, len(customers), orders)
+    city = rng.choice(len(geo), orders, p=geo["Weight"].to_numpy())
+    order_year = days.year.to_numpy()[day]
+    prefix = np.where(rng.random(orders) < 0.8, "CA", "US")
+    order_id = [
+        f"{p}-{year}-{100000 + first_order + i}" for i, (p, year) in enumerate(zip(prefix, order_year))
+    ]
+
+    # Order attributes repeated per line, product attributes drawn per line
+    per_line = np.repeat(np.arange(orders), lines)
+    product = rng.choice(len(products), rows, p=products["Weight"].to_numpy())
+    quantity = np.minimum(rng.geometric(0.33, rows) + 1, 14)
+    discount = rng.choice(DISCOUNTS, rows, p=DISCOUNT_SHARES / DISCOUNT_SHARES.sum())
+    price = products["Price"].to_numpy()[product]
+    sales = np.round(price * quantity * (1 - discount), 4)
+    # Margins fall steeply with the discount and deep discounts sell at a loss, as in the sample
+    margin = (
+        products["Margin"].to_numpy()[product] + 0.2 - 1.2 * discount - 1.2 * discount * (discount > 0.5) +
+        rng.normal(0, 0.08, rows)
+    )
+    profit = np.round(sales * margin, 4)
+
+    geo_rows = geo.iloc[city[per_line]]
+    customer_rows = customers.iloc[customer[per_line]]
+    product_rows = products.iloc[product]
+    return pd.DataFrame({
+        "Row ID": np.arange(first_row + 1, first_row + rows + 1),
+        "Order ID": np.asarray(order_id)[per_line],
+        "Order Date": date_labels[day[per_line]],
+        "Ship Date": date_labels[ship_day[per_line]],
+        "Ship Mode": ship_mode[per_line],
+        "Customer ID": customer_rows["Customer ID"].to_numpy(),
+        "Customer Name": customer_rows["Customer Name"].to_numpy(),
+        "Segment": customer_rows["Segment"].to_numpy(),
+        "Country": "United States",
+        "City": geo_rows["City"].to_numpy(),
+        "State": geo_rows["State"].to_numpy(),
+        "Postal Code": geo_rows["Postal Code"].to_numpy(),
+        "Region": geo_rows["Region"].to_numpy(),
+        "Product ID": product_rows["Product ID"].to_numpy(),
+        "Category": product_rows["Category"].to_numpy(),
+        "Sub-Category": product_rows["Sub-Category"].to_numpy(),
+        "Product Name": product_rows["Product Name"].to_numpy(),
+        "Sales": sales,
+        "Quantity": quantity,
+        "Discount": discount,
+        "Profit": profit
+    }, columns=COLUMNS), orders
+
+def generate(path, rows, seed=0, start=DEFAULT_START, end=DEFAULT_END, chunk_rows=CHUNK_ROWS):
+    # Written chunk by chunk, so memory stays flat whatever the size; the same seed
+    # and size always give the same file
+    seeds = np.random.SeedSequence(seed)
+    dimension_seed, chunk_seed = seeds.spawn(2)
+    geo, customers, products = build_dimensions(rows, np.random.default_rng(dimension_seed))
+    days = pd.date_range(start, end, freq="D")
+    day_weights = order_day_weights(days)
+    # Ship dates may run past the order window
+    date_labels = np.asarray(
+        [f"{day.month}/{day.day}/{day.year}" for day in pd.date_range(start, days[-1] + pd.Timedelta(days=7), freq="D")]
+    )
+
+    tmp_path = path + ".tmp"
+    written = orders = 0
+    with open(tmp_path, "w", encoding="latin-1", newline="") as fh:
+        for number, chunk_rng in enumerate(map(np.random.default_rng, chunk_seed.spawn(-(-rows // chunk_rows)))):
+            size = min(chunk_rows, rows - written)
+            chunk, chunk_orders = generate_chunk(
+                chunk_rng, size, written, orders, days, day_weights, date_labels, geo, customers, products
+            )
+            chunk.to_csv(fh, index=False, header=number == 0)
+            written += size
+            orders += chunk_orders
+    os.replace(tmp_path, path)
+    return {"rows": written, "orders": orders, "customers": len(customers), "products": len(products)}
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic Superstore order file.")
+    parser.add_argument("rows", help="Number of order lines, e.g. 10k, 1M, 100M")
+    parser.add_argument("path", nargs="?", help="Output CSV (default: 'Superstore <rows>.csv')")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: %(default)s)")
+    parser.add_argument("--start", default=DEFAULT_START, help="First order date (default: %(default)s)")
+    parser.add_argument("--end", default=DEFAULT_END, help="Last order date (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    rows = parse_size(args.rows)
+    path = args.path or f"Superstore {args.rows}.csv"
+    started = time.perf_counter()
+    summary = generate(path, rows, seed=args.seed, start=args.start, end=args.end)
+    print(
+        f"Wrote {summary['rows']:,} lines, {summary['orders']:,} orders, {summary['customers']:,} customers "
+        f"and {summary['products']:,} products to {path} in {time.perf_counter() - started:.1f}s",
+        file=sys.stderr
+    )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,432 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Keep snapshots written by the tests out of the working tree's cache
+os.environ.setdefault("SUPERSTORE_CACHE_DIR", tempfile.mkdtemp(prefix="superstore_test_cache_"))
+# Small chunks, so streamed ingest folds several of them
+os.environ.setdefault("SUPERSTORE_CHUNK_ROWS", "500")
+# Sketch the small test file too, so the sketched counts can be checked
+os.environ.setdefault("SUPERSTORE_SKETCH_ROWS", "0")
+
+import superstore_engine as engine
+from superstore_synthetic import generate
+
+
+def lognormal_cloud(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "x": rng.lognormal(0, 2, rows),
+        "y": rng.lognormal(0, 2, rows) - 1,
+        "size": rng.lognormal(0, 1, rows),
+    })
+
+
+def test_thin_points_fills_budget_on_skewed_data():
+    df = lognormal_cloud(3000)
+    kept, dropped = engine.thin_points(df, "x", "y", "size", budget=2500)
+    assert len(kept) == 2500
+    assert dropped == 500
+    assert kept.index.is_unique and kept.index.is_monotonic_increasing
+    assert kept["size"].max() == df["size"].max()
+
+
+def test_thin_points_keeps_everything_under_budget():
+    df = lognormal_cloud(100)
+    kept, dropped = engine.thin_points(df, "x", "y", "size", budget=2500)
+    assert len(kept) == 100
+    assert dropped == 0
+
+
+# Every aggregate, computed through each ingest mode and backend, against the same
+# aggregate computed directly from the order lines with pandas
+MODES = [("memory", "pandas"), ("memory", "duckdb"), ("stream", "pandas"), ("stream", "duckdb")]
+
+
+@pytest.fixture(scope="module")
+def orders(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("data") / "orders.csv")
+    generate(path, 3000, seed=1)
+    return path, engine.build_frame(path)
+
+
+def filter_cases(frame):
+    first, last = frame["Order Date"].min(), frame["Order Date"].max()
+    return {
+        "all": {},
+        "filtered": {
+            "start_date": (first + (last - first) / 4).normalize(),
+            "end_date": (first + (last - first) * 3 / 4).normalize(),
+            "regions": ["West", "East", "South"],
+            "categories": ["Technology", "Furniture"]
+        }
+    }
+
+
+def filtered_rows(frame, start_date=None, end_date=None, regions=None, categories=None, segments=None):
+    mask = np.ones(len(frame), dtype=bool)
+    if start_date is not None:
+        mask &= (frame["Order Date"] >= start_date) & (frame["Order Date"] <= end_date)
+    for dim, selected in (("Region", regions), ("Category", categories), ("Segment", segments)):
+        if selected is not None:
+            mask &= frame[dim].isin(selected)
+    return frame[mask]
+
+
+def grouped(df, keys, aggregations):
+    return df.groupby(keys, observed=True).agg(**aggregations).reset_index()
+
+
+def rollup(df, *by):
+    table = grouped(df, list(by), {
+        "Sales": ("Sales", "sum"),
+        "Profit": ("Profit", "sum"),
+        "Quantity": ("Quantity", "sum"),
+        "Rows": ("Sales", "size"),
+        "Profit Margin Sum": ("Profit Margin", "sum"),
+        "Profit Margin Count": ("Profit Margin", "count"),
+        "Processing Time Sum": ("Processing Time", "sum")
+    })
+    table["Profit Margin"] = table["Profit Margin Sum"] / table["Profit Margin Count"]
+    table["Processing Time"] = table["Processing Time Sum"] / table["Rows"]
+    return table
+
+
+def trend(df, period, x_col):
+    dates = df["Order Date"].dt.normalize()
+    keys = dates if period is None else dates.dt.to_period(period).dt.start_time
+    return df.groupby(keys.rename(x_col))[["Sales", "Profit"]].sum().reset_index()
+
+
+def expected_tables(df):
+    sums = {"Sales": ("Sales", "sum"), "Profit": ("Profit", "sum")}
+    orders = {"Order ID": ("Order ID", "nunique")}
+    weekday = df.assign(**{"Day of Week": pd.Categorical(
+        df["Order Date"].dt.day_name(), categories=engine.WEEKDAY_ORDER, ordered=True
+    )}).groupby("Day of Week", observed=False).agg(**sums, **orders).reset_index()
+    segment = rollup(df, "Segment")[["Segment", "Sales", "Profit"]].merge(
+        grouped(df, ["Segment"], {"Customer ID": ("Customer ID", "nunique"), **orders}), on="Segment"
+    )
+    segment["Avg. Order Value"] = segment["Sales"] / segment["Order ID"]
+    segment["Profit per Customer"] = segment["Profit"] / segment["Customer ID"]
+    customer = grouped(df, ["Customer ID", "Customer Name"], {
+        **sums, **orders, "Profit Margin": ("Profit Margin", "mean")
+    })
+    customer["Avg. Order Value"] = customer["Sales"] / customer["Order ID"]
+    profitability = grouped(df, ["Product Name"], {
+        **sums, "Profit Margin": ("Profit Margin", "mean"), "Quantity": ("Quantity", "sum")
+    })
+    profitability["Profit per Unit"] = profitability["Profit"] / profitability["Quantity"]
+    counts, edges = np.histogram(engine.finite_values(df["Profit Margin"]), bins=engine.MARGIN_BINS)
+    margins = df["Profit Margin"]
+    return {
+        "kpis": pd.DataFrame([{
+            "Total Sales": df["Sales"].sum(),
+            "Total Profit": df["Profit"].sum(),
+            "Total Orders": df["Order ID"].nunique(),
+            "Avg. Profit Margin": margins.sum() / margins.count()
+        }]),
+        **{
+            f"{granularity.lower()}_trend": trend(df, period, x_col)
+            for granularity, (period, x_col) in engine.TIME_GRANULARITIES.items()
+        },
+        "weekday": weekday,
+        "category": rollup(df, "Category"),
+        "sub_category": rollup(df, "Category", "Sub-Category"),
+        "region": rollup(df, "Region"),
+        "ship_mode": rollup(df, "Ship Mode"),
+        "segment": segment,
+        "product": grouped(df, ["Product Name"], {**sums, "Quantity": ("Quantity", "sum"), **orders}),
+        "customer": customer,
+        "geo": grouped(df, ["Region", "State"], {**sums, **orders}),
+        "city": grouped(df, ["Region", "State", "City"], {**sums, **orders}),
+        "shipping": grouped(df, ["Ship Mode"], {**sums, **orders, "Profit Margin": ("Profit Margin", "mean")}),
+        "profitability": profitability,
+        "margin_histogram": pd.DataFrame({"Bin Start": edges[:-1], "Bin End": edges[1:], "Count": counts}),
+        "describe": df.describe().rename_axis("Statistic").reset_index(),
+        "correlation": df[engine.CORRELATION_COLUMNS].corr().rename_axis("Column").reset_index()
+    }
+
+
+def key_columns(table):
+    return [col for col in table.columns if not pd.api.types.is_numeric_dtype(table[col])]
+
+
+def assert_same_table(actual, expected, name):
+    assert list(actual.columns) == list(expected.columns), name
+    assert len(actual) == len(expected), name
+    keys = key_columns(expected) or list(expected.columns[:1])
+    # Key columns may be categorical, text or timestamps depending on the backend
+    actual = actual.astype({col: str for col in keys}).sort_values(keys, ignore_index=True)
+    expected = expected.astype({col: str for col in keys}).sort_values(keys, ignore_index=True)
+    for col in expected.columns:
+        if col in keys:
+            assert actual[col].tolist() == expected[col].tolist(), (name, col)
+        else:
+            np.testing.assert_allclose(
+                actual[col].to_numpy(dtype=float), expected[col].to_numpy(dtype=float),
+                rtol=1e-9, atol=1e-9, err_msg=f"{name}: {col}"
+            )
+
+
+def assert_same_ranking(actual, table, metric, top, name):
+    # Ties may be broken differently, so the ranked values are compared, and every
+    # ranked row must be a row of the full table
+    for end, descending in (("Top", True), ("Bottom", False)):
+        ranked = actual[actual["Rank"] == end].drop(columns="Rank")
+        values = table[metric].sort_values(ascending=not descending).to_numpy()[:top]
+        np.testing.assert_allclose(ranked[metric].to_numpy(dtype=float), values, rtol=1e-9, err_msg=name)
+        keys = key_columns(table)
+        matched = ranked.astype({col: str for col in keys}).merge(
+            table.astype({col: str for col in keys}), on=keys, suffixes=("", " expected")
+        )
+        assert len(matched) == len(ranked), name
+        for col in table.columns.difference(keys):
+            np.testing.assert_allclose(matched[col].to_numpy(dtype=float), matched[f"{col} expected"].to_numpy(dtype=float), rtol=1e-9)
+
+
+@pytest.mark.parametrize("case", ["all", "filtered"])
+@pytest.mark.parametrize("mode, backend", MODES)
+def test_aggregates_match_pandas(orders, mode, backend, case):
+    if backend == "duckdb":
+        pytest.importorskip("duckdb")
+    path, frame = orders
+    filters = filter_cases(frame)[case]
+    engine.clear_aggregate_caches()
+    selection = engine.select(engine.load(path, mode, backend), **filters)
+    expected = expected_tables(filtered_rows(frame, **filters))
+    options = {"metric": "Sales", "top": 5, "exact": True}
+    for name, aggregate in engine.AGGREGATES.items():
+        actual = aggregate(selection, options)
+        ranked = getattr(aggregate, "ranked", None)
+        if ranked is None:
+            assert_same_table(actual, expected[name], name)
+        else:
+            assert_same_ranking(actual, expected[ranked], options["metric"], options["top"], name)
+
+
+def test_cli_writes_every_aggregate_as_parquet(orders, tmp_path):
+    path, _ = orders
+    assert engine.main(["--data", path, "--output", str(tmp_path), "--format", "parquet"]) == 0
+    for name in engine.AGGREGATES:
+        assert os.path.exists(tmp_path / f"{name}.parquet"), name
+    assert len(pd.read_parquet(tmp_path / "describe.parquet")) == 8
+
+
+def test_cli_rejects_unknown_metric(orders):
+    path, _ = orders
+    with pytest.raises(SystemExit):
+        engine.main(["--data", path, "--metric", "Discount"])
+    with pytest.raises(SystemExit):
+        engine.main(["--data", path, "top_cities", "--metric", "Quantity"])
+
+
+def test_stream_ingest_drops_folded_tables_when_orders_are_split(orders, tmp_path):
+    path, frame = orders
+    assert engine.load(path, "stream", "pandas")["folded"] is not None
+    shuffled = str(tmp_path / "shuffled.csv")
+    pd.read_csv(path, encoding="latin-1").sample(frac=1, random_state=0).to_csv(shuffled, index=False, encoding="latin-1")
+    engine.clear_aggregate_caches()
+    view = engine.load(shuffled, "stream", "pandas")
+    assert view["folded"] is None
+    assert engine.load(shuffled, "stream", "pandas")["folded"] is None
+    selection = engine.select(view)
+    expected = expected_tables(frame)
+    for name in ["kpis", "weekday", "product", "customer", "segment", "shipping"]:
+        assert_same_table(engine.AGGREGATES[name](selection, {"exact": True}), expected[name], name)
+
+
+def sketch_cases(frame):
+    first, last = frame["Order Date"].min(), frame["Order Date"].max()
+    return {
+        **filter_cases(frame),
+        # Whole months, which a streamed view also answers from the sketches
+        "months": {
+            "start_date": (first + (last - first) / 4).to_period("M").start_time,
+            "end_date": (first + (last - first) * 3 / 4).to_period("M").end_time.normalize(),
+            "regions": ["West", "East"],
+            "segments": ["Consumer", "Corporate"]
+        }
+    }
+
+
+@pytest.mark.parametrize("case", ["all", "filtered", "months"])
+@pytest.mark.parametrize("mode, backend", MODES)
+def test_sketched_counts_within_bound(orders, mode, backend, case):
+    if backend == "duckdb":
+        pytest.importorskip("duckdb")
+    path, frame = orders
+    filters = sketch_cases(frame)[case]
+    engine.clear_aggregate_caches()
+    selection = engine.select(engine.load(path, mode, backend), **filters)
+    # A streamed view counts exactly from its folded tables when unfiltered, and from
+    # the rows when the date range cuts through a month
+    assert engine.distinct_sketched(selection, False) == (mode == "memory" or case == "months")
+    expected = expected_tables(filtered_rows(frame, **filters))
+    # Three standard errors of the estimate, the bound documented with the sketches
+    bound = 3 * 1.04 / np.sqrt(2 ** engine.DISTINCT_PRECISION)
+    counted = ["Order ID", "Customer ID", "Avg. Order Value", "Profit per Customer"]
+    total = engine.order_total(selection)
+    assert abs(total - expected["kpis"]["Total Orders"].iloc[0]) <= bound * expected["kpis"]["Total Orders"].iloc[0]
+    for name, aggregate in (
+        ("weekday", engine.weekday_summary), ("segment", engine.segment_summary), ("shipping", engine.ship_performance_summary)
+    ):
+        actual, wanted = aggregate(selection), expected[name]
+        assert_same_table(actual.drop(columns=counted, errors="ignore"), wanted.drop(columns=counted, errors="ignore"), name)
+        keys = key_columns(wanted)
+        actual = actual.astype({col: str for col in keys}).sort_values(keys, ignore_index=True)
+        wanted = wanted.astype({col: str for col in keys}).sort_values(keys, ignore_index=True)
+        for col in wanted.columns.intersection(counted):
+            np.testing.assert_allclose(
+                actual[col].to_numpy(dtype=float), wanted[col].to_numpy(dtype=float), rtol=bound, err_msg=f"{name}: {col}"
+            )
+
+
+def statistic_numbers(column):
+    # Dates as nanoseconds, like the statistics cube keeps them
+    return np.array([value.value if isinstance(value, pd.Timestamp) else float(value) for value in column])
+
+
+@pytest.mark.parametrize("backend", ["pandas", "duckdb"])
+def test_statistics_cube_matches_describe(orders, backend):
+    if backend == "duckdb":
+        pytest.importorskip("duckdb")
+    path, frame = orders
+    first, last = frame["Order Date"].min(), frame["Order Date"].max()
+    # A range that starts and ends mid-month, so the edge months' histograms are weighted
+    filters = {"start_date": (first + pd.Timedelta(days=45)).normalize(), "end_date": (last - pd.Timedelta(days=45)).normalize()}
+    df = filtered_rows(frame, **filters)
+    assert len(df) >= engine.STATISTICS_MIN_ROWS
+    engine.clear_aggregate_caches()
+    selection = engine.select(engine.load(path, "memory", backend), **filters)
+    assert engine.statistics_sketched(selection, False)
+    layout = selection["statistics"]["layout"]
+
+    actual, expected = engine.describe_summary(selection), df.describe()
+    assert list(actual.columns) == list(expected.columns)
+    assert list(actual.index) == list(expected.index)
+    moments = ["count", "mean", "std", "min", "max"]
+    quartiles = [f"{quantile:.0%}" for quantile in engine.STATISTICS_QUANTILES]
+    for col in expected.columns:
+        np.testing.assert_allclose(
+            statistic_numbers(actual.loc[moments, col]), statistic_numbers(expected.loc[moments, col]), rtol=1e-9, err_msg=col
+        )
+        # Interpolating inside a bin keeps a quantile within that bin
+        bins = layout["bins"][col]
+        actual_bins = engine.statistic_bins(statistic_numbers(actual.loc[quartiles, col]), bins)
+        expected_bins = engine.statistic_bins(statistic_numbers(expected.loc[quartiles, col]), bins)
+        assert np.abs(actual_bins - expected_bins).max() <= 1, col
+
+    actual, expected = engine.correlation_summary(selection), df[layout["corr"]].corr()
+    assert list(actual.columns) == list(expected.columns)
+    np.testing.assert_allclose(actual.to_numpy(), expected.to_numpy(), rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize("mode", ["memory", "stream"])
+def test_parallel_aggregate_matches_serial(orders, monkeypatch, mode):
+    path, frame = orders
+    # Filtered, so a streamed view aggregates rows rather than its folded tables
+    selection = engine.select(engine.load(path, mode, "pandas"), **filter_cases(frame)["filtered"])
+    names = ["product", "customer", "city"]
+    options = {"metric": "Sales", "top": 5, "exact": True}
+    engine.clear_aggregate_caches()
+    serial = {name: engine.AGGREGATES[name](selection, options) for name in names}
+
+    calls = []
+    parallel_aggregate = engine.parallel_aggregate
+
+    def counted(frame, keys, spec):
+        table = parallel_aggregate(frame, keys, spec)
+        calls.append(table is not None)
+        return table
+
+    monkeypatch.setattr(engine, "parallel_aggregate", counted)
+    monkeypatch.setattr(engine, "PARALLEL_ROW_THRESHOLD", 1)
+    monkeypatch.setattr(engine, "PARALLEL_WORKERS", 3)
+    monkeypatch.setitem(engine.PARALLEL_POOL, "executor", None)
+    engine.clear_aggregate_caches()
+    try:
+        for name in names:
+            pd.testing.assert_frame_equal(engine.AGGREGATES[name](selection, options), serial[name], check_exact=True, obj=name)
+    finally:
+        if engine.PARALLEL_POOL["executor"] is not None:
+            engine.PARALLEL_POOL["executor"].shutdown()
+        engine.clear_aggregate_caches()
+    assert calls and all(calls)
+
+
+def sorted_cells(table, keys):
+    return table.astype({col: str for col in keys}).sort_values(keys, ignore_index=True)
+
+
+@pytest.mark.parametrize("backend", ["pandas", "duckdb"])
+def test_appended_batches_match_a_fresh_load(orders, tmp_path, monkeypatch, backend):
+    if backend == "duckdb":
+        pytest.importorskip("duckdb")
+    path, frame = orders
+    raw = pd.read_csv(path, encoding="latin-1")
+    # The latest fifth of the orders comes in order after the base, the rest of what
+    # the base lacks comes back-dated; both batches repeat rows already loaded
+    late = frame["Row ID"].iloc[len(frame) * 4 // 5:]
+    early = raw[~raw["Row ID"].isin(late)]
+    base = early.sample(frac=0.7, random_state=0)
+    backdated = early.drop(base.index)
+    in_order = pd.concat([raw[raw["Row ID"].isin(late)], base.head(20)])
+    backdated = pd.concat([backdated, in_order.head(20), backdated.head(5)])
+    incoming = tmp_path / "incoming"
+    incoming.mkdir()
+    base_path = str(tmp_path / "base.csv")
+    base.to_csv(base_path, index=False, encoding="latin-1")
+    in_order.to_csv(incoming / "a.csv", index=False, encoding="latin-1")
+    backdated.to_csv(incoming / "b.csv", index=False, encoding="latin-1")
+    monkeypatch.setattr(engine, "INCOMING_DIR", str(incoming))
+    monkeypatch.setattr(engine, "BATCH_DIR", str(tmp_path / "batches"))
+    monkeypatch.setattr(engine, "BATCH_MANIFEST_PATH", str(tmp_path / "batches" / "manifest.json"))
+    monkeypatch.setattr(engine, "BATCH_SETTLE_SECONDS", -60)
+
+    store = engine.load_store(base_path)
+    data = store["data"]
+    assert engine.refresh_batches(store) == len(frame) - len(base)
+    assert store["data"] is data
+    # A restart replays the saved batches on top of the same base
+    replayed = engine.load_store(base_path)
+    assert [entry["file"] for entry in replayed["batches"]] == ["a.csv", "b.csv"]
+
+    filters = filter_cases(frame)["filtered"]
+    expected = expected_tables(filtered_rows(frame, **filters))
+    statistics = engine.build_statistics(frame, store["statistics"]["layout"])
+    sketches = engine.build_sketches(frame)
+    options = {"metric": "Sales", "top": 5, "exact": True}
+    for appended in (store, replayed):
+        engine.clear_aggregate_caches()
+        selection = engine.select(engine.memory_view(appended, backend), **filters)
+        for name, aggregate in engine.AGGREGATES.items():
+            actual = aggregate(selection, options)
+            ranked = getattr(aggregate, "ranked", None)
+            if ranked is None:
+                assert_same_table(actual, expected[name], name)
+            else:
+                assert_same_ranking(actual, expected[ranked], options["metric"], options["top"], name)
+
+        keys = engine.STATISTICS_DIMENSIONS
+        pd.testing.assert_frame_equal(
+            sorted_cells(appended["statistics"]["cells"], keys), sorted_cells(statistics["cells"], keys), check_exact=False
+        )
+        keys = ["Month"] + engine.FILTER_DIMENSIONS + ["Column", "Bin"]
+        pd.testing.assert_frame_equal(
+            sorted_cells(appended["statistics"]["histogram"], keys), sorted_cells(statistics["histogram"], keys)
+        )
+        # Appends regroup only the dates they touch, so the tables stay in date order
+        assert appended["cube"]["Order Date"].is_monotonic_increasing
+        assert appended["statistics"]["histogram"]["Month"].is_monotonic_increasing
+        assert appended["sketches"]["cells"]["Month"].is_monotonic_increasing
+        keys = engine.DISTINCT_DIMENSIONS
+        actual_order = np.lexsort([appended["sketches"]["cells"][col].astype(str) for col in reversed(keys)])
+        expected_order = np.lexsort([sketches["cells"][col].astype(str) for col in reversed(keys)])
+        pd.testing.assert_frame_equal(
+            sorted_cells(appended["sketches"]["cells"], keys), sorted_cells(sketches["cells"], keys)
+        )
+        np.testing.assert_array_equal(appended["sketches"]["registers"][actual_order], sketches["registers"][expected_order])